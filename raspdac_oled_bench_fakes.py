@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Services de substitution pour les mesures hors Raspdac (MPD, lircd, amixer, ip)
+# Fichier : raspdac_oled_bench_fakes.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par les scripts de mesure raspdac_oled_bench_*.py
+# ----------------------------------------------------------------------------
+"""Services factices pour faire tourner la boucle principale sans Raspdac.
+
+-> FakeMpdServer : serveur TCP parlant le protocole MPD, qui rejoue des
+   scénarios de lecture (titre PCM, web radio, DSD) et sert une file
+   d'attente et une bibliothèque synthétiques de la taille voulue, ainsi
+   que des pochettes ('readpicture', 'albumart') ;
+-> FakeLircd : socket UNIX qui envoie des touches au format lircd ;
+-> FakeMpdFifo : tube nommé alimenté comme la sortie 'fifo' de MPD (une
+   sinusoïde par voie, au rythme de la lecture) ;
+-> install_fake_commands : écrit des exécutables 'amixer' et 'ip' factices
+   dans un répertoire à placer en tête du PATH.
+"""
+import math
+import os
+import select
+import shlex
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from array import array
+
+# ----------------------------------------------------------------------------
+# Scénarios de lecture : réponses 'status' et 'currentsong' (hors champs dynamiques)
+SCENARIOS = {
+    'track' : (
+        { 'volume' : '42', 'state' : 'play', 'song' : '3', 'songid' : '4', 'nextsong' : '4', 'nextsongid' : '5',
+          'duration' : '245.000', 'bitrate' : '1411', 'audio' : '44100:16:2', 'playlist' : '7', 'playlistlength' : '12' },
+        { 'file' : 'Mozart/Requiem/03 - Lacrimosa.flac', 'Artist' : 'Wolfgang Amadeus Mozart',
+          'Album' : 'Requiem in D minor, K. 626 (Karajan, Berliner Philharmoniker, 1975)',
+          'Title' : 'Lacrimosa dies illa, qua resurget ex favilla judicandus homo reus', 'Track' : '3',
+          'Time' : '245', 'duration' : '245.000', 'Pos' : '3', 'Id' : '4' } ),
+    'webradio' : (
+        { 'volume' : '35', 'state' : 'play', 'song' : '0', 'songid' : '1', 'bitrate' : '128',
+          'audio' : '44100:24:2', 'playlist' : '8', 'playlistlength' : '1' },
+        { 'file' : 'http://icecast.radiofrance.fr/fipjazz-hifi.aac', 'Name' : 'FIP Jazz',
+          'Title' : 'Miles Davis - So What (Kind of Blue, 1959)', 'Pos' : '0', 'Id' : '1' } ),
+    'dsd' : (
+        { 'volume' : '50', 'state' : 'play', 'song' : '0', 'songid' : '1', 'duration' : '412.000',
+          'bitrate' : '11290', 'audio' : 'dsd256:2', 'playlist' : '9', 'playlistlength' : '9' },
+        { 'file' : 'DSD/Bach/01.dsf', 'Artist' : '坂本龍一', 'Album' : '音楽図鑑 (Ongaku Zukan)',
+          'Title' : '羽の林で', 'Time' : '412', 'duration' : '412.000', 'Pos' : '0', 'Id' : '1' } ),
+    }
+
+
+def _format(fields):
+    return ''.join('{}: {}\n'.format(key, value) for key, value in fields.items())
+
+
+class FakeMpdServer():
+    """Serveur MPD factice rejouant une suite de scénarios.
+
+    Chaque scénario dure ``period`` secondes ; le temps écoulé du titre avance
+    avec l'horloge. Les commandes sont traitées par les méthodes ``cmd_<nom>``,
+    que l'on peut compléter par dérivation.
+    """
+    version = '0.23.5'
+
+    def __init__(self, scenarios=('track', 'webradio', 'dsd'), period=10.0, host='127.0.0.1', port=0, queue_length=None,
+                 library_size=1000, pictures=None):
+        self.scenarios = list(scenarios)
+        self.period = period
+        self.queue_length = queue_length    # longueur de la file d'attente (à défaut, celle du scénario)
+        self.library_size = library_size    # nombre de titres de la bibliothèque
+        self.db_update = 1556000000         # date de mise à jour de la bibliothèque ('stats')
+        self.library = None                 # réponse à 'list title group track group album group artist' (construite au 1er appel)
+        self.pictures = pictures or dict()  # fichier -> image intégrée (octets JPEG, PNG...)
+        self.binary_limit = 8192            # taille des morceaux d'image ('binarylimit')
+        self.start = time.monotonic()
+        self.requests = 0
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write('OK MPD {}\n'.format(fake.version).encode('utf-8'))
+                for raw in self.rfile:
+                    line = raw.decode('utf-8', errors='replace').strip()
+                    if not line:
+                        continue
+                    if line == 'close':
+                        return
+                    fake.requests += 1
+                    if line.startswith('idle'):
+                        self.wfile.write(fake.idle(self.connection, self.rfile))
+                    else:
+                        self.wfile.write(fake.answer(line))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def current(self):
+        elapsed = time.monotonic() - self.start
+        index = int(elapsed // self.period) % len(self.scenarios)
+        status, song = SCENARIOS[self.scenarios[index]]
+        return status, song, elapsed % self.period
+
+    def answer(self, line):
+        name, _, argument = line.partition(' ')
+        handler = getattr(self, 'cmd_' + name, None)
+        if handler is None:
+            return 'ACK [5@0] {{{}}} unknown command "{}"\n'.format(name, name).encode('utf-8')
+        body = handler(argument.strip())
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if body.startswith(b'ACK '):
+            return body
+        return body + b'OK\n'
+
+    def idle(self, connection, rfile):
+        """Commande 'idle' : attend un changement de scénario ou la commande 'noidle'."""
+        scenario = self.current()[:2]
+        while True:
+            readable, _, _ = select.select([connection], [], [], 0.05)
+            if readable:
+                rfile.readline()            # 'noidle'
+                return b'OK\n'
+            if self.current()[:2] != scenario:
+                return b'changed: player\nOK\n'
+
+    def cmd_ping(self, argument):
+        return ''
+
+    def cmd_status(self, argument):
+        status, song, elapsed = self.current()
+        fields = dict(status)
+        if self.queue_length is not None:
+            fields['playlistlength'] = str(self.queue_length)
+        if status.get('duration'):
+            fields['elapsed'] = '{:.3f}'.format(elapsed)
+            fields['time'] = '{}:{}'.format(int(elapsed), int(float(status['duration'])))
+        else:
+            fields['elapsed'] = '{:.3f}'.format(elapsed)
+            fields['time'] = '{}:0'.format(int(elapsed))
+        return _format(fields)
+
+    def cmd_currentsong(self, argument):
+        return _format(self.current()[1])
+
+    def cmd_playlistid(self, argument):
+        # titre suivant : celui du scénario suivant
+        elapsed = time.monotonic() - self.start
+        index = (int(elapsed // self.period) + 1) % len(self.scenarios)
+        song = dict(SCENARIOS[self.scenarios[index]][1])
+        song['Id'] = argument.strip('"')
+        return _format(song)
+
+    # File d'attente synthétique : l'Id d'une entrée dépend de la version de la file (donc du scénario)
+    def queue_range(self, argument):
+        status = self.current()[0]
+        length = self.queue_length if self.queue_length is not None else int(status['playlistlength'])
+        first, colon, last = argument.strip('"').partition(':')
+        first = int(first or 0)
+        last = min(int(last), length) if last else (length if colon else min(first + 1, length))
+        return int(status['playlist']), range(first, last)
+
+    def cmd_playlistinfo(self, argument):
+        version, positions = self.queue_range(argument)
+        return ''.join(_format({ 'file' : 'Radios/{:05d}.m3u'.format(position), 'Title' : 'Flux {} (file {})'.format(position + 1, version),
+                                 'Pos' : position, 'Id' : version * 1000000 + position }) for position in positions)
+
+    # Bibliothèque synthétique : 10 titres par album, 5 albums par artiste
+    def cmd_stats(self, argument):
+        return _format({ 'artists' : (self.library_size + 49) // 50, 'albums' : (self.library_size + 9) // 10,
+                         'songs' : self.library_size, 'db_update' : self.db_update })
+
+    def cmd_list(self, argument):
+        if self.library is None:
+            lines = []
+            for song in range(self.library_size):
+                artist, album, track = song // 50, song // 10 % 5, song % 10
+                if song % 50 == 0:
+                    lines.append('Artist: Artiste {:05d}\n'.format(artist))
+                if song % 10 == 0:
+                    lines.append('Album: Album {} de l\'artiste {:05d}\n'.format(album + 1, artist))
+                lines.append('Track: {}\nTitle: Titre {} ({:06d})\n'.format(track + 1, track + 1, song))
+            self.library = ''.join(lines).encode('utf-8')
+        return self.library
+
+    def cmd_plchangesposid(self, argument):
+        old, _, window = argument.partition(' ')
+        version, positions = self.queue_range(window or '0:')
+        if int(old.strip('"')) == version:
+            return ''
+        return ''.join(_format({ 'cpos' : position, 'Id' : version * 1000000 + position }) for position in positions)
+
+    # Pochettes : image intégrée ('readpicture', réponse vide sans image) ou fichier cover.* ('albumart', erreur sans fichier)
+    def cmd_binarylimit(self, argument):
+        self.binary_limit = int(argument)
+        return ''
+
+    def cmd_readpicture(self, argument):
+        uri, offset = shlex.split(argument)
+        picture = self.pictures.get(uri)
+        if picture is None:
+            return ''
+        chunk = picture[int(offset):int(offset) + self.binary_limit]
+        return 'size: {}\ntype: image/jpeg\nbinary: {}\n'.format(len(picture), len(chunk)).encode('utf-8') + chunk + b'\n'
+
+    def cmd_albumart(self, argument):
+        if shlex.split(argument)[0] not in self.pictures:
+            return 'ACK [50@0] {albumart} No file exists\n'
+        return self.cmd_readpicture(argument)
+
+
+# ----------------------------------------------------------------------------
+class FakeLircd():
+    """Socket UNIX au format lircd envoyant une suite de touches.
+
+    Les instants d'envoi sont conservés dans ``sent`` (temps monotone).
+    """
+    def __init__(self, path, keys=('KEY_MENU', 'KEY_DOWN', 'KEY_RIGHT', 'KEY_LEFT', 'KEY_UP', 'KEY_MENU'), interval=0.5):
+        self.path = path
+        self.keys = keys
+        self.interval = interval
+        self.sent = []
+        self.running = True
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(1)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.server.close()
+
+    def serve(self):
+        try:
+            connection, _ = self.server.accept()
+        except OSError:
+            return
+        index = 0
+        with connection:
+            while self.running:
+                time.sleep(self.interval)
+                key = self.keys[index % len(self.keys)]
+                try:
+                    connection.sendall('000000000000{:04x} 00 {} devinput\n'.format(index, key).encode('utf-8'))
+                except OSError:
+                    return
+                self.sent.append((time.monotonic(), key))
+                index += 1
+
+
+class FakeMpdFifo():
+    """Tube nommé alimenté comme la sortie 'fifo' de MPD (format 44100:16:2).
+
+    Chaque voie reçoit une sinusoïde de fréquence ``frequency`` (Hz) et
+    d'amplitude ``levels`` (pleine échelle = 1), par morceaux de ``chunk``
+    secondes au rythme de la lecture. Comme MPD, le tube est aussi ouvert en
+    lecture (pas d'erreur sans lecteur) et vidé s'il est plein : l'écrivain
+    n'attend jamais.
+    """
+    def __init__(self, path, frequency=1000.0, levels=(0.5, 0.25), rate=44100, chunk=0.05):
+        self.path = path
+        self.rate = rate
+        self.chunk = chunk
+        self.running = True
+        self.drained = 0                    # octets jetés (tube plein)
+        if os.path.exists(path):
+            os.unlink(path)
+        os.mkfifo(path)
+        samples = array('h')
+        for frame in range(rate):
+            phase = 2 * math.pi * frequency * frame / rate
+            samples.extend(int(32767 * level * math.sin(phase)) for level in levels)
+        self.data = samples.tobytes()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        os.unlink(self.path)
+
+    def serve(self):
+        drain = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        output = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        size = int(self.rate * self.chunk) * 4
+        position = 0
+        try:
+            while self.running:
+                block = (self.data + self.data)[position:position + size] if position + size > len(self.data) \
+                    else self.data[position:position + size]
+                try:
+                    os.write(output, block)
+                except BlockingIOError:
+                    self.drained += len(os.read(drain, 65536))
+                position = (position + size) % len(self.data)
+                time.sleep(self.chunk)
+        finally:
+            os.close(output)
+            os.close(drain)
+
+
+# ----------------------------------------------------------------------------
+# Commandes système factices
+FAKE_AMIXER = '''#!{python}
+import json, os, sys
+state_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'amixer.json')
+try:
+    state = json.load(open(state_file))
+except (OSError, ValueError):
+    state = {{'I2S/SPDIF Select': 'I2S', 'FIR Filter Type': 'brick wall', 'Digital': 'on'}}
+args = [arg for arg in sys.argv[1:] if arg not in ('-c', '0')]
+if len(args) >= 3 and args[0] == 'sset':
+    value = args[2]
+    state[args[1]] = {{'mute': 'off', 'unmute': 'on'}}.get(value, value)
+    json.dump(state, open(state_file, 'w'))
+elif len(args) >= 2 and args[0] == 'sget':
+    control = args[1]
+    if control == 'Digital':
+        print("Simple mixer control 'Digital',0")
+        print("  Mono: Playback 207 [81%] [-24.00dB] [{{}}]".format(state['Digital']))
+    else:
+        print("Simple mixer control '{{}}',0".format(control))
+        print("  Item0: '{{}}'".format(state.get(control, '')))
+'''
+
+FAKE_IP = '''#!{python}
+import sys
+if sys.argv[-1] == 'eth0':
+    print('2: eth0    inet 192.168.1.20/24 brd 192.168.1.255 scope global eth0\\\\       valid_lft forever')
+'''
+
+
+def install_fake_commands(directory):
+    """Ecrit les commandes factices 'amixer' et 'ip' dans ``directory``."""
+    os.makedirs(directory, exist_ok=True)
+    for name, source in (('amixer', FAKE_AMIXER), ('ip', FAKE_IP)):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as script:
+            script.write(source.format(python=sys.executable))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return directory
+
+
+if __name__ == '__main__':
+    # Lancement autonome du serveur MPD factice (pour essais manuels avec mpc)
+    with FakeMpdServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 6600) as fake:
+        print('MPD factice sur {}:{}'.format(fake.host, fake.port))
+        try:
+            fake.thread.join()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Mesure de l'index de la bibliothèque et de la page BROWSE, hors Raspdac
+# Fichier : raspdac_oled_bench_library.py
+# ----------------------------------------------------------------------------
+#   python3 raspdac_oled_bench_library.py --songs 100000
+# ----------------------------------------------------------------------------
+"""Mesure de l'index local de la bibliothèque sur une bibliothèque synthétique.
+
+Un serveur MPD factice (raspdac_oled_bench_fakes.FakeMpdServer) sert une
+bibliothèque de ``--songs`` titres. Le script mesure :
+-> la construction de l'index (requête 'list' comprise) et son écriture ;
+-> la relecture de l'index enregistré (démarrage suivant) ;
+-> la durée de traitement d'une touche de la page BROWSE (action, puis
+   construction des lignes à afficher) sur une suite de touches aléatoires ;
+-> la construction de l'index de recherche et la durée de traitement d'une
+   touche de la page SEARCH (saisie T9 de noms tirés de la bibliothèque).
+
+Le script échoue si l'index ne contient pas tous les titres, si un nom tapé
+n'est pas trouvé ou si le p99 du traitement d'une touche dépasse ``--budget``
+millisecondes (le maximum dépend aussi du serveur factice, qui tourne dans le
+même processus).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from raspdac_oled_bench_fakes import FakeMpdServer
+from raspdac_oled_library import LibraryIndex
+from raspdac_oled_library import normalise
+from raspdac_oled_library import t9_digits
+from raspdac_oled_request_mpd import MpdServer, MpdStatus
+from raspdac_oled_screen_browse import PageBrowse
+from raspdac_oled_screen_search import PageSearch
+
+KEYS = ('KEY_UP', 'KEY_DOWN', 'KEY_DOWN', 'KEY_DOWN', 'KEY_RIGHT', 'KEY_LEFT')
+
+
+def wait_ready(library, timeout=600.0):
+    """Attente de l'index, de son index de recherche et de son écriture sur disque."""
+    time_end = time.monotonic() + timeout
+    while (library.search is None or not os.path.exists(library.path)) and time.monotonic() < time_end:
+        time.sleep(0.01)
+
+
+def report(name, timings):
+    """Ecrit p50/p99/max et retourne le p99."""
+    timings = sorted(timings)
+    print('{:<15} p50 {:.3f} ms  p99 {:.3f} ms  max {:.3f} ms'.format(
+          name, statistics.median(timings) * 1e3, timings[int(len(timings) * 0.99)] * 1e3, timings[-1] * 1e3))
+    return timings[int(len(timings) * 0.99)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure de l'index de la bibliothèque et de la page BROWSE")
+    parser.add_argument('--songs', type=int, default=100000, help='nombre de titres de la bibliothèque synthétique')
+    parser.add_argument('--keys', type=int, default=5000, help='nombre de touches simulées')
+    parser.add_argument('--budget', type=float, default=5.0, help="p99 maximal du traitement d'une touche (ms)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory, FakeMpdServer(library_size=args.songs) as fake:
+        def server():
+            mpd = MpdServer()
+            mpd.host, mpd.port = fake.host, fake.port
+            return mpd
+        path = os.path.join(directory, 'library.json.gz')
+
+        time_build = time.perf_counter()
+        library = LibraryIndex(path=path, server=server)
+        wait_ready(library)
+        time_build = time.perf_counter() - time_build
+        songs = sum(len(titles) for albums in library.data[2] for titles in albums)
+        print('construction    {:>9.0f} ms  ({} artistes, {} titres, index {:.1f} Mo)'.format(
+              time_build * 1e3, len(library.data[0]), songs, os.path.getsize(path) / 1e6))
+
+        time_load = time.perf_counter()
+        saved = LibraryIndex(path=path, server=server)
+        wait_ready(saved)
+        time_load = time.perf_counter() - time_load
+        print('relecture       {:>9.0f} ms  ({} reconstruction)'.format(time_load * 1e3, 'sans' if saved.version == 1 else 'AVEC'))
+
+        page = PageBrowse(saved)
+        status = MpdStatus({ 'playlistlength' : '12' })
+        page.open()
+        page.update(status, 0.0)
+        random.seed(2019)
+        timings = []
+        for _ in range(args.keys):
+            key = random.choice(KEYS)
+            start = time.perf_counter()
+            page.action(key, random.choice(('LOW', 'HIGH')))
+            page.update(status, 0.0)
+            timings.append(time.perf_counter() - start)
+            if page.status != 'ON':
+                page.open()
+        p99 = report('touche BROWSE', timings)
+        print('index recherche {:>9} mots'.format(len(saved.search.entries)))
+
+        page = PageSearch(saved)
+        artists, albums, tracks = saved.data
+        search_timings = []
+        found = 0
+        for _ in range(args.keys // 5):
+            artist = random.randrange(len(artists))
+            album = random.randrange(len(albums[artist]))
+            name = random.choice((artists[artist], albums[artist][album], random.choice(tracks[artist][album])))
+            page.open()
+            for digit in t9_digits(normalise(name))[:5]:
+                start = time.perf_counter()
+                page.action('KEY_' + digit)
+                page.update(status, 0.0)
+                search_timings.append(time.perf_counter() - start)
+            found += len(page.found) > 0
+            page.close()
+        p99 = max(p99, report('touche SEARCH', search_timings))
+
+    failures = (songs != args.songs) + (p99 * 1e3 > args.budget) + (saved.version != 1)
+    failures += (found != args.keys // 5)       # chaque nom tapé doit être trouvé
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Mesure de bout en bout de la boucle principale, hors Raspdac
+# Fichier : raspdac_oled_bench_loop.py
+# ----------------------------------------------------------------------------
+#   python3 raspdac_oled_bench_loop.py --duration 60
+# ----------------------------------------------------------------------------
+"""Mesure de la boucle principale avec des services factices.
+
+Le script lance le vrai ``raspdac_oled_main.py`` avec :
+-> un serveur MPD factice (titre PCM, web radio, DSD en alternance) ;
+-> un socket lircd factice qui envoie des touches de navigation du menu ;
+-> des commandes 'amixer' et 'ip' factices en tête du PATH ;
+-> l'écran virtuel 'memory' et une boucle sans attente (OHOLED_LOOP_PERIOD).
+
+Il rapporte ensuite le temps CPU par passage dans la boucle, le nombre de
+pages dessinées par seconde, les appels système read/write et les
+sous-processus par minute, et la latence des touches de la télécommande
+(durée de l'action, et délai jusqu'à l'affichage de son effet à l'écran).
+Les percentiles du démon portent sur une fenêtre glissante : elle est vidée
+(SIGHUP) à la fin de la mise en route, pour que les touches des pages INIT
+et IP n'y figurent pas.
+"""
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from raspdac_oled_bench_fakes import FakeLircd
+from raspdac_oled_bench_fakes import FakeMpdServer
+from raspdac_oled_bench_fakes import install_fake_commands
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_cpu_seconds(pid):
+    """Temps CPU (utilisateur + système) d'un processus, lu dans /proc."""
+    with open('/proc/{}/stat'.format(pid)) as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    ticks = os.sysconf('SC_CLK_TCK')
+    return (int(fields[11]) + int(fields[12])) / ticks
+
+
+def read_syscalls(pid):
+    """Nombre d'appels système de lecture et d'écriture (/proc/<pid>/io)."""
+    try:
+        with open('/proc/{}/io'.format(pid)) as io:
+            values = dict(line.split(': ') for line in io.read().splitlines())
+        return int(values['syscr']) + int(values['syscw'])
+    except (OSError, KeyError, ValueError):
+        return 0
+
+
+def read_metrics(path):
+    """Lecture d'un fichier de métriques Prometheus : {nom{labels}: valeur}."""
+    metrics = dict()
+    try:
+        with open(path) as text:
+            for line in text:
+                if line.startswith('#') or not line.strip():
+                    continue
+                name, value = line.rsplit(' ', 1)
+                metrics[name] = float(value)
+    except OSError:
+        pass
+    return metrics
+
+
+def run(duration, warmup, loop_period, directory):
+    metrics_path = os.path.join(directory, 'metrics')
+    env = dict(os.environ)
+    env.update({
+        'PATH' : install_fake_commands(os.path.join(directory, 'bin')) + os.pathsep + env.get('PATH', ''),
+        'OHOLED_DISPLAY' : 'memory',
+        'OHOLED_LOOP_PERIOD' : str(loop_period),
+        'OHOLED_METRICS' : metrics_path,
+        'OHOLED_METRICS_PERIOD' : '0.5',
+        'OHOLED_LIRCD' : os.path.join(directory, 'lircd'),
+        'OHOLED_LIBRARY_INDEX' : os.path.join(directory, 'library.json.gz'),
+        'OHOLED_STATE_SOCKET' : os.path.join(directory, 'state.sock'),
+        'OHOLED_MIRROR_SOCKET' : os.path.join(directory, 'mirror.sock'),
+        })
+    with FakeMpdServer() as mpd, FakeLircd(env['OHOLED_LIRCD']):
+        env['OHOLED_MPD_HOST'] = mpd.host
+        env['OHOLED_MPD_PORT'] = str(mpd.port)
+        process = subprocess.Popen([sys.executable, os.path.join(HERE, 'raspdac_oled_main.py')], env=env, cwd=directory)
+        try:
+            time.sleep(warmup)
+            process.send_signal(signal.SIGHUP)              # percentiles de l'intervalle mesuré seulement
+            before = (time.monotonic(), read_cpu_seconds(process.pid), read_syscalls(process.pid), read_metrics(metrics_path))
+            time.sleep(duration)
+            time.sleep(1.0)             # dernière écriture des métriques
+            after = (time.monotonic(), read_cpu_seconds(process.pid), read_syscalls(process.pid), read_metrics(metrics_path))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=10)
+    return before, after
+
+
+def report(before, after):
+    elapsed = after[0] - before[0]
+    minutes = elapsed / 60
+
+    def delta(name):
+        return after[3].get(name, 0.0) - before[3].get(name, 0.0)
+
+    loops = delta('oholed_stage_seconds_count{stage="loop"}')
+    frames = delta('oholed_frames_rendered_total')
+    lines = ['Mesure sur {:.1f} s'.format(elapsed)]
+    lines.append('  passages dans la boucle      {:10.0f}  ({:.1f} /s)'.format(loops, loops / elapsed))
+    if loops:
+        lines.append('  CPU par passage              {:10.3f} ms'.format((after[1] - before[1]) * 1000 / loops))
+    lines.append('  pages dessinées              {:10.1f} /s'.format(frames / elapsed))
+    lines.append('  appels système read/write    {:10.0f} /min'.format((after[2] - before[2]) / minutes))
+    lines.append('  sous-processus               {:10.1f} /min'.format(delta('oholed_subprocess_launches_total') / minutes))
+    lines.append('  requêtes MPD                 {:10.1f} /min'.format(delta('oholed_mpd_requests_total') / minutes))
+    kinds = { 'ir_key_latency' : 'action', 'key_to_glass' : 'écran', 'key_no_redraw' : 'sans image' }
+    for name, value in sorted(after[3].items()):
+        match = re.match(r'oholed_(ir_key_latency|key_to_glass|key_no_redraw)_seconds\{key="([^"]+)",quantile="([^"]+)"\}', name)
+        if match and delta('oholed_{}_seconds_count{{key="{}"}}'.format(match.group(1), match.group(2))):   # touche de l'intervalle
+            kind = kinds[match.group(1)]
+            lines.append('  {:<10} {:<12} p{:<4}  {:10.2f} ms'.format(kind, match.group(2), int(float(match.group(3)) * 100), value * 1000))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mesure de la boucle principale avec des services factices')
+    parser.add_argument('--duration', type=float, default=30.0, help='durée de la mesure (s)')
+    parser.add_argument('--warmup', type=float, default=22.0,
+                        help='durée de mise en route avant la mesure (s) ; par défaut les pages INIT et IP sont passées')
+    parser.add_argument('--loop-period', type=float, default=0.0, help='période de la boucle (0 : pleine vitesse)')
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix='oholed-bench-') as directory:
+        before, after = run(args.duration, args.warmup, args.loop_period, directory)
+    print(report(before, after))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Micro-mesures du rendu des pages, avec contrôle des images de référence
+# Fichier : raspdac_oled_bench_render.py
+# ----------------------------------------------------------------------------
+#   python3 raspdac_oled_bench_render.py                  (mesure + contrôle)
+#   python3 raspdac_oled_bench_render.py -k scrolling     (sélection par nom)
+#   python3 raspdac_oled_bench_render.py --update-golden  (nouvelles références)
+# ----------------------------------------------------------------------------
+"""Micro-mesures du chemin de rendu.
+
+Chaque mesure ``bench_<nom>(benchmark)`` reprend l'écriture de
+pytest-benchmark : ``benchmark.pedantic(fonction, setup=...)`` appelle la
+fonction sur des arguments neufs à chaque tour et retourne le résultat du
+dernier appel. La mesure retourne ensuite l'image obtenue, comparée à une
+image de référence du répertoire bench_golden/ : une accélération ne peut
+pas modifier les pixels sans que cela se voie.
+
+Les mesures couvrent text_metrics, justify_fields, process_scrolling,
+process_volume_bar, process_elapsed_bar, process_screen_saver et
+l'affichage complet (affichage_page) de chaque page de ``frames``, avec des
+titres longs et des métadonnées CJK, sur l'écran virtuel 'memory', ainsi que
+chaque page des trames des écrans secondaires (SECONDARY_SIZES).
+
+Le rendu du texte dépend des polices et de la version de FreeType :
+bench_golden/environment.json note, pour chaque mesure, les fichiers de
+police qu'elle utilise (polices de sa page, après repli sur DEFAULT_FONT et
+sous-ensemble éventuel) et la version de FreeType. Une mesure dont
+l'environnement diffère n'est pas comparée : elle est marquée « NON
+COMPARÉE » et le script échoue (code 2) ; les références se régénèrent
+alors sur la version de départ (--update-golden) avant de mesurer la
+modification. Installer msyh.ttf ne touche ainsi que les mesures qui
+l'utilisent.
+
+Les mesures CJK ne sont significatives qu'avec la police CJK_FONT
+(msyh.ttf, non fournie avec le dépôt) : sans elle, les idéogrammes seraient
+rendus en carrés par la police de repli. Elles sont alors ignorées, et
+leurs références ne sont écrites (--update-golden) que si la police est
+présente.
+"""
+import argparse
+import copy
+import fnmatch
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from PIL import Image
+from PIL import ImageDraw
+from PIL import features
+
+import raspdac_oled_fonts
+from raspdac_oled_display_backends import demo_connectors
+from raspdac_oled_screen_display import OledScreen
+from raspdac_oled_screen_display import draw_object
+from raspdac_oled_screen_display import fill_page_with_builded_fonts
+from raspdac_oled_screen_display import justify_fields
+from raspdac_oled_screen_display import process_elapsed_bar
+from raspdac_oled_screen_display import process_screen_saver
+from raspdac_oled_screen_display import process_scrolling
+from raspdac_oled_screen_display import process_volume_bar
+from raspdac_oled_screen_display import text_metrics
+from raspdac_oled_screen_frames import frames
+from raspdac_oled_screen_frames import frames_for
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(HERE, 'bench_golden')
+SEED = 2019
+WIDTH, HEIGHT = 128, 64
+LOOP_PERIOD = 0.2
+SECONDARY_SIZES = ((128, 32), (256, 64))    # trames des écrans secondaires contrôlées
+
+# Métadonnées d'essai : titres longs (défilement) et métadonnées CJK
+LONG_TITLE = 'Lacrimosa dies illa, qua resurget ex favilla judicandus homo reus'
+CJK_TITLE = '坂本龍一 - 音楽図鑑 (Ongaku Zukan) - 羽の林で'
+SAMPLES = { 'latin' : LONG_TITLE, 'cjk' : CJK_TITLE }
+CJK_FONT = 'msyh.ttf'                   # police des idéogrammes, nécessaire aux mesures CJK
+
+
+def cjk_connectors():
+    connectors = demo_connectors()
+    connectors['mpd_calc'].update({ 'i2s_play1_l1' : '坂本龍一', 'i2s_play1_l2' : '音楽図鑑 (Ongaku Zukan)',
+                                    'i2s_play2_l1' : '羽の林で', 'i2s_play2_l2' : 'DSD / 11.2 MHz / 1 bit' })
+    return connectors
+
+CONNECTORS = { 'latin' : demo_connectors, 'cjk' : cjk_connectors }
+
+
+# ----------------------------------------------------------------------------
+class Benchmark():
+    """Mesure d'une fonction, à la manière de la fixture pytest-benchmark."""
+    def __init__(self, min_time=0.2, min_rounds=5, max_rounds=5000):
+        self.min_time = min_time
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.timings = []
+
+    def __call__(self, function, *args):
+        return self.pedantic(function, args=args)
+
+    def pedantic(self, function, args=(), setup=None):
+        """Appelle ``function`` jusqu'à ``min_time`` ; ``setup`` fournit des arguments neufs à chaque tour."""
+        spent = 0.0
+        result = None
+        while len(self.timings) < self.max_rounds and (spent < self.min_time or len(self.timings) < self.min_rounds):
+            if setup is not None:
+                args = setup()
+            start = time.perf_counter()
+            result = function(*args)
+            elapsed = time.perf_counter() - start
+            self.timings.append(elapsed)
+            spent += elapsed
+        return result
+
+    def summary(self):
+        return { 'rounds' : len(self.timings), 'min' : min(self.timings),
+                 'median' : statistics.median(self.timings), 'mean' : statistics.fmean(self.timings) }
+
+
+def page_object(page, name, value=None):
+    """Copie d'un objet de trame, polices construites, valeur renseignée."""
+    object = copy.deepcopy({ name : { key : field for key, field in frames[page][name].items() if key != 'font' } })
+    fill_page_with_builded_fonts(object)
+    object = object[name]
+    if value is not None:
+        object['value'] = value
+    return object
+
+
+def picture(*objects):
+    """Image 128x64 des objets traités (même dessin que OledScreen.compose_page)."""
+    image = Image.new('1', (WIDTH, HEIGHT))
+    draw = ImageDraw.Draw(image)
+    for object in objects:
+        draw_object(draw, object)
+    return image
+
+
+# ----------------------------------------------------------------------------
+# Mesures
+def make_bench_text_metrics(sample):
+    def bench(benchmark):
+        object = page_object('I2S-PLAY1', 'artist', SAMPLES[sample])
+        width, height, offset_x, offset_y = benchmark(text_metrics, object['font'], object['value'])
+        object.update({ 'type' : 'text', 'xj' : -offset_x, 'yj' : -offset_y })
+        box = { 'type' : 'rectangle', 'xmin' : 0, 'ymin' : 0, 'xmax' : min(width, WIDTH - 1), 'ymax' : min(height, HEIGHT - 1) }
+        return picture(object, box)
+    return bench
+
+
+def make_bench_justify_fields(sample):
+    def bench(benchmark):
+        object = page_object('I2S-PLAY2', 'audio', SAMPLES[sample])
+        return picture(benchmark.pedantic(justify_fields, setup=lambda: (dict(object),)))
+    return bench
+
+
+def make_bench_process_scrolling(sample):
+    def bench(benchmark):
+        object = justify_fields(page_object('I2S-PLAY1', 'artist', SAMPLES[sample]))
+        process_scrolling(object, True, WIDTH, LOOP_PERIOD)
+        # régime établi : défilement d'un pas depuis une position connue
+        object['xscroll'] = -40
+        return picture(benchmark.pedantic(process_scrolling, setup=lambda: (dict(object), False, WIDTH, LOOP_PERIOD)))
+    return bench
+
+
+def bench_process_volume_bar(benchmark):
+    frame = page_object('VOLUME', 'volume_frame')
+    object = page_object('VOLUME', 'volume_bar', '42')
+    return picture(frame, benchmark.pedantic(process_volume_bar, setup=lambda: (dict(object),)))
+
+
+def bench_process_elapsed_bar(benchmark):
+    object = page_object('I2S-PLAY1', 'elapsed_bar', '83:245')
+    return picture(benchmark.pedantic(process_elapsed_bar, setup=lambda: (dict(object),)))
+
+
+def bench_process_screen_saver(benchmark):
+    object = justify_fields(page_object('SAVER', 'saver'))
+
+    def setup():
+        random.seed(SEED)
+        return dict(object), False, WIDTH, HEIGHT
+    return picture(benchmark.pedantic(process_screen_saver, setup=setup))
+
+
+def make_bench_page(page, sample, size=(WIDTH, HEIGHT)):
+    def bench(benchmark):
+        screen = SCREENS.get(size)
+        if screen is None:
+            screen = SCREENS[size] = OledScreen(backend='memory', width=size[0], height=size[1],
+                                                frames=frames_for(*size))
+        connectors = CONNECTORS[sample]()
+        screen.affichage_page(page, connectors, True, LOOP_PERIOD)     # polices de la page construites hors mesure
+        benchmark.pedantic(screen.affichage_page, args=(page, connectors, True, LOOP_PERIOD))
+        return screen.device.image
+    return bench
+
+SCREENS = dict()                        # écrans virtuels partagés (par résolution), ouverts au premier besoin
+
+
+def collect():
+    """Mesures : nom -> (mesure, page des objets dessinés, résolution)."""
+    benches = dict()
+    for sample in SAMPLES:
+        benches['text_metrics[{}]'.format(sample)] = (make_bench_text_metrics(sample), 'I2S-PLAY1', (WIDTH, HEIGHT))
+        benches['justify_fields[{}]'.format(sample)] = (make_bench_justify_fields(sample), 'I2S-PLAY2', (WIDTH, HEIGHT))
+        benches['process_scrolling[{}]'.format(sample)] = (make_bench_process_scrolling(sample), 'I2S-PLAY1', (WIDTH, HEIGHT))
+    benches['process_volume_bar'] = (bench_process_volume_bar, 'VOLUME', (WIDTH, HEIGHT))
+    benches['process_elapsed_bar'] = (bench_process_elapsed_bar, 'I2S-PLAY1', (WIDTH, HEIGHT))
+    benches['process_screen_saver'] = (bench_process_screen_saver, 'SAVER', (WIDTH, HEIGHT))
+    for page in frames:
+        for sample in CONNECTORS:
+            benches['affichage_page[{}-{}]'.format(page, sample)] = (make_bench_page(page, sample), page, (WIDTH, HEIGHT))
+    for width, height in SECONDARY_SIZES:
+        for page in frames:
+            name = 'affichage_page[{}x{}-{}-latin]'.format(width, height, page)
+            benches[name] = (make_bench_page(page, 'latin', (width, height)), page, (width, height))
+    return benches
+
+
+# ----------------------------------------------------------------------------
+# Images de référence
+def font_files(page, size):
+    """Fichiers de police utilisés par une page (comme FallbackFont) : {fichier: taille}."""
+    files = set()
+    for object in frames_for(*size)[page].values():
+        name = object.get('font_name')
+        if name is None:
+            continue
+        if not os.path.exists(raspdac_oled_fonts.font_path(name)):
+            name = raspdac_oled_fonts.DEFAULT_FONT
+        files.add(name)
+        if os.path.exists(raspdac_oled_fonts.subset_path(name)):
+            files.add(os.path.basename(raspdac_oled_fonts.subset_path(name)))
+    return { name : os.path.getsize(raspdac_oled_fonts.font_path(name)) for name in sorted(files) }
+
+
+def environment(benches):
+    """Eléments dont dépend le rendu de chaque mesure : fichiers de police et version de FreeType."""
+    return { 'freetype' : features.version('freetype2'),
+             'cases' : { name : font_files(page, size) for name, (_, page, size) in benches.items() } }
+
+
+def is_cjk(name):
+    return name.endswith('cjk]')
+
+
+def golden_path(name):
+    return os.path.join(GOLDEN_DIR, name.replace('[', '-').replace(']', '') + '.png')
+
+
+def check_golden(name, image, update):
+    """Compare l'image à sa référence ; retourne 'ok', 'écrite' ou 'DIFFÉRENTE'."""
+    path = golden_path(name)
+    if update:
+        image.convert('1').save(path)
+        return 'écrite'
+    if not os.path.exists(path):
+        return 'absente'
+    with Image.open(path) as golden:
+        if golden.convert('1').tobytes() == image.convert('1').tobytes():
+            return 'ok'
+    image.convert('1').save(path[:-len('.png')] + '.actual.png')
+    return 'DIFFÉRENTE'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-mesures du rendu, avec contrôle des images de référence')
+    parser.add_argument('-k', dest='pattern', default='*', help='sélection des mesures (motif, ex. "*scrolling*")')
+    parser.add_argument('--min-time', type=float, default=0.2, help='durée minimale de chaque mesure (s)')
+    parser.add_argument('--update-golden', action='store_true', help='réécrit les images de référence')
+    parser.add_argument('--json', help='écrit les résultats dans un fichier JSON')
+    args = parser.parse_args(argv)
+    pattern = args.pattern if any(char in args.pattern for char in '*?[') else '*{}*'.format(args.pattern)
+
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    environment_path = os.path.join(GOLDEN_DIR, 'environment.json')
+    benches = collect()
+    current = environment(benches)
+    cjk_font = os.path.exists(raspdac_oled_fonts.font_path(CJK_FONT))
+    if not cjk_font:
+        print('Attention : {} absente de {}, mesures CJK ignorées'.format(CJK_FONT, raspdac_oled_fonts.FONTS_DIR), file=sys.stderr)
+    recorded = { 'freetype' : None, 'cases' : dict() }
+    if args.update_golden:
+        if os.path.exists(environment_path):        # mesures non sélectionnées (-k) : environnement conservé
+            with open(environment_path) as saved:
+                recorded = json.load(saved)
+        if recorded.get('freetype') != current['freetype'] or 'cases' not in recorded:
+            recorded = { 'freetype' : current['freetype'], 'cases' : dict() }
+    elif os.path.exists(environment_path):
+        with open(environment_path) as saved:
+            recorded.update(json.load(saved))
+
+    results = dict()
+    failures = uncompared = 0
+    print('{:<36} {:>7} {:>11} {:>11} {:>11}  image'.format('mesure', 'tours', 'min (µs)', 'médiane', 'moyenne'))
+    for name, (bench, page, size) in benches.items():
+        if not fnmatch.fnmatchcase(name, pattern):
+            continue
+        if is_cjk(name) and not cjk_font:
+            print('{:<36} {:>7} {:>11} {:>11} {:>11}  ignorée ({} absente)'.format(name, '-', '-', '-', '-', CJK_FONT))
+            continue
+        benchmark = Benchmark(min_time=args.min_time)
+        image = bench(benchmark)
+        result = benchmark.summary()
+        if args.update_golden:
+            recorded['cases'][name] = current['cases'][name]
+            result['golden'] = check_golden(name, image, True)
+        elif recorded.get('freetype') != current['freetype'] or recorded['cases'].get(name) != current['cases'][name]:
+            result['golden'] = 'NON COMPARÉE'
+            uncompared += 1
+        else:
+            result['golden'] = check_golden(name, image, False)
+        failures += result['golden'] == 'DIFFÉRENTE'
+        results[name] = result
+        print('{:<36} {:>7} {:>11.1f} {:>11.1f} {:>11.1f}  {}'.format(name, result['rounds'], result['min'] * 1e6,
+              result['median'] * 1e6, result['mean'] * 1e6, result['golden']))
+    if args.update_golden:
+        with open(environment_path, 'w') as output:
+            json.dump(recorded, output, indent=2, sort_keys=True)
+            output.write('\n')
+    if uncompared:
+        print('Attention : {} image(s) non comparée(s), polices ou FreeType {} différents de ceux des références '
+              '(régénérer les références sur la version de départ : --update-golden)'.format(uncompared, current['freetype']),
+              file=sys.stderr)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+    return 1 if failures else 2 if uncompared else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
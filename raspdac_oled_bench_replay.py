@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Non-régression du séquenceur par rejeu d'un enregistrement
+# Fichier : raspdac_oled_bench_replay.py
+# ----------------------------------------------------------------------------
+#   python3 raspdac_oled_bench_replay.py
+#   python3 raspdac_oled_bench_replay.py --update
+#   python3 raspdac_oled_bench_replay.py --record 60
+# ----------------------------------------------------------------------------
+"""Rejeu de ``bench_replay/session.rec.gz`` et comparaison des changements de page.
+
+Le script lance ``raspdac_oled_main.py --replay`` sur l'enregistrement
+fourni avec le dépôt (écran virtuel 'memory', aucune image dessinée) et
+compare les changements de page écrits sur la sortie standard (instant
+relatif, état, page) au journal attendu ``bench_replay/session.transitions``.
+Toute différence est affichée (diff unifié) et le code de retour vaut 1.
+
+-> ``--update`` réécrit le journal attendu à partir du rejeu courant, après
+   une modification voulue du séquenceur ;
+-> ``--record DUREE`` refait l'enregistrement : la vraie boucle tourne
+   DUREE secondes avec les services factices (MPD qui alterne titre PCM,
+   web radio et DSD, télécommande qui parcourt le menu), puis le journal
+   attendu est réécrit.
+"""
+import argparse
+import difflib
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from raspdac_oled_bench_fakes import FakeLircd
+from raspdac_oled_bench_fakes import FakeMpdServer
+from raspdac_oled_bench_fakes import install_fake_commands
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPLAY_DIR = os.path.join(HERE, 'bench_replay')
+RECORDING = os.path.join(REPLAY_DIR, 'session.rec.gz')
+EXPECTED = os.path.join(REPLAY_DIR, 'session.transitions')
+
+# Touches de l'enregistrement : ouverture du menu, parcours des contrôles, fermeture, volume
+RECORD_KEYS = ('KEY_MENU', 'KEY_DOWN', 'KEY_DOWN', 'KEY_RIGHT', 'KEY_MENU', 'KEY_UP', 'KEY_DOWN')
+
+
+def record(duration, path):
+    """Enregistrement des entrées de la vraie boucle, avec les services factices."""
+    with tempfile.TemporaryDirectory(prefix='oholed-record-') as directory:
+        env = dict(os.environ)
+        env.update({
+            'PATH' : install_fake_commands(os.path.join(directory, 'bin')) + os.pathsep + env.get('PATH', ''),
+            'OHOLED_DISPLAY' : 'memory',
+            'OHOLED_LIRCD' : os.path.join(directory, 'lircd'),
+            'OHOLED_LIBRARY_INDEX' : os.path.join(directory, 'library.json.gz'),
+            'OHOLED_STATE_SOCKET' : os.path.join(directory, 'state.sock'),
+            'OHOLED_MIRROR_SOCKET' : os.path.join(directory, 'mirror.sock'),
+            })
+        with FakeMpdServer() as mpd, FakeLircd(env['OHOLED_LIRCD'], keys=RECORD_KEYS, interval=3.0):
+            env['OHOLED_MPD_HOST'] = mpd.host
+            env['OHOLED_MPD_PORT'] = str(mpd.port)
+            process = subprocess.Popen([sys.executable, os.path.join(HERE, 'raspdac_oled_main.py'), '--record', path],
+                                       env=env, cwd=directory, stdout=subprocess.DEVNULL)
+            try:
+                time.sleep(duration)
+            finally:
+                process.send_signal(signal.SIGTERM)     # fermeture propre du fichier (atexit)
+                process.wait(timeout=10)
+
+
+def replay(path):
+    """Changements de page du rejeu (lignes 'instant état page')."""
+    env = dict(os.environ, OHOLED_DISPLAY='memory')
+    for name in ('OHOLED_METRICS', 'OHOLED_STATE_SOCKET', 'OHOLED_MIRROR_SOCKET', 'OHOLED_SECONDARY_DISPLAYS'):
+        env.pop(name, None)
+    with tempfile.TemporaryDirectory(prefix='oholed-replay-') as directory:
+        env['OHOLED_LIBRARY_INDEX'] = os.path.join(directory, 'library.json.gz')
+        result = subprocess.run([sys.executable, os.path.join(HERE, 'raspdac_oled_main.py'),
+                                 '--replay', path, '--replay-render', 'none'],
+                                env=env, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, timeout=300)
+    if result.returncode != 0:
+        raise RuntimeError('rejeu interrompu (code {})'.format(result.returncode))
+    return result.stdout.splitlines(keepends=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejeu de l'enregistrement de référence et comparaison des changements de page")
+    parser.add_argument('--update', action='store_true', help='réécrit le journal attendu à partir du rejeu courant')
+    parser.add_argument('--record', type=float, metavar='DUREE',
+                        help="refait l'enregistrement (DUREE secondes avec les services factices) puis le journal attendu")
+    args = parser.parse_args(argv)
+    if args.record:
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        record(args.record, RECORDING)
+    transitions = replay(RECORDING)
+    if args.update or args.record:
+        with open(EXPECTED, 'w') as expected:
+            expected.writelines(transitions)
+        print('{} : {} changements de page'.format(os.path.relpath(EXPECTED, HERE), len(transitions)))
+        return 0
+    with open(EXPECTED) as expected:
+        reference = expected.readlines()
+    diff = list(difflib.unified_diff(reference, transitions, 'attendu', 'rejeu'))
+    if diff:
+        sys.stdout.writelines(diff)
+        print('ÉCHEC : les changements de page diffèrent du journal attendu')
+        return 1
+    print('ok : {} changements de page identiques au journal attendu'.format(len(transitions)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
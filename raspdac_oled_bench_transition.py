@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Mesure des transitions entre deux pages, hors Raspdac
+# Fichier : raspdac_oled_bench_transition.py
+# ----------------------------------------------------------------------------
+#   python3 raspdac_oled_bench_transition.py --png /tmp/transitions
+# ----------------------------------------------------------------------------
+"""Mesure des transitions 'slide', 'wipe' et 'fade' dans un écran en mémoire.
+
+Pour chaque transition et chaque changement de page (I2S-PLAY1 -> I2S-PLAY2,
+retour, I2S-PLAY1 -> VOLUME, retour), les pas sont joués au rythme de la
+boucle principale (TRANSITION_FPS). Le script rapporte la durée d'un pas
+(découpe et envoi à l'écran) face à la mise en page complète de la page,
+puis échoue :
+-> si le p99 d'un pas dépasse ``--budget`` ms ;
+-> si la dernière image n'est pas la nouvelle page ou si le contraste n'est
+   pas rétabli ;
+-> si la transition compte moins de la moitié des images attendues.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from raspdac_oled_display_backends import demo_connectors
+from raspdac_oled_screen_display import NORMAL_CONTRAST, OledScreen
+from raspdac_oled_transitions import TRANSITION_FPS, TRANSITION_TIME, PageTransition
+
+CHANGES = (('I2S-PLAY1', 'I2S-PLAY2'), ('I2S-PLAY2', 'I2S-PLAY1'), ('I2S-PLAY1', 'VOLUME'), ('VOLUME', 'I2S-PLAY1'))
+
+
+def report(name, timings):
+    """Ecrit p50/p99/max et retourne le p99."""
+    timings = sorted(timings)
+    print('{:<22} p50 {:.3f} ms  p99 {:.3f} ms  max {:.3f} ms'.format(
+          name, statistics.median(timings) * 1e3, timings[int(len(timings) * 0.99)] * 1e3, timings[-1] * 1e3))
+    return timings[int(len(timings) * 0.99)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mesure des transitions entre deux pages')
+    parser.add_argument('--budget', type=float, default=1000.0 / TRANSITION_FPS, help="p99 maximal d'un pas (ms)")
+    parser.add_argument('--png', metavar='REPERTOIRE', help='écrit les images de chaque transition en PNG')
+    args = parser.parse_args(argv)
+
+    screen = OledScreen(backend='memory')
+    connectors = demo_connectors()
+    layout = []
+    pages = dict()
+    for page in {page for change in CHANGES for page in change}:
+        for _ in range(20):
+            time_layout = time.perf_counter()
+            pages[page] = screen.compose_page(page, connectors, True, 0.2)
+            layout.append(time.perf_counter() - time_layout)
+    report('mise en page', layout)
+
+    failures = 0
+    for kind in ('slide', 'wipe', 'fade'):
+        transition = PageTransition(kind)
+        steps = []
+        for old_page, new_page in CHANGES:
+            screen.flush(pages[old_page])
+            transition.start([pages[old_page]], [pages[new_page]], old_page, new_page)
+            images, contrast = 0, NORMAL_CONTRAST
+            while transition.active:
+                time_step = time.perf_counter()
+                (image,), level = transition.step()
+                if level is not None:
+                    screen.contrast(level)
+                    contrast = level
+                screen.flush(image)
+                steps.append(time.perf_counter() - time_step)
+                images += 1
+                if args.png:
+                    os.makedirs(args.png, exist_ok=True)
+                    image.save(os.path.join(args.png, '{}-{}-{}-{:02d}.png'.format(kind, old_page, new_page, images)))
+                time.sleep(max(0.0, transition.period - (time.perf_counter() - time_step)))
+            failures += image.tobytes() != pages[new_page].tobytes() or contrast != NORMAL_CONTRAST
+            failures += images < TRANSITION_TIME * TRANSITION_FPS / 2
+        failures += report('pas {} ({} images)'.format(kind, len(steps)), steps) * 1e3 > args.budget
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Mesure du vumètre et de l'analyseur de spectre, hors Raspdac
+# Fichier : raspdac_oled_bench_visu.py
+# ----------------------------------------------------------------------------
+#   python3 raspdac_oled_bench_visu.py --duration 10
+# ----------------------------------------------------------------------------
+"""Mesure des pages 'SPECTRUM' et 'VUMETER' sur un tube alimenté comme MPD.
+
+Un tube nommé factice (raspdac_oled_bench_fakes.FakeMpdFifo) reçoit une
+sinusoïde de ``--frequency`` Hz (-6 dB à gauche, -12 dB à droite). La page
+est affichée à 30 images par seconde dans un écran en mémoire, en alternant
+spectre et vumètre. Le script mesure la durée de l'analyse et de la mise en
+page de chaque image, puis échoue :
+-> si le p99 de l'analyse et de la mise en page dépasse ``--budget`` ms ;
+-> si la bande la plus haute ne contient pas la fréquence de la sinusoïde ou
+   si les niveaux crête s'écartent de plus de 1 dB des niveaux attendus ;
+-> si l'analyse alloue de la mémoire après la première image ;
+-> si l'écrivain a dû vider le tube (lecteur en retard).
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from raspdac_oled_bench_fakes import FakeMpdFifo
+from raspdac_oled_display_backends import demo_connectors
+from raspdac_oled_fifo import DB_RANGE, FifoReader
+from raspdac_oled_screen_display import OledScreen
+from raspdac_oled_screen_visualiser import VISU_FPS, PageVisualiser
+
+LEVELS = (0.5, 0.25)            # amplitudes de la sinusoïde (-6 dB, -12 dB)
+
+
+def report(name, timings):
+    """Ecrit p50/p99/max et retourne le p99."""
+    timings = sorted(timings)
+    print('{:<15} p50 {:.3f} ms  p99 {:.3f} ms  max {:.3f} ms'.format(
+          name, statistics.median(timings) * 1e3, timings[int(len(timings) * 0.99)] * 1e3, timings[-1] * 1e3))
+    return timings[int(len(timings) * 0.99)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure du vumètre et de l'analyseur de spectre")
+    parser.add_argument('--duration', type=float, default=10.0, help='durée de la mesure (s)')
+    parser.add_argument('--frequency', type=float, default=1000.0, help='fréquence de la sinusoïde (Hz)')
+    parser.add_argument('--budget', type=float, default=10.0, help="p99 maximal de l'analyse et de la mise en page (ms)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        with FakeMpdFifo(os.path.join(directory, 'mpd.fifo'), args.frequency, LEVELS) as fifo:
+            page = PageVisualiser(reader=FifoReader(path=fifo.path))
+            screen = OledScreen(backend='memory')
+            connectors = demo_connectors()
+            page.open()
+            time.sleep(0.5)                 # remplissage du tampon
+            page.update()                   # première image (tableaux NumPy internes)
+            analysis, layout = [], []
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            time_end = time.monotonic() + args.duration
+            images = 0
+            while time.monotonic() < time_end:
+                time_frame = time.perf_counter()
+                connectors['visu'] = page.update()
+                time_layout = time.perf_counter()
+                screen.compose_page(page.page, connectors, False, 1.0 / VISU_FPS)
+                time_done = time.perf_counter()
+                analysis.append(time_layout - time_frame)
+                layout.append(time_done - time_layout)
+                images += 1
+                if images % (VISU_FPS * 2) == 0:
+                    page.action('KEY_RIGHT')    # alternance spectre / vumètre
+                time.sleep(max(0.0, 1.0 / VISU_FPS - (time.perf_counter() - time_frame)))
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            page.close()
+            drained = fifo.drained
+
+    print('images          {:>9} ({:.1f} /s)'.format(images, images / args.duration))
+    p99 = report('analyse', analysis)
+    p99 += report('mise en page', layout)
+    analyser = page.analyser
+    band = int(analyser.bands.argmax())
+    resolution = page.reader.rate / analyser.size
+    low = analyser.edges[band] * resolution
+    high = (analyser.edges[band + 1] if band + 1 < len(analyser.edges) else analyser.top) * resolution
+    print('bande maximale  {:>9.0f} - {:.0f} Hz'.format(low, high))
+    errors = [abs((level - 1.0) * DB_RANGE - 20 * math.log10(expected)) for level, expected in zip(analyser.peak, LEVELS)]
+    print('niveaux crête   {}  (écart {:.2f} dB)'.format(
+          ' / '.join('{:.1f} dB'.format((level - 1.0) * DB_RANGE) for level in analyser.peak), max(errors)))
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename')
+                    if stat.traceback[0].filename.endswith('raspdac_oled_fifo.py') and stat.size_diff > 0)
+    print('allocations     {:>9} octets (analyse)   tube vidé par l\'écrivain : {} octets'.format(allocated, drained))
+
+    failures = (p99 * 1e3 > args.budget) + (not low <= args.frequency < high) + (max(errors) > 1.0)
+    failures += (allocated > 1024) + (drained > 0)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Horloge de la boucle principale (réelle ou virtuelle)
+# Fichier : raspdac_oled_clock.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Horloges injectables.
+
+Le séquenceur (durées des pages, passage en SAVER, alternance PLAY1/PLAY2)
+dépend de l'heure. La boucle principale interroge donc une horloge :
+
+-> SystemClock : l'heure réelle (fonctionnement normal) ;
+-> VirtualClock : une heure simulée qui avance instantanément lors des
+   attentes, pour rejouer une journée enregistrée en quelques secondes
+   (voir raspdac_oled_replay.py).
+"""
+import time
+from datetime import datetime
+
+
+class SystemClock():
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock():
+    """Horloge simulée : ``sleep`` avance le temps sans attendre."""
+    def __init__(self, start=0.0):
+        self.current = float(start)
+
+    def time(self):
+        return self.current
+
+    def now(self):
+        return datetime.fromtimestamp(self.current)
+
+    def sleep(self, seconds):
+        self.current += max(0.0, seconds)
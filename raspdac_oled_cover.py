@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Pochettes d'album (vignettes 1 bit) lues sur le serveur MPD
+# Fichier : raspdac_oled_cover.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Pochettes d'album pour la page 'I2S-COVER'.
+
+La pochette du titre en cours est demandée au serveur MPD sur une connexion
+dédiée, en tâche de fond : image intégrée au fichier ('readpicture'), à
+défaut fichier cover.* du répertoire ('albumart'). Les deux commandes
+renvoient l'image par morceaux ; une pochette de quelques centaines de ko
+demande plusieurs allers-retours et son décodage JPEG plusieurs dizaines de
+millisecondes : rien de cela n'est fait dans la boucle principale.
+
+L'image est réduite dès le décodage (``Image.draft`` : le décodeur JPEG
+produit directement une image 2, 4 ou 8 fois plus petite), convertie en
+niveaux de gris, puis tramée en 1 bit (trame ordonnée de Bayer 8x8, calcul
+NumPy vectorisé, ou diffusion d'erreur de Floyd-Steinberg de Pillow).
+
+Les vignettes sont conservées par album (artiste de l'album, album) :
+-> en mémoire : les COVER_CACHE_SIZE dernières (LRU) ;
+-> sur disque : une image PNG 1 bit de quelques centaines d'octets par album
+   dans ``/var/cache/ohOled/covers`` (un fichier vide marque un album sans
+   pochette), relue au lieu d'être redemandée au serveur ; les
+   COVER_DISK_FILES dernières lues ou écrites (date de modification, LRU).
+
+Variables d'environnement :
+-> OHOLED_COVER : '1' pour afficher la page 'I2S-COVER' en lecture
+-> OHOLED_COVER_DIR : répertoire des vignettes (vide pour ne pas les enregistrer)
+-> OHOLED_COVER_DITHER : 'ordered' (trame de Bayer, par défaut) ou 'diffusion'
+"""
+import collections
+import hashlib
+import io
+import os
+import queue
+import sys
+import threading
+
+from PIL import Image, ImageChops, ImageOps
+
+try :
+    import numpy
+except ImportError :            # trame calculée par Pillow (même résultat)
+    numpy = None
+
+from raspdac_oled_request_mpd import MpdServer
+from raspdac_oled_stats import count
+
+COVER_ENABLED = os.environ.get('OHOLED_COVER', '0') == '1'
+COVER_DIR = os.environ.get('OHOLED_COVER_DIR', '/var/cache/ohOled/covers')
+COVER_DITHER = os.environ.get('OHOLED_COVER_DITHER', 'ordered')
+COVER_SIZE = 64                 # Côté (en pixels) de la vignette : hauteur de l'écran
+COVER_CACHE_SIZE = 32           # Nombre de vignettes conservées en mémoire
+COVER_DISK_FILES = 4096         # Nombre de vignettes conservées sur disque (environ 1 Mo)
+COVER_BINARY_LIMIT = 1048576    # Taille maximale d'un morceau d'image envoyé par le serveur ('binarylimit')
+
+
+# Seuils de la trame ordonnée de Bayer 8x8 (valeurs de 2 à 254, une par pixel du motif)
+def bayer_thresholds(order=3) :
+    matrix = [[0]]
+    for _ in range(order) :
+        matrix = ([[4 * value for value in row] + [4 * value + 2 for value in row] for row in matrix] +
+                  [[4 * value + 3 for value in row] + [4 * value + 1 for value in row] for row in matrix])
+    side = len(matrix)
+    return [[(value * 2 + 1) * 128 // (side * side) for value in row] for row in matrix]
+
+BAYER = bayer_thresholds()
+
+
+# Motif de seuils couvrant une image de taille 'size' (image 'L')
+def threshold_image(size) :
+    side = len(BAYER)
+    tile = Image.new('L', (side, side))
+    tile.putdata([value for row in BAYER for value in row])
+    pattern = Image.new('L', size)
+    for y in range(0, size[1], side) :
+        for x in range(0, size[0], side) :
+            pattern.paste(tile, (x, y))
+    return pattern
+
+
+# Tramage 1 bit d'une image en niveaux de gris
+def dither(image, method=COVER_DITHER) :
+    if method == 'diffusion' :
+        return image.convert('1')       # Floyd-Steinberg (Pillow)
+    if numpy is not None :
+        side = len(BAYER)
+        rows = -(-image.height // side)
+        columns = -(-image.width // side)
+        thresholds = numpy.tile(numpy.array(BAYER, dtype=numpy.uint8), (rows, columns))[:image.height, :image.width]
+        return Image.fromarray(numpy.asarray(image, dtype=numpy.uint8) > thresholds)
+    # sans NumPy : max(pixel - seuil, 0) > 0, calculé par Pillow
+    return ImageChops.subtract(image, threshold_image(image.size)).point(lambda value : 255 if value else 0).convert('1')
+
+
+# Vignette 1 bit (carrée, image centrée sur fond noir) d'une image JPEG, PNG...
+def render_cover(data, size=COVER_SIZE, method=COVER_DITHER) :
+    with Image.open(io.BytesIO(data)) as picture :
+        picture.draft('L', (size, size))   # JPEG : décodage directement à une échelle réduite
+        picture = picture.convert('L')
+    picture.thumbnail((size, size), Image.Resampling.LANCZOS)
+    picture = ImageOps.autocontrast(picture, cutoff=1)
+    tile = Image.new('L', (size, size), 0)
+    tile.paste(picture, ((size - picture.width) // 2, (size - picture.height) // 2))
+    return dither(tile, method)
+
+
+# Clé d'album d'un titre : (artiste de l'album, album), à défaut le répertoire du fichier
+def album_key(song) :
+    fields = song.fields
+    if fields.get('Album') :
+        return (fields.get('AlbumArtist') or fields.get('Artist', ''), fields['Album'])
+    if '/' in fields.get('file', '') and '://' not in fields['file'] :
+        return ('', fields['file'].rsplit('/', 1)[0])
+    return None                         # flux ou fichier isolé : pas de pochette
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe des pochettes d'album
+# -> 'get' est appelé par la boucle principale : il ne fait que lire le cache mémoire et déposer une demande
+# -> la lecture sur disque, la requête au serveur, le décodage et le tramage sont faits par le fil d'exécution dédié
+class CoverArt() :
+    def __init__(self, server=MpdServer, directory=COVER_DIR, size=COVER_SIZE, cache_size=COVER_CACHE_SIZE) :
+        self.server = server            # constructeur de la connexion dédiée
+        self.directory = directory
+        self.size = size
+        self.cache_size = cache_size
+        self.mpd = None
+        self.memory = collections.OrderedDict()    # clé d'album -> vignette (None : album sans pochette)
+        self.requested = None           # clé d'album de la dernière demande
+        self.lock = threading.Lock()
+        self.requests = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.run, name='oholed-cover', daemon=True)
+        self.thread.start()
+
+    # Vignette de l'album du titre (None si elle n'est pas encore disponible ou si l'album n'en a pas)
+    def get(self, song) :
+        key = album_key(song)
+        if key is None :
+            return None
+        with self.lock :
+            if key in self.memory :
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        if key != self.requested :
+            try :
+                self.requests.put_nowait((key, song['file']))
+                self.requested = key
+            except queue.Full :         # demande précédente en cours : nouvel essai au passage suivant
+                pass
+        return None
+
+    # Fil d'exécution dédié : une erreur (réponse inattendue, décodeur...) est écrite et l'album reste sans pochette
+    # en mémoire seulement (nouvel essai après son éviction du cache ou au redémarrage)
+    def run(self) :
+        while True :
+            key, uri = self.requests.get()
+            try :
+                found, image = self.load(key)
+                if not found :
+                    image = self.fetch(uri)
+                    if image is False :         # lien perdu : nouvelle demande au passage suivant
+                        self.requested = None
+                        continue
+                    self.save(key, image)
+            except Exception as e :
+                print('ohOled: pochette non lue ({}) : {!r}'.format(uri, e), file=sys.stderr, flush=True)
+                if self.mpd is not None :       # échange interrompu : nouvelle connexion
+                    self.mpd.socket.close()
+                    self.mpd = None
+                image = None
+            with self.lock :
+                self.memory[key] = image
+                while len(self.memory) > self.cache_size :
+                    self.memory.popitem(last=False)
+
+    def path(self, key) :
+        return os.path.join(self.directory, '{}.png'.format(hashlib.sha1('\0'.join(key).encode('utf-8')).hexdigest()))
+
+    # Vignette enregistrée : (trouvée, image)
+    def load(self, key) :
+        if not self.directory :
+            return False, None
+        try :
+            os.utime(self.path(key))    # vignette récente : conservée par 'save'
+            if os.path.getsize(self.path(key)) == 0 :
+                return True, None       # album sans pochette
+            with Image.open(self.path(key)) as image :
+                return True, image.convert('1')
+        except (OSError, ValueError) :
+            return False, None
+
+    # Pochette lue sur le serveur et réduite : image, None (pas de pochette) ou False (lien perdu)
+    def fetch(self, uri) :
+        if self.mpd is None or self.mpd.socket_status == 'KO' :
+            self.mpd = self.server()
+            self.mpd.connect()
+            if self.mpd.socket_status == 'KO' :
+                return False
+            self.mpd.command('binarylimit {}\n'.format(COVER_BINARY_LIMIT))   # refusé par les serveurs < 0.22.4
+        data = self.mpd.getpicture(uri, 'readpicture') or self.mpd.getpicture(uri, 'albumart')
+        if data is None or self.mpd.socket_status == 'KO' :
+            return False
+        count('covers_fetched')
+        if not data :
+            return None
+        try :
+            return render_cover(data, self.size)
+        except Exception as e :         # décodeurs : OSError, ValueError, SyntaxError ('broken PNG file')...
+            print('ohOled: pochette illisible ({}) : {!r}'.format(uri, e), file=sys.stderr, flush=True)
+            return None
+
+    # Ecriture atomique de la vignette (fichier vide pour un album sans pochette), puis oubli des plus anciennes
+    def save(self, key, image) :
+        if not self.directory :
+            return
+        temporary = '{}.tmp'.format(self.path(key))
+        try :
+            os.makedirs(self.directory, exist_ok=True)
+            if image is None :
+                open(temporary, 'wb').close()
+            else :
+                image.save(temporary, format='PNG', optimize=True)
+            os.replace(temporary, self.path(key))
+            saved = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.png')]
+            if len(saved) > COVER_DISK_FILES :
+                saved.sort(key=lambda entry : entry.stat().st_mtime)
+                for old in saved[:-COVER_DISK_FILES] :
+                    os.unlink(old.path)
+        except OSError as e :
+            print("ohOled: écriture de la pochette impossible ({})".format(e), file=sys.stderr, flush=True)
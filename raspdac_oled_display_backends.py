@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Sélection du périphérique d'affichage (écran SPI ou affichage virtuel)
+# Fichier : raspdac_oled_display_backends.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par raspdac_oled_screen_display.py
+# Il peut aussi être lancé seul pour dessiner toutes les pages en PNG :
+#   python3 raspdac_oled_display_backends.py /tmp/pages
+#   python3 raspdac_oled_display_backends.py /tmp/pages-128x32 128x32
+# ----------------------------------------------------------------------------
+"""Périphériques d'affichage.
+
+L'écran du Raspdac Mini est un SSD1309 (compatible SSD1306) 128x64 sur le bus
+SPI0. Pour exécuter et mesurer le rendu sans le matériel, d'autres
+périphériques sont disponibles ; ils se choisissent par la variable
+d'environnement OHOLED_DISPLAY (ou l'option --display du script principal) :
+
+-> 'ssd1306' : écran OLED sur SPI (par défaut)
+-> 'ssd1306_i2c' : écran OLED SSD1306 sur le bus I2C 1 (écran secondaire, 128x32 par exemple)
+-> 'ssd1322' : écran OLED SSD1322 256x64 sur SPI0, CE1 (façade, écran secondaire)
+-> 'dummy'   : périphérique 'dummy' de luma (image conservée en mémoire)
+-> 'memory'  : tampon en mémoire, sans dépendance à luma
+-> 'png'     : écrit chaque trame différente de la précédente en PNG
+-> 'gif'     : enregistre les trames dans un GIF animé (écrit à la sortie)
+
+Les captures sont écrites dans le répertoire OHOLED_CAPTURE (par défaut
+./capture), dans un sous-répertoire par écran secondaire.
+"""
+import atexit
+import os
+import sys
+import time
+
+from PIL import Image
+
+DISPLAY_BACKEND = os.environ.get('OHOLED_DISPLAY', 'ssd1306')
+CAPTURE_DIR = os.environ.get('OHOLED_CAPTURE', 'capture')
+BACKENDS = ('ssd1306', 'ssd1306_i2c', 'ssd1322', 'dummy', 'memory', 'png', 'gif')
+I2C_ADDRESS = 0x3C              # Adresse de l'écran 'ssd1306_i2c' sur le bus I2C 1
+SSD1322_SPI_DEVICE = 1          # Ecran 'ssd1322' : SPI0, sélection CE1 (CE0 : écran du Raspdac)
+SSD1322_GPIO_DC = 23            # Broche Donnée/Commande de l'écran 'ssd1322' (pas de broche de RAZ)
+
+
+class MemoryDevice():
+    """Ecran virtuel : conserve la dernière image affichée.
+
+    Offre le sous-ensemble de l'interface des périphériques luma utilisé par
+    OledScreen (display, hide, show, contrast, cleanup, size, mode).
+    """
+    def __init__(self, width=128, height=64, rotate=0, mode='1'):
+        if rotate % 2 :                 # 90° ou 270° : dimensions échangées, comme les périphériques luma
+            width, height = height, width
+        self.width = width
+        self.height = height
+        self.size = (width, height)
+        self.mode = mode
+        self.rotate = rotate            # conservée pour information : l'image reste à l'endroit
+        self.image = Image.new(mode, self.size)
+        self.frames = 0                 # nombre d'images affichées
+        self.visible = True
+        self.level = 0xFF               # contraste courant
+
+    def display(self, image):
+        self.image = image.copy()
+        self.frames += 1
+
+    def hide(self):
+        self.visible = False
+
+    def show(self):
+        self.visible = True
+
+    def contrast(self, level):
+        self.level = level
+
+    def cleanup(self):
+        pass
+
+
+class CaptureDevice(MemoryDevice):
+    """Ecran virtuel qui enregistre les trames affichées (PNG ou GIF animé)."""
+    def __init__(self, width=128, height=64, rotate=0, mode='1', kind='png', directory=CAPTURE_DIR):
+        super().__init__(width, height, rotate, mode)
+        self.kind = kind
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.last_bytes = None
+        self.gif_frames = []            # (image, instant d'affichage)
+        atexit.register(self.cleanup)
+
+    def display(self, image):
+        super().display(image)
+        data = image.tobytes()
+        if data == self.last_bytes:
+            return
+        self.last_bytes = data
+        if self.kind == 'png':
+            image.save(os.path.join(self.directory, 'frame-{:06d}.png'.format(self.frames)))
+        else:
+            self.gif_frames.append((image.convert('L'), time.monotonic()))
+
+    def cleanup(self):
+        if self.kind != 'gif' or not self.gif_frames:
+            return
+        images = [image for image, _ in self.gif_frames]
+        instants = [instant for _, instant in self.gif_frames] + [time.monotonic()]
+        durations = [max(20, int((instants[i + 1] - instants[i]) * 1000)) for i in range(len(images))]
+        images[0].save(os.path.join(self.directory, 'capture.gif'), save_all=True,
+                       append_images=images[1:], duration=durations, loop=0)
+        self.gif_frames = []
+
+
+def open_device(backend=None, width=128, height=64, rotate=2, name=None):
+    """Ouvre le périphérique d'affichage demandé ('name' : sous-répertoire des captures d'un écran secondaire)."""
+    backend = backend or DISPLAY_BACKEND
+    if backend == 'ssd1306':
+        from luma.core.interface.serial import spi  # Gestion des bus série de type I2C et SPI
+        from luma.oled.device import ssd1306        # Gestion de l'écran OLED SSD1309 (compatible SSD1306)
+        # Configuration Bus série SPI entre le Raspberry Pi et l'écran OLED
+        serial = spi(port=0, device=0, gpio_DC=27, gpio_RST=24)
+        return ssd1306(serial, width=width, height=height, rotate=rotate)
+    if backend == 'ssd1306_i2c':
+        from luma.core.interface.serial import i2c
+        from luma.oled.device import ssd1306
+        return ssd1306(i2c(port=1, address=I2C_ADDRESS), width=width, height=height, rotate=rotate)
+    if backend == 'ssd1322':
+        from luma.core.interface.serial import spi
+        from luma.oled.device import ssd1322        # Ecran en niveaux de gris, piloté ici en 1 bit comme les autres
+        serial = spi(port=0, device=SSD1322_SPI_DEVICE, gpio_DC=SSD1322_GPIO_DC, gpio_RST=None)
+        return ssd1322(serial, width=width, height=height, rotate=rotate, mode='1')
+    if backend == 'dummy':
+        from luma.core.device import dummy
+        return dummy(width=width, height=height, rotate=rotate, mode='1')
+    if backend == 'memory':
+        return MemoryDevice(width, height, rotate)
+    if backend in ('png', 'gif'):
+        directory = os.path.join(CAPTURE_DIR, name) if name else CAPTURE_DIR
+        return CaptureDevice(width, height, rotate, kind=backend, directory=directory)
+    raise ValueError("Périphérique d'affichage inconnu : {} (choix : {})".format(backend, ', '.join(BACKENDS)))
+
+
+# ----------------------------------------------------------------------------
+# Données d'exemple pour dessiner toutes les pages sans MPD ni ALSA
+def demo_connectors():
+    from raspdac_oled_screen_display import icons
+    from raspdac_oled_cover import dither
+    demo_icons = dict(icons)
+    demo_icons['ip_type'] = icons['link']
+    demo_icons['player_state'] = icons['play']
+    return {
+        'icons' : demo_icons,
+        'info' : { 'hms' : '12:34:56', 'ip' : '192.168.1.20' },
+        'menu' : { 'state' : 'ON', 'menu_control' : 'FILTER', 'menu_item' : '3',
+                   'flag_active_item' : True, 'menu_txt' : '3 : minimum phase fast' },
+        'mpd_status' : { 'volume' : '42', 'time' : '83:245', 'state' : 'play' },
+        'mpd_song' : dict(),
+        'dac' : { 'state' : 'RUNNING', 'rate' : 96000, 'format' : 'S32_LE', 'channels' : 2, 'text' : 'DAC 96 kHz / 32 bits' },
+        'queue' : { 'state' : 'ON', 'header' : 'File 1204 / 12873',
+                    'line0' : 'Radio Paradise - Main Mix', 'line1' : '* Wolfgang Amadeus Mozart - Lacrimosa dies illa',
+                    'line2' : 'FIP - Jazz', 'line3' : 'Radio Swiss Classic' },
+        'browse' : { 'state' : 'ON', 'header' : 'Wolfgang Amadeus Mozart',
+                     'line0' : 'Die Zauberflöte, K. 620', 'line1' : 'Requiem in D minor, K. 626 (Karajan, 1975)',
+                     'line2' : 'Symphonies Nos. 40 & 41', 'line3' : '' },
+        'search' : { 'state' : 'ON', 'header' : 'Recherche 2328 : 3',
+                     'line0' : '', 'line1' : 'The Beatles', 'line2' : 'Beat It - Michael Jackson',
+                     'line3' : 'Beatitudes (Arvo Pärt)' },
+        'cover' : { 'image' : dither(Image.radial_gradient('L').resize((64, 64)), 'ordered') },
+        'visu' : { 'state' : 'ON', 'signal' : '',
+                   'bands' : [max(0.0, 0.85 - abs(band - 6) * 0.035 - (band % 3) * 0.06) for band in range(32)],
+                   'band_peaks' : [max(0.0, 0.92 - abs(band - 6) * 0.03) for band in range(32)],
+                   'rms_left' : [0.62], 'peak_left' : [0.81], 'rms_right' : [0.57], 'peak_right' : [0.78] },
+        'mpd_calc' : { 'i2s_play1_l1' : 'Wolfgang Amadeus Mozart', 'i2s_play1_l2' : 'Requiem in D minor, K. 626',
+                       'i2s_play2_l1' : 'Lacrimosa dies illa', 'i2s_play2_l2' : 'PCM / 44.1 kHz / 16 bits',
+                       'elapsed_sec' : 83, 'elapsed_MS' : '01:23', 'duration_sec' : 245, 'duration_MS' : '04:05' },
+        }
+
+
+def main(argv=None):
+    """Dessine toutes les pages : main([répertoire[, LARGEURxHAUTEUR]]), 128x64 par défaut."""
+    from raspdac_oled_screen_display import OledScreen
+    from raspdac_oled_screen_frames import frames, frames_for
+    argv = argv if argv is not None else sys.argv[1:]
+    directory = argv[0] if argv else CAPTURE_DIR
+    width, height = (int(value) for value in (argv[1] if len(argv) > 1 else '128x64').split('x'))
+    os.makedirs(directory, exist_ok=True)
+    screen = OledScreen(backend='memory', width=width, height=height, frames=frames_for(width, height))
+    connectors = demo_connectors()
+    for page in frames:
+        image = screen.compose_page(page, connectors, True, 0.2)
+        path = os.path.join(directory, '{}.png'.format(page))
+        image.save(path)
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Lecture du signal audio sur la sortie 'fifo' de MPD et analyse (niveaux, spectre)
+# Fichier : raspdac_oled_fifo.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par la page 'VISU' (raspdac_oled_screen_visualiser.py)
+# ----------------------------------------------------------------------------
+"""Signal audio de la sortie 'fifo' de MPD, pour le vumètre et le spectre.
+
+MPD écrit les échantillons PCM dans un tube nommé si une sortie de ce type
+est déclarée dans ``/etc/mpd.conf`` :
+
+    audio_output {
+        type    "fifo"
+        name    "ohOled"
+        path    "/tmp/mpd.fifo"
+        format  "44100:16:2"
+    }
+
+-> FifoReader : fil d'exécution qui lit le tube, sans traitement, dans un
+   tampon circulaire alloué une fois pour toutes. Il lit tout ce qui est
+   disponible à chaque réveil : les données les plus anciennes sont écrasées
+   plutôt que lues en retard, et le tube ne se remplit jamais (MPD vide
+   lui-même un tube plein : la lecture audio n'attend jamais l'écran).
+-> Analyser : à chaque image, niveaux crête et RMS de chaque voie et spectre
+   (FFT de la somme des voies, bandes de largeur logarithmique) des
+   FFT_SIZE derniers échantillons. Tous les calculs NumPy écrivent dans des
+   tableaux alloués à la construction (paramètres 'out').
+
+Variables d'environnement :
+-> OHOLED_FIFO : chemin du tube (défaut /tmp/mpd.fifo)
+-> OHOLED_FIFO_FORMAT : format déclaré dans la sortie MPD (défaut 44100:16:2)
+"""
+import os
+import select
+import sys
+import threading
+import time
+
+import numpy
+
+FIFO_PATH = os.environ.get('OHOLED_FIFO', '/tmp/mpd.fifo')
+FIFO_FORMAT = os.environ.get('OHOLED_FIFO_FORMAT', '44100:16:2')
+FIFO_RETRY = 2.0                # Délai (en secondes) avant une nouvelle ouverture du tube absent
+FIFO_SILENCE = 0.5              # Signal considéré comme absent après cette durée (en secondes) sans données
+RING_FRAMES = 16384             # Taille du tampon circulaire (en trames, soit 0,37 s à 44,1 kHz)
+FFT_SIZE = 1024                 # Nombre de trames analysées à chaque image
+SPECTRUM_BANDS = 32             # Nombre de bandes du spectre (au plus)
+SPECTRUM_FMIN = 40.0            # Bornes (en Hz) du spectre affiché
+SPECTRUM_FMAX = 16000.0
+DB_RANGE = 60.0                 # Dynamique affichée (en dB sous la pleine échelle)
+FALL_RATE = 1.5                 # Vitesse de retombée des barres et des crêtes (pleine échelle par seconde)
+
+# Format des échantillons de MPD ('bits' du format) : (type NumPy, pleine échelle)
+SAMPLE_TYPES = {
+    '8' : ('i1', 128.0),
+    '16' : ('<i2', 32768.0),
+    '24' : ('<i4', 8388608.0),          # 24 bits dans 32 bits (S24_P32)
+    '32' : ('<i4', 2147483648.0),
+    'f' : ('<f4', 1.0),
+    }
+
+
+# Format 'fréquence:bits:voies' d'une sortie MPD
+def parse_format(text) :
+    rate, bits, channels = text.split(':')
+    if bits not in SAMPLE_TYPES :
+        raise ValueError('format de la sortie fifo non pris en charge : {}'.format(text))
+    return int(rate), bits, int(channels)
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe du lecteur du tube
+# -> le tube n'est ouvert que pendant l'affichage du vumètre ou du spectre ('start' / 'stop')
+# -> 'written' (octets reçus depuis l'ouverture) est la seule donnée partagée avec la boucle principale
+class FifoReader() :
+    def __init__(self, path=FIFO_PATH, audio_format=FIFO_FORMAT, frames=RING_FRAMES) :
+        self.path = path
+        self.rate, bits, self.channels = parse_format(audio_format)
+        dtype, self.full_scale = SAMPLE_TYPES[bits]
+        self.ring = numpy.zeros((frames, self.channels), dtype=dtype)
+        self.ring_bytes = memoryview(self.ring.reshape(-1).view(numpy.uint8))
+        self.frame_bytes = self.ring.strides[0]
+        self.written = 0                # octets reçus (position d'écriture = written % taille du tampon)
+        self.time_data = 0.0            # instant des dernières données reçues
+        self.active = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='oholed-fifo', daemon=True)
+        self.thread.start()
+
+    def start(self) :
+        self.active.set()
+
+    def stop(self) :
+        self.active.clear()
+
+    # Trames complètes reçues depuis l'ouverture du tube
+    @property
+    def frames(self) :
+        return self.written // self.frame_bytes
+
+    # Signal présent : données reçues depuis moins de FIFO_SILENCE secondes
+    @property
+    def playing(self) :
+        return time.monotonic() - self.time_data < FIFO_SILENCE
+
+    def run(self) :
+        while True :
+            self.active.wait()
+            try :
+                fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+            except OSError as e :
+                print('ohOled: tube audio {} indisponible ({})'.format(self.path, e), file=sys.stderr, flush=True)
+                time.sleep(FIFO_RETRY)
+                continue
+            try :
+                self.read(fd)
+            finally :
+                os.close(fd)
+
+    # Lecture du tube tant que la page est affichée
+    def read(self, fd) :
+        size = len(self.ring_bytes)
+        self.written = 0
+        while self.active.is_set() :
+            if not select.select([fd], [], [], FIFO_SILENCE)[0] :
+                continue
+            while True :                # tout ce qui est disponible, par morceaux jusqu'à la fin du tampon
+                position = self.written % size
+                try :
+                    received = os.readv(fd, [self.ring_bytes[position:]])
+                except BlockingIOError :
+                    break
+                if received == 0 :      # aucun écrivain (sortie MPD fermée) : nouvelle attente
+                    time.sleep(FIFO_SILENCE)
+                    break
+                self.written += received
+                self.time_data = time.monotonic()
+                if received < size - position :
+                    break
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe de l'analyse du signal (appelée par la boucle principale, une fois par image)
+class Analyser() :
+    def __init__(self, reader, size=FFT_SIZE, bands=SPECTRUM_BANDS) :
+        self.reader = reader
+        self.size = size
+        channels = reader.channels
+        self.samples = numpy.zeros((size, channels))            # trames analysées (pleine échelle = 1)
+        self.squares = numpy.zeros((size, channels))
+        self.mono = numpy.zeros(size)
+        self.window = numpy.hanning(size)
+        self.spectrum = numpy.zeros(size // 2 + 1, dtype=complex)
+        self.magnitude = numpy.zeros(size // 2 + 1)
+        self.reference = self.window.sum() * channels / 2      # amplitude d'une sinusoïde pleine échelle sur toutes les voies
+        # bornes (rangs FFT) des bandes de largeur logarithmique, au moins un rang par bande
+        resolution = reader.rate / size
+        edges = numpy.geomspace(SPECTRUM_FMIN, min(SPECTRUM_FMAX, reader.rate / 2), bands + 1) / resolution
+        self.edges = numpy.unique(numpy.maximum(edges.astype(int), 1))
+        self.top = int(self.edges[-1])
+        self.edges = self.edges[:-1]
+        self.bands = numpy.zeros(len(self.edges))               # niveaux des bandes (0 à 1)
+        self.levels = numpy.zeros(len(self.edges))              # barres affichées (retombée progressive)
+        self.band_peaks = numpy.zeros(len(self.edges))          # crêtes des barres (retombée progressive)
+        self.peak = numpy.zeros(channels)                       # niveaux crête et RMS de chaque voie (0 à 1)
+        self.rms = numpy.zeros(channels)
+        self.vu_levels = numpy.zeros(channels)                  # niveaux RMS et crêtes affichés (retombée progressive)
+        self.vu_peaks = numpy.zeros(channels)
+        self.time_update = time.monotonic()
+        try :
+            numpy.fft.rfft(self.mono, out=self.spectrum)
+            self.fft_out = True
+        except TypeError :              # NumPy < 2.0 : pas de paramètre 'out'
+            self.fft_out = False
+
+    # Copie des 'size' dernières trames du tampon circulaire (mises à l'échelle)
+    def copy_window(self) :
+        ring = self.reader.ring
+        end = self.reader.frames % len(ring)
+        start = end - self.size
+        scale = 1.0 / self.reader.full_scale
+        if start >= 0 :
+            numpy.multiply(ring[start:end], scale, out=self.samples)
+        else :                          # fenêtre à cheval sur la fin du tampon
+            numpy.multiply(ring[start:], scale, out=self.samples[:-start])
+            numpy.multiply(ring[:end], scale, out=self.samples[-start:])
+
+    # Niveaux en dB ramenés entre 0 (-DB_RANGE dB) et 1 (pleine échelle), en place
+    @staticmethod
+    def to_scale(values) :
+        numpy.maximum(values, 1e-12, out=values)
+        numpy.log10(values, out=values)
+        numpy.multiply(values, 20.0 / DB_RANGE, out=values)
+        numpy.add(values, 1.0, out=values)
+        numpy.clip(values, 0.0, 1.0, out=values)
+
+    # Retombée progressive : affichage = max(mesure, affichage - retombée)
+    @staticmethod
+    def fall(displayed, measured, step) :
+        numpy.subtract(displayed, step, out=displayed)
+        numpy.maximum(displayed, measured, out=displayed)
+
+    def update(self) :
+        now = time.monotonic()
+        step = FALL_RATE * (now - self.time_update)
+        self.time_update = now
+        if self.reader.playing and self.reader.frames >= self.size :
+            self.copy_window()
+            numpy.abs(self.samples, out=self.squares)
+            numpy.max(self.squares, axis=0, out=self.peak)
+            numpy.multiply(self.samples, self.samples, out=self.squares)
+            numpy.mean(self.squares, axis=0, out=self.rms)
+            numpy.sqrt(self.rms, out=self.rms)
+            numpy.sum(self.samples, axis=1, out=self.mono)
+            numpy.multiply(self.mono, self.window, out=self.mono)
+            if self.fft_out :
+                numpy.fft.rfft(self.mono, out=self.spectrum)
+            else :
+                self.spectrum[:] = numpy.fft.rfft(self.mono)
+            numpy.abs(self.spectrum, out=self.magnitude)
+            numpy.maximum.reduceat(self.magnitude[:self.top], self.edges, out=self.bands)
+            numpy.divide(self.bands, self.reference, out=self.bands)
+            for values in (self.peak, self.rms, self.bands) :
+                self.to_scale(values)
+        else :                          # pas de signal : retombée des barres
+            self.peak.fill(0.0)
+            self.rms.fill(0.0)
+            self.bands.fill(0.0)
+        self.fall(self.levels, self.bands, step)
+        self.fall(self.band_peaks, self.bands, step / 3)
+        self.fall(self.vu_levels, self.rms, step)
+        self.fall(self.vu_peaks, self.peak, step / 3)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Chargement des polices de caractères (sous-ensemble + repli CJK)
+# Fichier : raspdac_oled_fonts.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par raspdac_oled_screen_display.py
+# Il peut aussi être lancé seul pour construire les sous-ensembles de polices :
+#   python3 raspdac_oled_fonts.py msyh.ttf
+# ----------------------------------------------------------------------------
+"""Polices de caractères de l'écran OLED.
+
+La police ``msyh.ttf`` (Microsoft YaHei) pèse plusieurs Mo et était chargée
+une fois par objet de trame. Ce module :
+
+-> partage une seule instance par couple (police, taille) ;
+-> affiche par défaut depuis un sous-ensemble Latin/chiffres
+   (``fonts/<nom>-subset.ttf``) construit par ce script ;
+-> ne charge la police complète que lorsqu'une chaîne contient un caractère
+   hors du sous-ensemble (titres CJK par exemple) ;
+-> se replie sur ``arial.ttf`` si la police demandée n'est pas installée.
+
+La couverture est mémorisée caractère par caractère : après le premier
+affichage d'un titre, le test de repli ne coûte plus qu'une lecture de
+dictionnaire par caractère (et rien du tout pour une chaîne ASCII).
+"""
+import os
+import sys
+import threading
+import time
+
+from PIL import ImageFont
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+DEFAULT_FONT = 'arial.ttf'          # Police de repli si la police demandée est absente
+SUBSET_SUFFIX = '-subset'           # msyh.ttf -> msyh-subset.ttf
+
+# Plages Unicode conservées dans le sous-ensemble (bornes incluses)
+SUBSET_RANGES = (
+    (0x0020, 0x007E),               # ASCII imprimable
+    (0x00A0, 0x017F),               # Latin-1 + Latin étendu A (accents européens)
+    (0x2010, 0x2027),               # Tirets, guillemets, points de suspension
+    (0x2030, 0x203A),               # Pour mille, chevrons simples
+    (0x20AC, 0x20AC),               # Euro
+    (0x2122, 0x2122),               # Marque déposée
+    )
+
+# Couverture du sous-ensemble, mémorisée par point de code (partagée par toutes les polices)
+_coverage = dict()
+
+# Instances partagées, indexées par (nom, taille)
+_fonts = dict()
+
+# Instances propres à un fil secondaire (compilation d'une mise en page rechargée) : une face FreeType
+# ne doit pas servir à deux fils à la fois
+_thread_fonts = threading.local()
+
+# Statistiques de chargement (rapport de démarrage --startup-profile)
+load_stats = {'faces': 0, 'seconds': 0.0}
+
+
+def _truetype(path, size):
+    time_load = time.monotonic()
+    face = ImageFont.truetype(path, size)
+    load_stats['faces'] += 1
+    load_stats['seconds'] += time.monotonic() - time_load
+    return face
+
+
+def font_path(name):
+    """Chemin d'une police du répertoire 'fonts'."""
+    return os.path.join(FONTS_DIR, name)
+
+
+def subset_path(name):
+    """Chemin du sous-ensemble construit pour une police."""
+    base, ext = os.path.splitext(name)
+    return font_path(base + SUBSET_SUFFIX + ext)
+
+
+def in_subset(codepoint):
+    """Indique si un point de code appartient au sous-ensemble (avec cache)."""
+    covered = _coverage.get(codepoint)
+    if covered is None:
+        covered = any(low <= codepoint <= high for low, high in SUBSET_RANGES)
+        _coverage[codepoint] = covered
+    return covered
+
+
+class FallbackFont():
+    """Police à deux étages : sous-ensemble chargé d'office, face complète à la demande.
+
+    L'objet expose ``getbbox`` comme une ``FreeTypeFont`` ; pour dessiner, on
+    passe à Pillow la face retournée par ``resolve(text)``.
+    """
+    __slots__ = ('name', 'size', '_primary', '_full', '_full_file')
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        full_file = font_path(name)
+        if not os.path.exists(full_file):
+            full_file = font_path(DEFAULT_FONT)
+        self._full_file = full_file
+        self._full = None
+        subset_file = subset_path(name)
+        if os.path.exists(subset_file):
+            self._primary = _truetype(subset_file, size)
+        else:
+            # Pas de sous-ensemble : la face complète est la seule face
+            self._primary = self._full = _truetype(full_file, size)
+
+    @property
+    def full_loaded(self):
+        return self._full is not None
+
+    def covers(self, text):
+        """Indique si le texte peut être rendu avec la face principale."""
+        if self._full is self._primary or text.isascii():
+            return True
+        return all(in_subset(ord(char)) for char in text)
+
+    def resolve(self, text):
+        """Retourne la face Pillow à utiliser pour rendre ce texte."""
+        if self.covers(text):
+            return self._primary
+        if self._full is None:
+            self._full = _truetype(self._full_file, self.size)
+        return self._full
+
+    def getbbox(self, text, *args, **kwargs):
+        return self.resolve(text).getbbox(text, *args, **kwargs)
+
+
+def get_font(name, size):
+    """Retourne l'instance partagée pour une police et une taille.
+
+    Hors du fil principal, l'instance est propre au fil appelant.
+    """
+    fonts = _fonts
+    if threading.current_thread() is not threading.main_thread():
+        fonts = getattr(_thread_fonts, 'fonts', None)
+        if fonts is None:
+            fonts = _thread_fonts.fonts = dict()
+    key = (name, size)
+    font = fonts.get(key)
+    if font is None:
+        font = fonts[key] = FallbackFont(name, size)
+    return font
+
+
+def resolve_font(font, text):
+    """Face Pillow à passer à ImageDraw pour un texte donné."""
+    if isinstance(font, FallbackFont):
+        return font.resolve(text)
+    return font
+
+
+# ----------------------------------------------------------------------------
+# Construction des sous-ensembles (étape de build, nécessite fontTools)
+def build_subset(name):
+    """Écrit fonts/<nom>-subset.<ext> à partir de fonts/<nom>.<ext>."""
+    from fontTools import subset    # dépendance de build uniquement
+
+    options = subset.Options()
+    options.layout_features = ['*']
+    options.name_IDs = ['*']
+    options.notdef_outline = True
+    font = subset.load_font(font_path(name), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[cp for low, high in SUBSET_RANGES for cp in range(low, high + 1)])
+    subsetter.subset(font)
+    target = subset_path(name)
+    subset.save_font(font, target, options)
+    return target
+
+
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or ['msyh.ttf']
+    try:
+        import fontTools    # noqa: F401
+    except ImportError:
+        print('fontTools est nécessaire : sudo apt install python3-fonttools', file=sys.stderr)
+        return 1
+    for name in names:
+        if not os.path.exists(font_path(name)):
+            print('{} : police absente de {}'.format(name, FONTS_DIR), file=sys.stderr)
+            continue
+        target = build_subset(name)
+        print('{} -> {} ({} octets)'.format(name, target, os.path.getsize(target)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
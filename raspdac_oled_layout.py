@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Mise en page lue dans un fichier JSON ou TOML, rechargée sans redémarrage
+# Fichier : raspdac_oled_layout.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# Il peut aussi être lancé seul pour vérifier et compiler un fichier :
+#   python3 raspdac_oled_layout.py /etc/ohOled/layout.toml
+# ----------------------------------------------------------------------------
+"""Trames des pages lues dans un fichier (OHOLED_LAYOUT), sans redémarrage.
+
+Le fichier reprend la structure de ``frames`` (raspdac_oled_screen_frames.py),
+en JSON ou en TOML (selon son extension) :
+
+    [frames.INIT.manufacturer]
+    type = "text"
+    value = "Mon lecteur"
+    font_name = "arial.ttf"
+    font_size = 19
+    justify_xy = "CH"
+    x = 64
+    y = 0
+
+-> 'frames' : pages de l'écran 128x64, qui remplacent les pages de même nom
+   (une page absente garde sa trame d'origine) ; elles sont aussi mises à
+   l'échelle pour les écrans secondaires ;
+-> 'frame_sets' : pages propres à un jeu de trames d'écran secondaire
+   ('128x32', '256x64'...), appliquées en dernier.
+
+Le fichier est validé (pages et types d'objets connus, clefs obligatoires,
+polices présentes) puis compilé pour chaque écran en plans de rendu
+(PagePlan : objets dynamiques et calque des objets statiques, voir
+raspdac_oled_screen_display.py). Les plans sont enregistrés dans
+OHOLED_LAYOUT_CACHE sous l'empreinte SHA-256 des trames résolues, de la
+résolution de l'écran et des polices : au démarrage suivant, ils sont relus
+au lieu d'être compilés.
+
+Un fil d'exécution surveille le répertoire du fichier (inotify, appelé par
+ctypes ; à défaut, date de modification relue chaque seconde). Une nouvelle
+version est validée et compilée dans ce fil, puis la boucle principale la
+récupère ('take') et l'installe entre deux images. Un fichier invalide est
+signalé dans le journal et la mise en page en cours est conservée.
+
+Variables d'environnement :
+-> OHOLED_LAYOUT : fichier de mise en page (vide : trames d'origine)
+-> OHOLED_LAYOUT_CACHE : répertoire des plans compilés (vide : pas de cache)
+"""
+import base64
+import ctypes
+import ctypes.util
+import gzip
+import hashlib
+import json
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+
+from PIL import Image
+from PIL import features
+
+import raspdac_oled_fonts
+from raspdac_oled_screen_display import PagePlan
+from raspdac_oled_screen_display import compile_page
+from raspdac_oled_screen_frames import FRAMES_HEIGHT, FRAMES_WIDTH, X_KEYS, Y_KEYS
+from raspdac_oled_screen_frames import copy_frames, frames, frames_for, scale_frames
+from raspdac_oled_stats import count
+
+LAYOUT_PATH = os.environ.get('OHOLED_LAYOUT', '')
+LAYOUT_CACHE_DIR = os.environ.get('OHOLED_LAYOUT_CACHE', '/var/cache/ohOled/layouts')
+LAYOUT_CACHE_FILES = 8          # Nombre de plans compilés conservés dans le cache
+LAYOUT_CACHE_VERSION = 1        # A incrémenter si le format des plans change
+LAYOUT_POLL = 1.0               # Rythme (en secondes) de relecture de la date du fichier (sans inotify)
+LAYOUT_SETTLE = 0.2             # Délai (en secondes) après une écriture, avant relecture (éditeurs en plusieurs écritures)
+
+# Clefs obligatoires de chaque type d'objet
+REQUIRED_KEYS = {
+    'text' : ('font_name', 'font_size', 'justify_xy', 'x', 'y'),
+    'icon' : ('font_name', 'font_size', 'justify_xy', 'x', 'y'),
+    'scrolling' : ('font_name', 'font_size', 'justify_xy', 'x', 'y'),
+    'saver' : ('font_name', 'font_size', 'justify_xy', 'x', 'y'),
+    'rectangle' : ('xmin', 'ymin', 'xmax', 'ymax'),
+    'volume_bar' : ('connector', 'value_min', 'value_max', 'xmin', 'ymin', 'xmax', 'ymax'),
+    'elapsed_bar' : ('connector', 'xmin', 'ymin', 'xmax', 'ymax'),
+    'picture' : ('connector', 'x', 'y'),
+    'bars' : ('connector', 'xmin', 'ymin', 'xmax', 'ymax'),
+    }
+NUMBER_KEYS = X_KEYS + Y_KEYS + ('font_size', 'value_min', 'value_max', 'gap')
+FRAME_SET_NAME = re.compile(r'^\d+x\d+$')
+
+# Evénements inotify (linux/inotify.h) : fichier écrit puis fermé, ou remplacé par renommage
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (suivi du nom)
+
+
+class LayoutError(ValueError) :
+    pass
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Lecture et validation
+def parse_layout(data, path) :
+    try :
+        if path.endswith('.toml') :
+            import tomllib              # Python 3.11 et suivants
+            return tomllib.loads(data.decode('utf-8'))
+        return json.loads(data.decode('utf-8'))
+    except ImportError :
+        raise LayoutError('{} : lecture du TOML impossible (Python 3.11 ou JSON requis)'.format(path))
+    except ValueError as e :            # JSONDecodeError, TOMLDecodeError, UnicodeDecodeError
+        raise LayoutError('{} : {}'.format(path, e))
+
+
+def validate_object(where, object) :
+    if not isinstance(object, dict) :
+        raise LayoutError('{} : objet attendu'.format(where))
+    kind = object.get('type')
+    if kind not in REQUIRED_KEYS :
+        raise LayoutError("{} : type '{}' inconnu (choix : {})".format(where, kind, ', '.join(REQUIRED_KEYS)))
+    missing = [name for name in REQUIRED_KEYS[kind] if name not in object]
+    if kind in ('text', 'icon', 'scrolling', 'saver') and 'value' not in object and 'connector' not in object :
+        missing.append('value / connector')
+    if missing :
+        raise LayoutError('{} : clef(s) manquante(s) : {}'.format(where, ', '.join(missing)))
+    object = dict(object)
+    for name in NUMBER_KEYS :
+        if name in object and (isinstance(object[name], bool) or not isinstance(object[name], (int, float))) :
+            raise LayoutError('{}.{} : nombre attendu'.format(where, name))
+    if 'connector' in object :
+        connector = object['connector']
+        if not isinstance(connector, (list, tuple)) or len(connector) != 2 or not all(isinstance(part, str) for part in connector) :
+            raise LayoutError("{}.connector : [groupe, champ] attendu".format(where))
+        object['connector'] = tuple(connector)
+    if 'justify_xy' in object :
+        justify = object['justify_xy']
+        if not isinstance(justify, str) or len(justify) != 2 or justify[0] not in 'LCR' or justify[1] not in 'HCB' :
+            raise LayoutError("{}.justify_xy : deux lettres attendues (L, C ou R puis H, C ou B)".format(where))
+    if 'font_name' in object and not os.path.exists(raspdac_oled_fonts.font_path(object['font_name'])) :
+        raise LayoutError("{}.font_name : police '{}' absente de {}".format(where, object['font_name'], raspdac_oled_fonts.FONTS_DIR))
+    return object
+
+
+def validate_pages(where, pages) :
+    if not isinstance(pages, dict) :
+        raise LayoutError('{} : table des pages attendue'.format(where))
+    validated = dict()
+    for page, frame in pages.items() :
+        if page not in frames :
+            raise LayoutError("{}.{} : page inconnue (choix : {})".format(where, page, ', '.join(frames)))
+        if not isinstance(frame, dict) or not frame :
+            raise LayoutError('{}.{} : au moins un objet attendu'.format(where, page))
+        validated[page] = { key : validate_object('{}.{}.{}'.format(where, page, key), object) for key, object in frame.items() }
+    return validated
+
+
+def validate_layout(document) :
+    if not isinstance(document, dict) :
+        raise LayoutError('table attendue au premier niveau')
+    unknown = set(document) - {'frames', 'frame_sets'}
+    if unknown :
+        raise LayoutError('clef(s) inconnue(s) au premier niveau : {} (choix : frames, frame_sets)'.format(', '.join(sorted(unknown))))
+    frame_sets = document.get('frame_sets', {})
+    if not isinstance(frame_sets, dict) :
+        raise LayoutError('frame_sets : table attendue')
+    for name in frame_sets :
+        if not FRAME_SET_NAME.match(name) :
+            raise LayoutError("frame_sets.{} : nom 'LARGEURxHAUTEUR' attendu".format(name))
+    return { 'frames' : validate_pages('frames', document.get('frames', {})),
+             'frame_sets' : { name : validate_pages('frame_sets.' + name, pages) for name, pages in frame_sets.items() } }
+
+
+# Trames d'un écran : trames d'origine, pages 128x64 du fichier (mises à l'échelle) puis pages du jeu de l'écran
+def resolve_frames(layout, key, width, height) :
+    resolved = copy_frames(frames_for(width, height, key))
+    reference = '{}x{}'.format(FRAMES_WIDTH, FRAMES_HEIGHT)
+    if layout['frames'] :
+        resolved.update(layout['frames'] if key == reference else scale_frames(layout['frames'], width, height))
+    resolved.update(layout['frame_sets'].get(key, {}))
+    return resolved
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Cache des plans compilés (JSON compressé, écriture atomique)
+def file_size(path) :
+    try :
+        return os.path.getsize(path)
+    except OSError :                    # police absente (police de repli) ou pas de sous-ensemble
+        return None
+
+
+# Empreinte des plans : trames résolues, écran, polices (et sous-ensembles) et version de FreeType
+def plans_key(resolved, size, mode) :
+    fonts = sorted({ object['font_name'] for frame in resolved.values() for object in frame.values() if 'font_name' in object })
+    fonts = [(name, file_size(raspdac_oled_fonts.font_path(name)), file_size(raspdac_oled_fonts.subset_path(name))) for name in fonts]
+    description = json.dumps([LAYOUT_CACHE_VERSION, size, mode, fonts, features.version('freetype2'), resolved],
+                             sort_keys=True, ensure_ascii=False, default=list)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+def dump_plans(plans) :
+    return { page : { 'objects' : plan.objects,
+                      'layer' : base64.b64encode(plan.layer.tobytes()).decode('ascii') if plan.layer is not None else None }
+             for page, plan in plans.items() }
+
+
+def restore_plans(data, size, mode) :
+    plans = dict()
+    for page, saved in data.items() :
+        objects = saved['objects']
+        for object in objects.values() :
+            if 'connector' in object :
+                object['connector'] = tuple(object['connector'])
+        layer = Image.frombytes(mode, size, base64.b64decode(saved['layer'])) if saved['layer'] is not None else None
+        plans[page] = PagePlan(objects, layer)
+    return plans
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Surveillance du répertoire du fichier par inotify (ctypes) ; None si inotify est indisponible
+def inotify_watch(directory) :
+    try :
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0 :
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0 :
+            error = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(error, os.strerror(error))
+        return fd
+    except (OSError, AttributeError) as e :
+        print('ohOled: inotify indisponible pour {} ({}), relecture de la date du fichier'.format(directory, e), file=sys.stderr, flush=True)
+        return None
+
+
+# Noms des fichiers cités par une suite d'événements inotify
+def inotify_names(data) :
+    names = set()
+    offset = 0
+    while offset + _INOTIFY_EVENT.size <= len(data) :
+        _, _, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+        offset += _INOTIFY_EVENT.size
+        names.add(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+        offset += length
+    return names
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe du chargement de la mise en page
+# -> 'screens' : écrans à servir (OledScreen : jeu de trames, résolution et mode du périphérique)
+# -> 'load' retourne, pour chaque écran, (trames, plans) ; 'take' la dernière version rechargée par le fil de surveillance
+class LayoutLoader() :
+    def __init__(self, screens, path=LAYOUT_PATH, cache_dir=LAYOUT_CACHE_DIR) :
+        self.screens = [(screen.frames_key, screen.device.size, screen.device.mode) for screen in screens]
+        self.path = path
+        self.cache_dir = cache_dir
+        self.digest = None              # empreinte du dernier contenu lu (valide ou non)
+        self.pending = None             # version rechargée, pas encore installée
+        self.lock = threading.Lock()
+
+    def start(self) :
+        self.thread = threading.Thread(target=self.run, name='oholed-layout', daemon=True)
+        self.thread.start()
+
+    def take(self) :
+        with self.lock :
+            layout, self.pending = self.pending, None
+        return layout
+
+    # Lecture, validation et compilation du fichier ; None s'il est absent, invalide ou inchangé
+    def load(self) :
+        try :
+            with open(self.path, 'rb') as source :
+                data = source.read()
+        except OSError as e :
+            print('ohOled: mise en page {} illisible ({})'.format(self.path, e), file=sys.stderr, flush=True)
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == self.digest :
+            return None
+        self.digest = digest
+        time_load = time.monotonic()
+        try :
+            layout = validate_layout(parse_layout(data, self.path))
+        except LayoutError as e :
+            print('ohOled: mise en page {} refusée ({})'.format(self.path, e), file=sys.stderr, flush=True)
+            return None
+        result, compiled = [], 0
+        for key, size, mode in self.screens :
+            resolved = resolve_frames(layout, key, *size)
+            plans, fresh = self.plans(resolved, size, mode)
+            result.append((resolved, plans))
+            compiled += fresh
+        count('layout_loads')
+        print('ohOled: mise en page {} chargée ({} écran(s), {}, {:.2f} s)'.format(
+              self.path, len(result), 'compilée' if compiled else 'plans relus du cache', time.monotonic() - time_load),
+              file=sys.stderr, flush=True)
+        return result
+
+    # Plans d'un écran : relus du cache ou compilés (puis enregistrés) ; retourne (plans, compilés)
+    def plans(self, resolved, size, mode) :
+        key = plans_key(resolved, size, mode)
+        path = os.path.join(self.cache_dir, key + '.json.gz') if self.cache_dir else ''
+        if path and os.path.exists(path) :
+            try :
+                with gzip.open(path, 'rt', encoding='utf-8') as saved :
+                    return restore_plans(json.load(saved), size, mode), False
+            except (OSError, ValueError, KeyError) as e :
+                print('ohOled: plans de mise en page illisibles ({})'.format(e), file=sys.stderr, flush=True)
+        plans = { page : compile_page(frame, size, mode) for page, frame in resolved.items() }
+        if path :
+            self.save(path, plans)
+        return plans, True
+
+    def save(self, path, plans) :
+        temporary = '{}.tmp'.format(path)
+        try :
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with gzip.open(temporary, 'wt', encoding='utf-8', compresslevel=3) as output :
+                json.dump(dump_plans(plans), output, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temporary, path)
+            saved = sorted((entry.path for entry in os.scandir(self.cache_dir) if entry.name.endswith('.json.gz')),
+                           key=os.path.getmtime)
+            for old in saved[:-LAYOUT_CACHE_FILES] :        # anciennes versions
+                os.unlink(old)
+        except OSError as e :
+            print('ohOled: écriture des plans de mise en page impossible ({})'.format(e), file=sys.stderr, flush=True)
+
+    def reload(self) :
+        layout = self.load()
+        if layout is not None :
+            with self.lock :
+                self.pending = layout
+
+    # Fil de surveillance : inotify sur le répertoire du fichier, ou date de modification
+    def run(self) :
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd = inotify_watch(directory)
+        stamp = None
+        while True :
+            if fd is not None :
+                if name not in inotify_names(os.read(fd, 4096)) :
+                    continue
+                time.sleep(LAYOUT_SETTLE)
+                while select.select([fd], [], [], 0)[0] :       # événements des écritures suivantes
+                    os.read(fd, 4096)
+            else :
+                time.sleep(LAYOUT_POLL)
+                try :
+                    status = os.stat(self.path)
+                    current = (status.st_mtime_ns, status.st_size)
+                except OSError :
+                    current = None
+                if current == stamp :
+                    continue
+                stamp = current
+            self.reload()
+
+
+# ============================================================================
+# Vérification d'un fichier hors du démon
+# ============================================================================
+def main(argv=None) :
+    from raspdac_oled_screen_display import OledScreen, parse_displays
+    argv = argv if argv is not None else sys.argv[1:]
+    if not argv :
+        print('usage : raspdac_oled_layout.py FICHIER [périphérique:LARGEURxHAUTEUR ...]', file=sys.stderr)
+        return 2
+    screens = [OledScreen(backend='memory')]
+    for display in parse_displays(','.join(argv[1:])) :
+        screen = OledScreen('memory', display['width'], display['height'], display['rotate'])
+        screen.frames_key = display['frames'] or screen.frames_key
+        screens.append(screen)
+    loader = LayoutLoader(screens, path=argv[0])
+    return 0 if loader.load() is not None else 1
+
+
+if __name__ == '__main__' :
+    sys.exit(main())
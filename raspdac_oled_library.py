@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Index local de la bibliothèque musicale du serveur MPD
+# Fichier : raspdac_oled_library.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par la page 'BROWSE' (raspdac_oled_screen_browse.py)
+# ----------------------------------------------------------------------------
+"""Index local de la bibliothèque (artiste -> album -> titre).
+
+La navigation dans la bibliothèque depuis la télécommande ne doit pas
+attendre le serveur MPD : l'index est construit une fois, en tâche de fond
+et sur une connexion dédiée, par une seule requête
+
+    list title group track group album group artist
+
+puis écrit sur disque (JSON compressé, écriture atomique) dans
+``/var/cache/ohOled/library.json.gz``. Au démarrage, l'index enregistré est
+relu ; il n'est reconstruit que si la date de mise à jour de la base
+('db_update' de la commande 'stats') a changé.
+
+L'index est fait de listes triées : ``artists[i]`` est le nom d'un artiste,
+``albums[i][j]`` le nom d'un de ses albums et ``tracks[i][j]`` la liste des
+titres de cet album (dans l'ordre des plages). Un index de 100 000 titres
+occupe quelques Mo et se relit en une fraction de seconde.
+
+La recherche par les touches numériques (T9) utilise un second index
+(SearchIndex), construit en tâche de fond après chaque index : un tableau
+trié d'entiers, un par début de mot des noms d'artistes, d'albums et de
+titres, qui code les chiffres T9 du nom (en base 11, 11 chiffres au plus)
+et la référence de l'entrée. Les noms commençant par une suite de chiffres
+sont un intervalle du tableau, trouvé par deux recherches dichotomiques
+(bisect), pour 13 octets par mot indexé. Un nom dont plusieurs mots
+commencent par les chiffres tapés n'est retourné qu'une fois : l'octet
+ajouté à chaque mot (préfixe commun avec les mots précédents du nom) écarte
+les doublons par un simple 'translate' de l'intervalle (SearchResults).
+Une touche coûte quelques microsecondes, et moins d'une milliseconde pour
+un intervalle de 100 000 mots.
+
+Variables d'environnement :
+-> OHOLED_LIBRARY_INDEX : fichier de l'index (vide pour ne pas l'enregistrer)
+"""
+import bisect
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+
+from raspdac_oled_request_mpd import MpdServer
+from raspdac_oled_request_mpd import parse_fields
+from raspdac_oled_stats import count
+
+LIBRARY_INDEX = os.environ.get('OHOLED_LIBRARY_INDEX', '/var/cache/ohOled/library.json.gz')
+LIBRARY_CHECK_PERIOD = 300      # Rythme (en secondes) de vérification de 'db_update'
+LIBRARY_TIMEOUT = 120.0         # Attente maximale (en secondes) de la réponse du serveur pour la liste complète
+UNKNOWN = '(inconnu)'           # Artiste ou album absent des tags
+
+
+# Clef de tri : sans distinction de casse ni article initial ("The Beatles" avec les B)
+def sort_key(name) :
+    name = name.casefold()
+    for article in ('the ', 'les ', 'le ', 'la ', "l'") :
+        if name.startswith(article) :
+            return name[len(article):]
+    return name
+
+
+# Construction de l'index à partir de la réponse à 'list title group track group album group artist'
+# -> le serveur n'écrit une valeur de groupe que lorsqu'elle change : elle s'applique aux titres suivants
+def build_index(answer) :
+    library = dict()                # artiste -> album -> [(plage, titre)]
+    artist = album = UNKNOWN
+    track = 0
+    for line in answer.split('\n') :
+        key, separator, value = line.partition(': ')
+        if not separator :
+            continue
+        if key == 'Artist' :
+            artist, album, track = value or UNKNOWN, UNKNOWN, 0
+        elif key == 'Album' :
+            album, track = value or UNKNOWN, 0
+        elif key == 'Track' :
+            number = value.split('/', 1)[0]
+            track = int(number) if number.isdigit() else 0
+        elif key == 'Title' :
+            library.setdefault(artist, dict()).setdefault(album, []).append((track, value))
+    artists = sorted(library, key=sort_key)
+    albums = [sorted(library[artist], key=sort_key) for artist in artists]
+    tracks = [[[title for _, title in sorted(library[artist][album])] for album in albums[index]]
+              for index, artist in enumerate(artists)]
+    return artists, albums, tracks
+
+
+# ----------------------------------------------------------------------------
+# Recherche T9 : 2 = abc, 3 = def... 9 = wxyz, 0 = espace ; les chiffres se tapent tels quels
+T9_LETTERS = ('0 ', '1', '2abc', '3def', '4ghi', '5jkl', '6mno', '7pqrs', '8tuv', '9wxyz')
+T9_TABLE = str.maketrans({ char : digit[0] for digit in T9_LETTERS for char in digit })
+SEARCH_DIGITS = 11              # Nombre de chiffres T9 indexés par entrée (au-delà, la recherche ignore la fin)
+REF_BITS = 22                   # Bits réservés à la référence de l'entrée (artistes + albums + titres < 4 millions)
+INDEX_BITS = 32                 # Bits de l'album d'un artiste et de la plage d'un album (un album '(inconnu)' peut tout contenir)
+INDEX_MASK = (1 << INDEX_BITS) - 1
+BASE11 = str.maketrans('0123456789', '123456789a')     # chiffre T9 -> chiffre en base 11 (0 : fin du nom)
+WORDS = re.compile(r'\w+')
+NON_DIGITS = re.compile(r'[^0-9]')
+KEPT_TABLES = [bytes(int(shared < length) for shared in range(256)) for length in range(SEARCH_DIGITS + 1)]   # chiffres tapés -> entrée gardée
+
+# Texte normalisé d'un nom : minuscules, sans accents
+def normalise(name) :
+    name = name.casefold()
+    if name.isascii() :
+        return name
+    return ''.join(char for char in unicodedata.normalize('NFKD', name) if not unicodedata.combining(char))
+
+# Chiffres T9 d'un texte normalisé (caractères sans touche ignorés : ponctuation, CJK...)
+def t9_digits(text) :
+    return NON_DIGITS.sub('', text.translate(T9_TABLE))
+
+# Codage d'une suite de chiffres T9 en entier (ordre des entiers = ordre des préfixes)
+def t9_code(digits) :
+    return int(digits[:SEARCH_DIGITS].translate(BASE11).ljust(SEARCH_DIGITS, '0'), 11)
+
+
+# Index de recherche T9 sur les artistes, albums et titres d'un index de la bibliothèque
+# -> une entrée par mot distinct d'un nom : 'beat' (2328) trouve "The Beatles"
+# -> référence r : artiste r, album r - A ou titre r - A - B (A artistes, B albums), voir 'entry'
+class SearchIndex() :
+    def __init__(self, artists, albums, tracks) :
+        self.data = (artists, albums, tracks)   # index de la bibliothèque correspondant
+        self.album_refs = array('Q')    # album n -> artiste << INDEX_BITS | album
+        self.track_refs = array('Q')    # titre n -> album n << INDEX_BITS | plage
+        names = list(artists)
+        for artist, artist_albums in enumerate(albums) :
+            for album, name in enumerate(artist_albums) :
+                self.album_refs.append(artist << INDEX_BITS | album)
+                names.append(name)
+        for album_number, album_ref in enumerate(self.album_refs) :
+            for track, name in enumerate(tracks[album_ref >> INDEX_BITS][album_ref & INDEX_MASK]) :
+                self.track_refs.append(album_number << INDEX_BITS | track)
+                names.append(name)
+        # au-delà de 2 ** REF_BITS noms, les derniers titres ne sont pas indexés (la référence déborderait sur la clef)
+        self.dropped = max(0, len(names) - (1 << REF_BITS))
+        del names[1 << REF_BITS:]
+        packed = []
+        for ref, name in enumerate(names) :
+            words = WORDS.findall(normalise(name))
+            keys = []
+            for start, word in enumerate(words) :
+                # les mots suivants prolongent la clef jusqu'à SEARCH_DIGITS chiffres
+                digits = t9_digits(' '.join(words[start:start + SEARCH_DIGITS // 2]))[:SEARCH_DIGITS]
+                if not digits or digits in keys :
+                    continue
+                # préfixe commun le plus long avec une clef précédente du même nom (voir 'find')
+                shared = max((len(os.path.commonprefix((key, digits))) for key in keys), default=0)
+                keys.append(digits)
+                packed.append((t9_code(digits) << REF_BITS | ref) << 4 | shared)
+        packed.sort()
+        self.entries = array('q', (value >> 4 for value in packed))
+        self.shared = array('B', (value & 0xF for value in packed))
+        self.album_offset = len(artists)
+        self.track_offset = len(artists) + len(self.album_refs)
+
+    # Rangs des entrées dont le nom (ou un mot du nom) commence par les chiffres donnés, un seul rang par nom
+    # -> intervalle [début, fin[ trouvé par deux recherches dichotomiques
+    # -> une entrée dont le préfixe commun avec une clef précédente du même nom couvre les chiffres tapés est
+    #    écartée : ce nom est déjà trouvé par cette clef ("Beat Beatles" : 'beat' mais pas 'beatles' pour 2328)
+    def find(self, digits) :
+        digits = digits[:SEARCH_DIGITS]
+        low = t9_code(digits)
+        high = low + 11 ** (SEARCH_DIGITS - len(digits))
+        first = bisect.bisect_left(self.entries, low << REF_BITS)
+        last = bisect.bisect_left(self.entries, high << REF_BITS)
+        return SearchResults(first, self.shared[first:last].tobytes().translate(KEPT_TABLES[len(digits)]))
+
+    # Entrée n du tableau : (niveau, artiste, album, plage) avec niveau 0 (artiste), 1 (album) ou 2 (titre)
+    def entry(self, position) :
+        ref = self.entries[position] & ((1 << REF_BITS) - 1)
+        if ref < self.album_offset :
+            return 0, ref, 0, 0
+        if ref < self.track_offset :
+            album_ref = self.album_refs[ref - self.album_offset]
+            return 1, album_ref >> INDEX_BITS, album_ref & INDEX_MASK, 0
+        track_ref = self.track_refs[ref - self.track_offset]
+        album_ref = self.album_refs[track_ref >> INDEX_BITS]
+        return 2, album_ref >> INDEX_BITS, album_ref & INDEX_MASK, track_ref & INDEX_MASK
+
+
+# Résultats d'une recherche : rang n -> entrée de l'index de recherche
+# -> 'kept' : un octet par entrée de l'intervalle, 1 si l'entrée est gardée (0 : doublon d'une autre clef du même nom)
+# -> le rang est retrouvé à partir du dernier rang demandé (la sélection avance ou recule pas à pas)
+class SearchResults() :
+    def __init__(self, first, kept) :
+        self.first = first
+        self.kept = kept
+        self.length = kept.count(1)
+        self.cursor = (-1, -1)          # (rang, décalage dans l'intervalle) du dernier rang demandé
+
+    def __len__(self) :
+        return self.length
+
+    def __getitem__(self, rank) :
+        if not 0 <= rank < self.length :
+            raise IndexError(rank)
+        if self.length == len(self.kept) :
+            return self.first + rank
+        current, offset = self.cursor
+        while current < rank :
+            offset = self.kept.index(1, offset + 1)
+            current += 1
+        while current > rank :
+            offset = self.kept.rindex(1, 0, offset)
+            current -= 1
+        self.cursor = (current, offset)
+        return self.first + offset
+
+
+# ----------------------------------------------------------------------------
+# Classe de l'index de la bibliothèque
+# -> la boucle principale ne lit que 'data' = (artists, albums, tracks), remplacé d'un bloc à chaque reconstruction
+# -> 'refresh' demande une vérification de 'db_update' au fil d'exécution dédié
+class LibraryIndex() :
+    def __init__(self, path=LIBRARY_INDEX, server=MpdServer, check_period=LIBRARY_CHECK_PERIOD) :
+        self.path = path
+        self.server = server            # constructeur de la connexion dédiée (None : index vide, rejeu)
+        self.check_period = check_period
+        self.db_update = None           # date de mise à jour de la base correspondant à l'index
+        self.data = ([], [], [])        # (artists, albums, tracks)
+        self.search = None              # index de recherche T9 (SearchIndex) de 'data'
+        self.state = 'loading'          # 'loading', 'building' ou 'ready'
+        self.version = 0                # incrémenté à chaque nouvel index (pages et recherches dérivées)
+        self.time_check = 0.0
+        self.wakeup = threading.Event()
+        if server is None :
+            self.state = 'ready'
+            return
+        self.thread = threading.Thread(target=self.run, name='oholed-library', daemon=True)
+        self.thread.start()
+
+    @property
+    def ready(self) :
+        return self.state == 'ready' or bool(self.data[0])
+
+    # Demande de vérification (ouverture de la page, ou rythme 'check_period')
+    def refresh(self, force=False) :
+        if force or time.monotonic() - self.time_check >= self.check_period :
+            self.time_check = time.monotonic()
+            self.wakeup.set()
+
+    # Fil d'exécution dédié : une erreur (réponse inattendue du serveur...) est écrite, le fil attend la vérification suivante
+    def run(self) :
+        self.load()
+        while True :
+            try :
+                self.check()
+            except Exception as e :
+                self.state = 'ready' if self.db_update is not None else 'loading'
+                print('ohOled: index de la bibliothèque non mis à jour ({!r})'.format(e), file=sys.stderr, flush=True)
+            if self.state == 'ready' :
+                try :
+                    self.build_search()
+                except Exception as e :
+                    print('ohOled: index de recherche non construit ({!r})'.format(e), file=sys.stderr, flush=True)
+            self.wakeup.wait()
+            self.wakeup.clear()
+
+    # Lecture de l'index enregistré
+    def load(self) :
+        if not self.path or not os.path.exists(self.path) :
+            return
+        try :
+            with gzip.open(self.path, 'rt', encoding='utf-8') as saved :
+                data = json.load(saved)
+            self.install(data['db_update'], data['artists'], data['albums'], data['tracks'])
+        except (OSError, ValueError, KeyError) as e :
+            print('ohOled: index de la bibliothèque illisible ({})'.format(e), file=sys.stderr, flush=True)
+
+    def install(self, db_update, artists, albums, tracks) :
+        self.data = (artists, albums, tracks)
+        self.db_update = db_update
+        self.version += 1
+        self.state = 'ready'
+
+    # Index de recherche (plus long à construire : la navigation est disponible avant)
+    def build_search(self) :
+        if self.search is not None and all(built is current for built, current in zip(self.search.data, self.data)) :
+            return
+        time_search = time.monotonic()
+        self.search = SearchIndex(*self.data)
+        print('ohOled: index de recherche construit ({} mots, {:.1f} s)'.format(
+              len(self.search.entries), time.monotonic() - time_search), file=sys.stderr, flush=True)
+        if self.search.dropped :
+            print('ohOled: index de recherche limité à {} noms ({} titres non indexés)'.format(
+                  1 << REF_BITS, self.search.dropped), file=sys.stderr, flush=True)
+
+    # Vérification de 'db_update' et reconstruction si la base a changé
+    def check(self) :
+        mpd = self.server()
+        mpd.connect()
+        try :
+            if mpd.socket_status == 'KO' :
+                return
+            stats = parse_fields(mpd.command('stats\n') or '')
+            db_update = stats.get('db_update')
+            if db_update is None or db_update == self.db_update :
+                self.state = 'ready' if self.db_update is not None else self.state
+                return
+            self.state = 'building'
+            time_build = time.monotonic()
+            mpd.socket.settimeout(LIBRARY_TIMEOUT)
+            mpd.bufsize = 65536
+            answer = mpd.command('list title group track group album group artist\n')
+            if answer is None :
+                self.state = 'ready' if self.db_update is not None else 'loading'
+                return
+            self.install(db_update, *build_index(answer))
+            count('library_builds')
+            print('ohOled: index de la bibliothèque construit ({} titres, {:.1f} s)'.format(
+                  sum(len(titles) for albums in self.data[2] for titles in albums), time.monotonic() - time_build),
+                  file=sys.stderr, flush=True)
+            self.save()
+        finally :
+            mpd.socket.close()
+
+    # Ecriture atomique de l'index
+    def save(self) :
+        if not self.path :
+            return
+        temporary = '{}.tmp'.format(self.path)
+        try :
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            artists, albums, tracks = self.data
+            with gzip.open(temporary, 'wt', encoding='utf-8', compresslevel=3) as output :
+                json.dump({ 'db_update' : self.db_update, 'artists' : artists, 'albums' : albums,
+                            'tracks' : tracks }, output, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temporary, self.path)
+        except OSError as e :
+            print("ohOled: écriture de l'index de la bibliothèque impossible ({})".format(e), file=sys.stderr, flush=True)
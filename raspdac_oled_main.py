@@ -75,34 +75,80 @@
             Quand l'entrée I2S est sélectionnée, alternance entre :
             -> Page I2S-PLAY1 : Affichage Artiste + Album 
             -> Page I2S-PLAY2 : Affichage Titre + Freq. Echantillonnage
+            -> Page I2S-COVER : Pochette de l'album (OHOLED_COVER=1)
     -> Les pages ci-dessus peuvent être détournées temporairement
             -> Page VOLUME : affichage du volume quand il est modifié
             -> Page SAVER : affichage après une période d'inactivité
     -> L'appui de la touche 'MENU' de la télécommande infrarouge permet
        d'activer une page 'MENU' permettant de configurer le pilote ALSA
+    -> Une autre touche (KEY_INFO par défaut) active la page 'QUEUE'
+       affichant la file d'attente du serveur MPD
+    -> Une autre touche (KEY_MEDIA par défaut) active la page 'BROWSE'
+       de navigation dans la bibliothèque (artiste, album, titre)
+    -> Les touches numériques activent la page 'SEARCH' de recherche
+       dans la bibliothèque (saisie T9)
+    -> Une autre touche (KEY_AUDIO par défaut) active les pages 'SPECTRUM'
+       et 'VUMETER' (signal lu sur la sortie 'fifo' de MPD, 30 images/s)
+    -> Les connecteurs (état MPD, menu, flux du DAC) sont servis en JSON
+       sur un socket UNIX (OHOLED_STATE_SOCKET) aux autres programmes
+    -> Les images envoyées à l'écran peuvent être copiées sur un autre socket
+       UNIX (OHOLED_MIRROR_SOCKET, voir raspdac_oled_mirror.py)
+    -> Les mêmes pages peuvent être affichées sur des écrans secondaires
+       (OHOLED_SECONDARY_DISPLAYS : écran I2C 128x32, façade SSD1322 256x64...)
+       avec leurs propres résolution, rotation et trames
+    -> Les trames des pages peuvent être lues dans un fichier JSON ou TOML
+       (OHOLED_LAYOUT), rechargé sans redémarrage à chaque modification
+    -> Les changements entre les pages de lecture et la page 'VOLUME' sont
+       animés (glissement, balayage ou fondu, OHOLED_TRANSITION)
 """
 # ============================================================================
 # IMPORT (Librairies / classes / Fonctions utilisées par ce script)
 # ============================================================================
+import time
+PROCESS_START = time.monotonic()    # Référence des mesures de temps de démarrage
+
 import sys
 import os
-import time
+import argparse
+import select
+import atexit
+import signal
 import traceback
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-from raspdac_oled_request_os import RaspdacIP
+from raspdac_oled_clock import SystemClock
 
+from raspdac_oled_startup import Backoff
+from raspdac_oled_startup import StartupTimer
+from raspdac_oled_startup import sd_notify
+from raspdac_oled_startup import wait_for_socket
+
+from raspdac_oled_request_mpd import MPD_HOST
+from raspdac_oled_request_mpd import MPD_PORT
 from raspdac_oled_request_mpd import MpdServer
+from raspdac_oled_request_mpd import NextSongPrefetcher
 from raspdac_oled_request_mpd import mpd_data_processing
 
-from raspdac_oled_screen_menu import PageMenu
-from raspdac_oled_screen_menu import AlsaMixer
-
-from raspdac_oled_telecommand import InfraRedTelecommand
-
 from raspdac_oled_screen_display import OledScreen
+from raspdac_oled_screen_display import ScreenGroup
+from raspdac_oled_screen_display import SECONDARY_DISPLAYS
+from raspdac_oled_screen_display import parse_displays
 from raspdac_oled_screen_display import icons
 
+from raspdac_oled_stats import KeyTraces
+from raspdac_oled_stats import LoopStats
+from raspdac_oled_stats import count
+
+from raspdac_oled_metrics import MetricsExporter
+from raspdac_oled_profiler import SamplingProfiler
+
+import raspdac_oled_fonts
+
+# Les collecteurs (IP, mixer ALSA et tables du menu, télécommande) ne sont pas
+# nécessaires à la page 'INIT' : ils sont importés après son affichage (voir main)
+
+IMPORTS_END = time.monotonic()      # Fin des imports nécessaires à la première page
+
 # ============================================================================
 # INITIALISATIONS
 # ============================================================================
@@ -113,6 +159,7 @@ page_duration['INIT'] = 10      # Durée d'affichage de la page 'INIT' à la mis
 page_duration['IP-INIT'] = 10   # Durée d'affichage de la page 'IP' à la mise sous tension
 page_duration['I2S-PLAY1'] = 15 # Durée d'affichage la page 'I2S-PLAY1' avant de basculer sur la page 'I2S-PLAY2'
 page_duration['I2S-PLAY2'] = 10 # Durée d'affichage la page 'I2S-PLAY2' avant de basculer sur la page 'I2S-PLAY1'
+page_duration['I2S-COVER'] = 10 # Durée d'affichage la page 'I2S-COVER' (si l'album a une pochette) avant de revenir à la page 'I2S-PLAY1'
 page_duration['VOLUME'] = 4     # Durée d'affichage de la page 'VOLUME' en cas de changement du volume
 page_inactivity = 240           # Durée d'inactivité avant de basculer sur la page 'SAVER'
 
@@ -120,6 +167,14 @@ page_inactivity = 240           # Durée d'inactivité avant de basculer sur la
 IP_PERIOD = 5                   # Rythme d'interrogation (en secondes) pour récupérer l'adresse IP du Raspdac Mini
 MIXER_PERIOD = 1                # Rythme d'interrogation (en secondes) du pilote ALSA 
                                 # -> permet de récupérer l'entrée sélectionnée (I2S ou SPDIF), le status du "Mute" et le Filtre FIR sélectionné
+HW_PARAMS_PERIOD = 1            # Rythme d'interrogation (en secondes) du flux envoyé au DAC (/proc/asound)
+MPD_WAIT = 30                   # Attente maximale (en secondes) du serveur MPD au démarrage
+LOOP_PERIOD = float(os.environ.get('OHOLED_LOOP_PERIOD', '0.2'))  # Durée cible d'un passage dans la boucle (0 : pleine vitesse, pour les mesures)
+
+# Veille en page 'SAVER'
+IDLE_MODE = os.environ.get('OHOLED_IDLE', 'off')                # 'off' (écran éteint), 'dim' (contraste minimal) ou 'saver' (point balayant l'écran, sans veille)
+IDLE_PERIOD = float(os.environ.get('OHOLED_IDLE_PERIOD', '2'))  # Durée d'un passage dans la boucle en veille (attente d'événements entre deux passages)
+IDLE_IP_PERIOD = 60             # Rythme d'interrogation (en secondes) de l'adresse IP en veille
 
 # Classe pour la machine d'état du séquenceur de la boucle principale
 class StateMachine() :
@@ -148,42 +203,257 @@ class StateMachine() :
 
 # Classe pour asservir la durée de la boucle principale à 0.2s (soit 5 passages dans la boucle par seconde)
 class LoopPeriod() :
-    def __init__(self) :
-        self.loop_time = float(time.time())
-        self.loop_period_target = 0.2       # Durée cible exprimée en seconde pour 1 passage dans la boucle principale
+    def __init__(self, clock=None) :
+        self.clock = clock or SystemClock() # horloge réelle ou virtuelle (rejeu)
+        self.loop_time = float(self.clock.time())
+        self.loop_period_target = LOOP_PERIOD   # Durée cible exprimée en seconde pour 1 passage dans la boucle principale
 
     # Prise du temps en début de boucle
     def begin(self) :
-        self.loop_time = float(time.time())
+        self.loop_time = float(self.clock.time())
     
     # Asservissement en fin de boucle
-    def adjust(self) :
-        loop_end = float(time.time())
+    # -> 'target' remplace la durée cible (veille), 'wait' remplace l'attente (attente d'événements)
+    # -> retourne la durée du passage dans la boucle (hors attente)
+    def adjust(self, target=None, wait=None) :
+        loop_end = float(self.clock.time())
         loop_period = (loop_end - self.loop_time)
-        loop_sleep = self.loop_period_target - loop_period
-        # print("loop_sleep =",loop_sleep)
+        loop_sleep = (self.loop_period_target if target is None else target) - loop_period
         if loop_sleep < 0.0 :
             loop_sleep = 0.0
-        time.sleep(loop_sleep)
+        (wait or self.clock.sleep)(loop_sleep)
+        return loop_period
+
+# Classe pour la veille de l'écran en page 'SAVER'
+# -> l'écran est éteint ('off') ou son contraste réduit au minimum ('dim') : aucune image envoyée en mode 'off',
+#    une seule (figée) en mode 'dim'
+# -> la boucle ne passe plus que toutes les IDLE_PERIOD secondes et attend entre deux passages
+#    une touche de la télécommande ou un changement signalé par le serveur MPD (commande 'idle')
+class IdleMode() :
+    def __init__(self, mode=IDLE_MODE) :
+        self.mode = mode
+        self.active = False
+        self.shown = False              # image envoyée depuis la mise en veille (figée ensuite en mode 'dim')
+
+    def enter(self, screen) :
+        if self.mode != 'saver' and not self.active :
+            screen.sleep(self.mode)
+            self.active = True
+            self.shown = False
+
+    def leave(self, screen) :
+        if self.active :
+            screen.wake()
+            self.active = False
+
+    # Plus d'envoi vers l'écran : écran éteint, ou image figée au contraste minimal
+    @property
+    def frozen(self) :
+        return self.active and (self.mode == 'off' or self.shown)
+
+    # Attente d'un événement pendant au plus 'timeout' secondes
+    def wait(self, timeout, telecommand, mpd) :
+        sockets = []
+        if getattr(telecommand, 'socket', None) is not None :
+            sockets.append(telecommand.socket)
+        mpd.idle()
+        if mpd.idling :
+            sockets.append(mpd.socket)
+        try :
+            readable = select.select(sockets, [], [], timeout)[0]
+        except (OSError, ValueError) :      # socket fermé entre-temps
+            readable = []
+        if telecommand is not None and getattr(telecommand, 'socket', None) in readable :
+            telecommand.arrived()
+        mpd.noidle(changed=(mpd.socket in readable))
+
+# Attente d'une touche de la télécommande pendant au plus 'timeout' secondes (True si une touche est arrivée)
+def key_pending(telecommand, timeout) :
+    sock = getattr(telecommand, 'socket', None)
+    if sock is None :
+        time.sleep(timeout)
+        return False
+    try :
+        readable = bool(select.select([sock], [], [], timeout)[0])
+    except (OSError, ValueError) :          # socket fermé entre-temps
+        return False
+    if readable :
+        telecommand.arrived()
+    return readable
+
+# Animation pendant l'attente de fin de boucle (spectre / vumètre, transition entre deux pages) : 'draw' est appelé toutes les 'period' secondes,
+# sans collecte des données, jusqu'à la fin de l'attente ; une touche termine l'attente (traitée au passage suivant)
+# -> 'draw' retourne False lorsque l'animation est terminée (attente des touches jusqu'à la fin de la durée restante)
+def animate(timeout, period, draw, telecommand) :
+    time_end = time.monotonic() + timeout
+    time_frame = time.monotonic()
+    while True :
+        time_frame = time_frame + period if draw else time_end
+        if key_pending(telecommand, max(0.0, min(time_frame, time_end) - time.monotonic())) :
+            return
+        if time.monotonic() >= time_end :
+            return
+        if not draw() :
+            draw = None
 
 # ============================================================================
 # PROGRAMME PRINCIPAL
 # ============================================================================
-try:
+def parse_arguments(argv=None) :
+    parser = argparse.ArgumentParser(description="Gestion de l'écran OLED du Raspdac Mini")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="écrit dans le journal le détail des temps de démarrage (imports, polices, écran, MPD)")
+    parser.add_argument('--display', default=None,
+                        help="périphérique d'affichage : ssd1306 (défaut), dummy, memory, png ou gif (voir OHOLED_DISPLAY)")
+    parser.add_argument('--record', metavar='FICHIER',
+                        help="enregistre les entrées (MPD, ALSA, IP, télécommande) dans un fichier .gz")
+    parser.add_argument('--replay', metavar='FICHIER',
+                        help="rejoue un enregistrement avec une horloge virtuelle, sans matériel ni serveur MPD")
+    parser.add_argument('--replay-render', choices=('all', 'transitions', 'none'), default='transitions',
+                        help="images dessinées pendant le rejeu (défaut : la première de chaque page)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) :
+    args = parse_arguments(argv)
+    signal.signal(signal.SIGTERM, lambda signum, frame : sys.exit(0))  # arrêt propre (captures, fichiers temporaires)
+
+    # Démarrage par étapes :
+    # 1) ouverture de l'écran et affichage immédiat de la page 'INIT'
+    # 2) initialisation en parallèle des collecteurs (IP, mixer ALSA, télécommande)
+    #    pendant l'attente du serveur MPD (délai croissant plutôt qu'une attente fixe)
+    # 3) notification de systemd (READY=1) une fois la première page complète affichée
+    startup = StartupTimer(PROCESS_START)
+    startup.add('imports', IMPORTS_END - PROCESS_START)
+    replay = None
+    if args.replay :
+        from raspdac_oled_replay import Replay
+        replay = Replay(args.replay, render=args.replay_render)
+    clock = replay.clock if replay else SystemClock()
+    # initialisation de l'écran OLED du Raspdac Mini et des écrans secondaires éventuels (OHOLED_SECONDARY_DISPLAYS)
+    screen = ScreenGroup(OledScreen(backend=args.display), parse_displays(SECONDARY_DISPLAYS))
+    startup.add("ouverture de l'écran", screen.device_open_time)
+    loop_period = LoopPeriod(clock)         # initialisation du contrôle de la durée de la boucle principale
+    stats = LoopStats(loop_period.loop_period_target)   # durées des étapes de la boucle (rapport sur SIGUSR1)
+    stats.install_signal()
+    stats.install_reset_signal()
+    key_traces = KeyTraces(stats)                       # latence touche -> écran
+    idle = IdleMode()                       # veille de l'écran en page 'SAVER'
+    metrics = MetricsExporter()             # export des compteurs (fichier texte Prometheus)
+    profiler = SamplingProfiler()           # profilage à la demande (SIGUSR2)
+    profiler.install_signal()
+    screen.affichage_page('INIT', dict(), True, loop_period.loop_period_target)
+    startup.log('premier pixel')
+    sd_notify('STATUS=Initialisation')
+
+    # Imports différés des collecteurs
+    time_import = time.monotonic()
+    from raspdac_oled_request_os import RaspdacIP
+    from raspdac_oled_request_os import AlsaHwParams, HW_PARAMS_DIR
+    from raspdac_oled_screen_menu import PageMenu
+    from raspdac_oled_screen_menu import AlsaMixer
+    from raspdac_oled_screen_queue import PageQueue
+    from raspdac_oled_screen_browse import PageBrowse
+    from raspdac_oled_screen_search import PageSearch
+    from raspdac_oled_library import LibraryIndex
+    from raspdac_oled_cover import CoverArt, COVER_ENABLED
+    from raspdac_oled_state_api import StateApi, STATE_SOCKET
+    from raspdac_oled_mirror import FrameMirror, MIRROR_SOCKET
+    from raspdac_oled_layout import LayoutLoader, LAYOUT_PATH
+    from raspdac_oled_transitions import PageTransition
+    try :
+        from raspdac_oled_screen_visualiser import PageVisualiser
+    except ImportError :                # NumPy absent : pas de vumètre ni de spectre
+        PageVisualiser = None
+    from raspdac_oled_telecommand import InfraRedTelecommand
+    startup.add('imports (collecteurs)', time.monotonic() - time_import)
+
+    if replay :
+        # Rejeu : collecteurs de substitution pilotés par l'enregistrement
+        raspdac, mixer, telecommand = replay.raspdac, replay.mixer, replay.telecommand
+        mpd_server = replay.mpd_server
+    else :
+        with ThreadPoolExecutor(max_workers=4) as pool :
+            mpd_ready = pool.submit(wait_for_socket, (MPD_HOST, MPD_PORT), MPD_WAIT)
+            raspdac_init = pool.submit(RaspdacIP)                   # initialisation de l'adresse IP du Raspdac Mini
+            mixer_init = pool.submit(AlsaMixer)                     # initialisation du mixer ALSA
+            telecommand_init = pool.submit(InfraRedTelecommand)     # initialisation télécommande infra-rouge
+            raspdac = raspdac_init.result()
+            mixer = mixer_init.result()
+            telecommand = telecommand_init.result()
+            mpd_ready.result()
+        mpd_server = MpdServer
+    if args.record :
+        # Enregistrement : chaque collecteur est enveloppé pour écrire ses réponses
+        from raspdac_oled_replay import Recorder, RecordingIP, RecordingMixer, RecordingTelecommand, RecordingMpd
+        recorder = Recorder(args.record, clock)
+        atexit.register(recorder.close)
+        raspdac = RecordingIP(raspdac, recorder)
+        mixer = RecordingMixer(mixer, recorder)
+        telecommand = RecordingTelecommand(telecommand, recorder)
+        mpd_server = lambda server=mpd_server : RecordingMpd(server(), recorder)
+    startup.mark('collecteurs')
+    hw_params = AlsaHwParams('' if replay else HW_PARAMS_DIR)  # flux réellement reçu par le DAC (pas d'accès à /proc en rejeu)
+    prefetch = None if replay else NextSongPrefetcher()    # lecture anticipée du titre suivant (connexion MPD dédiée)
+    cover = CoverArt() if COVER_ENABLED and not replay else None   # pochettes d'album (connexion MPD dédiée)
+    state_api = StateApi() if STATE_SOCKET and not replay else None    # état courant servi en JSON aux autres programmes
+    if state_api : atexit.register(state_api.close)
+    if MIRROR_SOCKET :                      # copie des images de l'écran pour le diagnostic à distance
+        screen.mirror = FrameMirror(screen.oled_width, screen.oled_height)
+        atexit.register(screen.mirror.close)
+    layouts = LayoutLoader(screen.screens) if LAYOUT_PATH else None    # mise en page lue dans un fichier
+    if layouts :
+        layout = layouts.load()             # plans relus du cache ou compilés (trames d'origine si le fichier est invalide)
+        if layout is not None :
+            screen.load_layout(layout)
+        if not replay :
+            layouts.start()                 # rechargement à chaque modification du fichier
+        startup.mark('mise en page')
 
-    # Initialisations au boot du Raspdac Mini
-    screen = OledScreen()                   # initialisation de l'écran OLED du Raspdac Mini
-    loop_period = LoopPeriod()              # initialisation du contrôle de la durée de la boucle principale
-    raspdac = RaspdacIP()                   # initialisation de l'adresse IP du Raspdac Mini
-    mixer = AlsaMixer()                     # initialisation du mixer ALSA
     menu = PageMenu()                       # initialisation du menu activé par la télécommande IR
-    telecommand = InfraRedTelecommand()     # initialisation télécommande infra-rouge
+    queue = PageQueue()                     # page 'QUEUE' (file d'attente MPD) activée par la télécommande IR
+    telecommand.add_page(queue)
+    library = LibraryIndex(server=None if replay else mpd_server)   # index local de la bibliothèque MPD (construit en tâche de fond)
+    browse = PageBrowse(library)            # page 'BROWSE' (navigation dans la bibliothèque)
+    telecommand.add_page(browse)
+    search = PageSearch(library)            # page 'SEARCH' (recherche T9 par les touches numériques)
+    telecommand.add_page(search)
+    visualiser = PageVisualiser() if PageVisualiser and not replay else None   # pages 'SPECTRUM' / 'VUMETER' (sortie 'fifo' de MPD)
+    if visualiser :
+        telecommand.add_page(visualiser)
+        stats.histogram('visu_frame', visualiser.period)  # budget d'une image du spectre / vumètre
+    transition = PageTransition() if not replay else None     # animation des changements de page (glissement, balayage, fondu)
+    if transition : stats.histogram('transition', transition.period)   # budget d'un pas : une image à TRANSITION_FPS
+    shown_page, shown_images = None, None   # page affichée et dernières images envoyées (départ d'une transition)
+
+    # Image du spectre / vumètre entre deux passages dans la boucle : seuls les niveaux sont relus et redessinés
+    def visu_frame(visu_connectors) :
+        with stats.stage('visu_frame') :
+            visu_connectors['visu'] = visualiser.update()
+            screen.flush(screen.compose_page(visualiser.page, visu_connectors, False, visualiser.period))
+        return True
+
+    # Pas de la transition entre deux pages : découpe des images préparées et envoi, sans mise en page
+    def transition_frame() :
+        nonlocal shown_images
+        with stats.stage('transition') :
+            shown_images, level = transition.step()
+            if level is not None :
+                screen.contrast(level)
+            screen.flush(shown_images)
+        count('transition_frames')
+        return transition.active
     mixer_config = dict()                   # Dictionnaire contenant les paramètres issus du mixer ALSA
     menu_screen = dict()                    # Dictionnaire contenant les paramètres affichés dans la page 'MENU'
     mpd_server_link = 'KO'                  # initialisation de l'indicateur de l'état de la connexion avec le serveur MPD
+    mpd_backoff = Backoff()                 # délai croissant entre deux tentatives de connexion au serveur MPD
     dac_input = mixer.getcontrol('INPUT')   # lecture de l'entrée sélectionnée sur la carte DAC
     first_loop = True                       # indicateur de premier passage dans la boucle principale
 
+    # Service prêt dès que la page 'INIT' est affichée et les collecteurs lancés : la connexion au serveur MPD
+    # peut attendre indéfiniment (MPD démarré plus tard) sans que systemd n'interrompe le démarrage (TimeoutStartSec)
+    sd_notify('READY=1\nSTATUS=Connexion au serveur MPD')
+
     # Boucle principale parcourue toutes les 0.2 secondes
     # (tant qu'il n'y a pas d'erreur !)
     while True:
@@ -192,23 +462,35 @@ try:
         # A) RECUPERATION DES INFORMATIONS A AFFICHER
         #---------------------------------------------------------------------
         # Informations Temps, Heure
-        time_sec = int(time.time())                             # Récupération du temps (en secondes)
-        hms = "{time:%H:%M:%S}".format(time=datetime.now())     # Récupération de l'heure au format [HH:MM:SS]
+        time_sec = int(clock.time())                            # Récupération du temps (en secondes)
+        hms = "{time:%H:%M:%S}".format(time=clock.now())        # Récupération de l'heure au format [HH:MM:SS]
 
         # Récupération de l'adresse IP et du type de connexion (Filaire ou Wifi) du Raspdac-Mini
-        ip_adr , ip_type = raspdac.get_ip(period=IP_PERIOD)     # Interrogation à une période définie par "IP_PERIOD" (en secondes)
+        with stats.stage('ip') :
+            ip_adr , ip_type = raspdac.get_ip(period=IDLE_IP_PERIOD if idle.active else IP_PERIOD) # Interrogation à une période définie par "IP_PERIOD" (en secondes)
         
         # Gestion de la télécommande
-        key, speed = telecommand.get_key()                      # Récupération touche (si appui)
-        if (key != 'NO_KEY') :
-            menu.info = telecommand.action(key=key, speed=speed, menu=menu.info)
+        with stats.stage('ir') :
+            key, speed = telecommand.get_key()                  # Récupération touche (si appui)
+            if (key != 'NO_KEY') :
+                time_key = time.perf_counter()
+                key_traces.open(key, telecommand.key_stamp)
+                if (not first_loop and sequencer.state == 'SAVER') :
+                    sequencer.timestate = time_sec      # touche de réveil : quitte la page 'SAVER' sans autre action
+                else :
+                    menu.info = telecommand.action(key=key, speed=speed, menu=menu.info)
+                stats.record('ir_key:' + key, time.perf_counter() - time_key)
+                key_traces.mark('action')
+                count('ir_keys')
 
         # Interrogation du mixer ALSA pour récupérer les informations de la carte DAC :
         # -> entrée sélectionnée (I2S ou SPDIF), état du "Mute" (actif ou inactif), Filtre sélectionné
-        if (menu.info['status'] == 'ON' and key == 'KEY_ENTER') :
-            mixer_config = mixer.getconfig()                    # Interrogation forcée suite à modification via la télécommande
-        else :
-            mixer_config = mixer.getconfig(period=MIXER_PERIOD) # Interrogation à une période définie par "MIXER_PERIOD" (en secondes)
+        with stats.stage('alsa') :
+            if (menu.info['status'] == 'ON' and key == 'KEY_ENTER') :
+                mixer_config = mixer.getconfig()                # Interrogation forcée suite à modification via la télécommande
+            else :
+                mixer_config = mixer.getconfig(period=MIXER_PERIOD) # Interrogation à une période définie par "MIXER_PERIOD" (en secondes)
+            dac_stream = hw_params.get(period=HW_PARAMS_PERIOD)    # fréquence et format réellement envoyés au DAC
                
         # Mise à jour des informations nécessaires à la page MENU
         menu.update_menu_info(mixer_config)                     # informations nécessaires pour la gestion de la télécommande
@@ -221,32 +503,54 @@ try:
         # Création / Vérification de l'état du socket avec le serveur MPD    
         # -> à la mise sous tension (first loop)
         # -> ou lorsque RuneAudio réinitialise le serveur MPD ("broken pipe")
+        if (mpd_server_link == 'KO' and not first_loop) : count('mpd_reconnects')
+        mpd_waiting = False
         while (mpd_server_link == 'KO') :
-            mpd = MpdServer()           # Création d'un socket client    
+            mpd = mpd_server()          # Création d'un socket client    
             mpd.connect()               # Activation de la connexion
             mpd_server_link = mpd.socket_status
-            if (first_loop != True) : time.sleep(2)
+            if (mpd_server_link == 'KO') :
+                if not mpd_waiting :
+                    sd_notify('STATUS=Attente du serveur MPD ({}:{})'.format(MPD_HOST, MPD_PORT))
+                    mpd_waiting = True
+                mpd_backoff.sleep()
+        if mpd_waiting and not first_loop :
+            sd_notify('STATUS=En fonctionnement')
+        mpd_backoff.reset()
                     
         # Informations renvoyées par le serveur MPD
-        mpd_status = mpd.getstatus()    # sauvegarde de la réponse à une requête 'status'
-       
-
-
-        mpd_song = mpd.getcurrentsong() # sauvegarde de la réponse à une requête 'currentsong'
+        time_mpd = time.monotonic()
+        with stats.stage('mpd_status') :
+            mpd_status = mpd.getstatus()    # sauvegarde de la réponse à une requête 'status'
+        if prefetch : prefetch.update(mpd_status)   # demande en tâche de fond du titre suivant (s'il a changé)
+        with stats.stage('mpd_currentsong') :
+            mpd_song = mpd.getcurrentsong() # sauvegarde de la réponse à une requête 'currentsong'
+        if first_loop : startup.add('première requête MPD', time.monotonic() - time_mpd)
+        with stats.stage('mpd_queue') :
+            queue_screen = queue.update(mpd, mpd_status, clock.time())  # entrées visibles de la file (page 'QUEUE' active)
+        browse_screen = browse.update(mpd_status, clock.time())             # entrées de l'index local (page 'BROWSE' active)
+        search_screen = search.update(mpd_status, clock.time())             # résultats de la recherche (page 'SEARCH' active)
+        with stats.stage('visu') :
+            visu_screen = visualiser.update() if visualiser else { 'state' : 'OFF' }   # niveaux et spectre (page 'VISU' active)
 
         # Traitement (formatage) des données pour l'affichage
         icons['ip_type'] = icons[ip_type]                       # icône dynamique en fonction du type d'accès (filaire ou WiFi)
         icons['player_state'] = icons[mpd_status['state']]      # icône dynamqiue en fonction de l'état du player ('stop', 'play' ou 'pause')
         mpd_calc = mpd_data_processing(mpd_status, mpd_song)    # Formatage des champs à afficher dans les pages 'I2S-PLAY1' et 'I2S-PLAY2'
+        cover_screen = { 'image' : cover.get(mpd_song) if cover else None }     # vignette de la pochette (page 'I2S-COVER')
         
 
         # Regroupement des informations dans un dictionnaire de connecteurs (champs accessibles pour l'affichage)
         os_info = { 'hms' : hms,  'ip' : ip_adr }
-        connectors = { 'icons': icons , 'info' : os_info , 'menu' : menu_screen, 'mpd_status' : mpd_status, 'mpd_song' : mpd_song, 'mpd_calc' : mpd_calc }
-
+        connectors = { 'icons': icons , 'info' : os_info , 'menu' : menu_screen, 'mpd_status' : mpd_status, 'mpd_song' : mpd_song, 'mpd_calc' : mpd_calc, 'queue' : queue_screen, 'browse' : browse_screen, 'search' : search_screen, 'cover' : cover_screen, 'visu' : visu_screen, 'dac' : dac_stream }
+        if state_api :
+            with stats.stage('state_api') :
+                state_api.publish(connectors)
         
         # B) SEQUENCEUR DE SELECTION DES PAGES A AFFICHER
         #---------------------------------------------------------------------
+        key_traces.mark('données')
+        time_sequencer = time.perf_counter()
 
         # La page 'INIT'
         # -> maintenue pendant quelques seconde avant de passer à la page 'IP'
@@ -277,6 +581,8 @@ try:
         elif (time_sec - sequencer.timestate >= page_inactivity) and (dac_input == dac_input_old) and \
              ( (dac_input != 'I2S') or (mpd_status['state'] == 'stop') ) :    
             if (sequencer.state != 'SAVER') :
+                if visualiser and visualiser.status == 'ON' :
+                    visualiser.close()              # page 'VISU' sans lecture ni touche : fermeture (lecture du tube arrêtée)
                 sequencer.set(state='SAVER', time=sequencer.timestate)  # on conserve la datation du changement d'état précédent
             else :
                 sequencer.hold( refresh=(time_sec != time_sec_old) )    # rafraîchissement de la page toutes les secondes
@@ -290,6 +596,40 @@ try:
                 sequencer.timestate = time_sec      # empêche l'activation de la page 'SAVER' quand on est dans la page 'MENU'
                 sequencer.hold(refresh=True)
 
+        # La page 'QUEUE'
+        # -> activée / désactivée par une touche de la télécommande (voir raspdac_oled_screen_queue.py)
+        elif (queue_screen['state'] == 'ON') :
+            if (sequencer.state != 'QUEUE') :
+                sequencer.set(state='QUEUE',time=time_sec)
+            else :
+                sequencer.timestate = time_sec      # empêche l'activation de la page 'SAVER' quand on est dans la page 'QUEUE'
+                sequencer.hold(refresh=True, resetscrolling=(key != 'NO_KEY'))  # nouvelle sélection : défilement depuis le début
+        # La page 'BROWSE'
+        # -> activée / désactivée par une touche de la télécommande (voir raspdac_oled_screen_browse.py)
+        elif (browse_screen['state'] == 'ON') :
+            if (sequencer.state != 'BROWSE') :
+                sequencer.set(state='BROWSE',time=time_sec)
+            else :
+                sequencer.timestate = time_sec      # empêche l'activation de la page 'SAVER' quand on est dans la page 'BROWSE'
+                sequencer.hold(refresh=True, resetscrolling=(key != 'NO_KEY'))  # nouvelle sélection : défilement depuis le début
+        # La page 'SEARCH'
+        # -> activée par une touche numérique de la télécommande (voir raspdac_oled_screen_search.py)
+        elif (search_screen['state'] == 'ON') :
+            if (sequencer.state != 'SEARCH') :
+                sequencer.set(state='SEARCH',time=time_sec)
+            else :
+                sequencer.timestate = time_sec      # empêche l'activation de la page 'SAVER' quand on est dans la page 'SEARCH'
+                sequencer.hold(refresh=True, resetscrolling=(key != 'NO_KEY'))  # nouvelle sélection : défilement depuis le début
+        # Les pages 'SPECTRUM' et 'VUMETER'
+        # -> activées / désactivées par une touche de la télécommande (voir raspdac_oled_screen_visualiser.py)
+        elif (visu_screen['state'] == 'ON') :
+            if (sequencer.state != 'VISU') :
+                sequencer.set(state='VISU', time=time_sec, page2display=visualiser.page)
+            else :
+                if mpd_status['state'] != 'stop' or key != 'NO_KEY' :
+                    sequencer.timestate = time_sec  # page 'SAVER' après 'page_inactivity' sans lecture ni touche
+                sequencer.page2display = visualiser.page
+                sequencer.hold(refresh=True)
         # La page 'SPDIF'
         # -> maintenue tant que la carte DAC est sur l'entrée 'SPDIF'
         elif (dac_input == 'SPDIF') :
@@ -315,15 +655,18 @@ try:
                 time_page_toggle = time_sec
             else :    
                 if mpd_status['state'] != 'stop' : sequencer.timestate = time_sec
-                # Sélection en alternance des pages 'I2S-PLAY1' et 'I2S-PLAY2'
+                # Sélection en alternance des pages 'I2S-PLAY1', 'I2S-PLAY2' (et 'I2S-COVER' si l'album a une pochette)
                 cycle = page_duration['I2S-PLAY1'] + page_duration['I2S-PLAY2']
-                play1_period = ( (time_sec - time_page_toggle) % cycle < page_duration['I2S-PLAY1'] )
-                if (play1_period == True) :
-                    sequencer.resetscrolling = (sequencer.page2display != 'I2S-PLAY1')
-                    sequencer.page2display = 'I2S-PLAY1'
+                if cover_screen['image'] is not None : cycle += page_duration['I2S-COVER']
+                play_time = (time_sec - time_page_toggle) % cycle
+                if play_time < page_duration['I2S-PLAY1'] :
+                    play_page = 'I2S-PLAY1'
+                elif play_time < page_duration['I2S-PLAY1'] + page_duration['I2S-PLAY2'] :
+                    play_page = 'I2S-PLAY2'
                 else :
-                    sequencer.resetscrolling = (sequencer.page2display != 'I2S-PLAY2')
-                    sequencer.page2display = 'I2S-PLAY2'
+                    play_page = 'I2S-COVER'
+                sequencer.resetscrolling = (sequencer.page2display != play_page)
+                sequencer.page2display = play_page
                 # Rafraîchissement continu des pages 'I2S-PLAY'
                 sequencer.refresh = True
         else :
@@ -333,11 +676,56 @@ try:
         current_volume = mpd_status['volume']
         time_sec_old = time_sec
         first_loop = False
+        stats.record('sequencer', time.perf_counter() - time_sequencer)
+        key_traces.mark('séquenceur')
+
+        # Mise en page rechargée par le fil de surveillance : installée entre deux images
+        layout = layouts.take() if layouts else None
+        if layout is not None :
+            screen.load_layout(layout)
+            sequencer.refresh = True
+            sequencer.resetscrolling = True
+
+        # C) VEILLE DE L'ECRAN EN PAGE 'SAVER'
+        #---------------------------------------------------------------------
+        if (sequencer.state == 'SAVER') :
+            idle.enter(screen)
+            if idle.frozen :
+                sequencer.refresh = False           # écran éteint ou image figée : plus d'image envoyée
+        else :
+            idle.leave(screen)                      # réveil (touche, lecture, changement d'entrée...)
 
         # D) AFFICHAGE DE LA PAGE
         #---------------------------------------------------------------------
-        if sequencer.refresh == True :
-            screen.affichage_page(sequencer.page2display, connectors, sequencer.resetscrolling, loop_period.loop_period_target)
+        refresh = sequencer.refresh
+        if replay :
+            refresh = replay.page_displayed(sequencer.state, sequencer.page2display) and refresh
+        if transition and transition.active and (sequencer.page2display != shown_page or idle.active) :
+            level = transition.cancel()             # autre page demandée ou veille pendant la transition
+            if level is not None :
+                screen.contrast(level)
+        if transition and transition.active :
+            transition_frame()                      # transition interrompue par une touche : pas suivant
+        elif refresh == True :
+            key_traces.mark('attente')
+            with stats.stage('layout') :
+                image = screen.compose_page(sequencer.page2display, connectors, sequencer.resetscrolling, loop_period.loop_period_target)
+            key_traces.mark('mise en page')
+            if transition and shown_images is not None and transition.wanted(shown_page, sequencer.page2display) :
+                transition.start(shown_images, image, shown_page, sequencer.page2display)
+                with stats.stage('transition') :
+                    image, level = transition.step()
+                    if level is not None :
+                        screen.contrast(level)
+                count('transition_frames')
+            with stats.stage('spi_flush') :
+                screen.flush(image)
+            key_traces.close()                      # première image affichée après les touches du passage
+            shown_page, shown_images = sequencer.page2display, image
+            idle.shown = idle.active
+        else :
+            count('frames_skipped')
+        key_traces.close(redrawn=False)             # touches du passage sans image redessinée
 
         # Fin de l'itération
         current_volume = mpd_status['volume']       # mémorisation de la valeur du volume
@@ -345,16 +733,55 @@ try:
         first_loop = False
         mpd_server_link = mpd.socket_status
 
+        # Préparation de l'affichage du titre suivant (une fois par titre, après l'envoi de l'image)
+        next_song = prefetch.take() if prefetch else None
+        if next_song is not None :
+            with stats.stage('prefetch') :
+                next_connectors = dict(connectors, mpd_calc=mpd_data_processing(mpd_status, next_song[1]))
+                screen.prerender('I2S-PLAY1', next_connectors)
+                screen.prerender('I2S-PLAY2', next_connectors)
+                if cover :
+                    screen.prerender('I2S-COVER', next_connectors)
+                    cover.get(next_song[1])         # pochette du titre suivant demandée en tâche de fond
+
+        # Animation jusqu'au passage suivant (les données restent collectées au rythme de la boucle)
+        animation = None
+        if transition and transition.active :
+            animation = (transition.period, transition_frame)
+        elif sequencer.state == 'VISU' and visualiser and visualiser.status == 'ON' and not idle.active :
+            animation = (visualiser.period, lambda visu_connectors=dict(connectors) : visu_frame(visu_connectors))
         connectors.clear()                          # RAZ du dictionnaire des connecteurs
-        loop_period.adjust()
-
-# Sortie de la boucle principale en cas d'erreur            
-except KeyboardInterrupt:
-    pass
-except Exception:
-    print('Exception - Main Module', file=sys.stderr)
-    traceback.print_exc()
-    sys.exit(1)
-
-
-
+        if 'écran utilisable' not in startup.milestones :
+            startup.log('écran utilisable')
+            sd_notify('STATUS=En fonctionnement')
+            if args.startup_profile :
+                startup.add('chargement des polices ({} faces)'.format(raspdac_oled_fonts.load_stats['faces']),
+                            raspdac_oled_fonts.load_stats['seconds'])
+                print(startup.report(), file=sys.stderr, flush=True)
+        stats.maybe_report()
+        profiler.maybe_toggle()
+        metrics.maybe_write(stats, sequencer.page2display)
+        if idle.active :
+            wait = None if replay else (lambda timeout : idle.wait(timeout, telecommand, mpd))
+            stats.record('loop', loop_period.adjust(IDLE_PERIOD, wait))
+        elif animation :
+            # animation du spectre / vumètre pendant l'attente ; une transition est jouée jusqu'au bout
+            # (sans collecte des données), sauf si une touche arrive
+            extend = transition.remaining() if transition and transition.active else 0.0
+            wait = lambda timeout : animate(max(timeout, extend), animation[0], animation[1], telecommand)
+            stats.record('loop', loop_period.adjust(wait=wait))
+        else :
+            # attente de cadence : l'instant d'arrivée d'une touche y est relevé (select), sans écourter l'attente
+            stats.record('loop', loop_period.adjust(wait=None if replay else telecommand.wait))
+
+
+if __name__ == '__main__' :
+    # Sortie de la boucle principale en cas d'erreur
+    try :
+        main()
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        print('Exception - Main Module', file=sys.stderr)
+        traceback.print_exc()
+        sys.exit(1)
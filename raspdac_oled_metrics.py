@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Export des compteurs internes au format texte Prometheus
+# Fichier : raspdac_oled_metrics.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Export des métriques du démon pour la supervision d'un parc de Raspdac.
+
+Les compteurs (``raspdac_oled_stats.counters``), les durées des étapes de la
+boucle et quelques jauges (mémoire résidente, page affichée) sont écrits
+périodiquement dans un fichier au format texte Prometheus, par défaut
+``/run/ohOled/metrics``. L'écriture est atomique (fichier temporaire puis
+``os.replace``) : un lecteur (node_exporter textfile collector, script de
+supervision...) ne voit jamais un fichier à moitié écrit.
+
+Variables d'environnement :
+-> OHOLED_METRICS : chemin du fichier (vide pour désactiver l'export)
+-> OHOLED_METRICS_PERIOD : période d'écriture en secondes
+"""
+import os
+import sys
+import time
+
+from raspdac_oled_stats import counters
+
+METRICS_PATH = os.environ.get('OHOLED_METRICS', '/run/ohOled/metrics')
+METRICS_PERIOD = float(os.environ.get('OHOLED_METRICS_PERIOD', '15'))
+
+# Compteurs exportés : nom interne -> (nom Prometheus, description)
+COUNTERS = {
+    'frames_rendered' : ('oholed_frames_rendered_total', "Pages dessinées et envoyées à l'écran"),
+    'frames_skipped' : ('oholed_frames_skipped_total', 'Passages dans la boucle sans rafraîchissement'),
+    'frames_unchanged' : ('oholed_frames_unchanged_total', "Pages dessinées identiques à l'image affichée (non envoyées)"),
+    'spi_bytes' : ('oholed_spi_bytes_total', "Octets d'image envoyés à l'écran"),
+    'mpd_requests' : ('oholed_mpd_requests_total', 'Requêtes envoyées au serveur MPD'),
+    'mpd_connects' : ('oholed_mpd_connects_total', 'Tentatives de connexion au serveur MPD'),
+    'mpd_reconnects' : ('oholed_mpd_reconnects_total', 'Reconnexions au serveur MPD après perte du lien'),
+    'songs_prefetched' : ('oholed_songs_prefetched_total', 'Titres suivants lus par anticipation'),
+    'library_builds' : ('oholed_library_builds_total', "Constructions de l'index de la bibliothèque"),
+    'transition_frames' : ('oholed_transition_frames_total', 'Images des transitions entre deux pages'),
+    'layout_loads' : ('oholed_layout_loads_total', 'Mises en page chargées depuis OHOLED_LAYOUT'),
+    'covers_fetched' : ('oholed_covers_fetched_total', "Pochettes d'album demandées au serveur MPD"),
+    'subprocess_launches' : ('oholed_subprocess_launches_total', 'Sous-processus lancés (amixer, ip, mpc...)'),
+    'ir_keys' : ('oholed_ir_keys_total', 'Touches reçues de la télécommande'),
+    }
+
+QUANTILES = (50, 95, 99)
+
+
+def rss_bytes():
+    """Mémoire résidente du processus (0 si /proc est indisponible)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _summary(lines, name, histogram, labels=''):
+    separator = ',' if labels else ''
+    for rank, value in zip(QUANTILES, histogram.percentiles(*QUANTILES)):
+        lines.append('{}{{{}{}quantile="{}"}} {:.6f}'.format(name, labels, separator, rank / 100, value))
+    suffix = '{{{}}}'.format(labels) if labels else ''
+    lines.append('{}_sum{} {:.6f}'.format(name, suffix, histogram.total))
+    lines.append('{}_count{} {}'.format(name, suffix, histogram.count))
+
+
+def render(stats, page):
+    """Texte Prometheus des métriques courantes."""
+    lines = []
+    for key, (name, description) in COUNTERS.items():
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} counter'.format(name))
+        lines.append('{} {}'.format(name, counters.get(key, 0)))
+
+    lines.append('# HELP oholed_stage_seconds Durée des étapes de la boucle principale')
+    lines.append('# TYPE oholed_stage_seconds summary')
+    for stage, histogram in stats.histograms.items():
+        if ':' not in stage:
+            _summary(lines, 'oholed_stage_seconds', histogram, 'stage="{}"'.format(stage))
+    lines.append('# HELP oholed_stage_max_seconds Durée maximale des étapes depuis le démarrage')
+    lines.append('# TYPE oholed_stage_max_seconds gauge')
+    for stage, histogram in stats.histograms.items():
+        if ':' not in stage:
+            lines.append('oholed_stage_max_seconds{{stage="{}"}} {:.6f}'.format(stage, histogram.maximum))
+    lines.append('# HELP oholed_stage_deadline_misses_total Dépassements de l\'échéance de chaque étape (STAGE_BUDGETS)')
+    lines.append('# TYPE oholed_stage_deadline_misses_total counter')
+    for stage, histogram in stats.histograms.items():
+        if ':' not in stage:
+            lines.append('oholed_stage_deadline_misses_total{{stage="{}"}} {}'.format(stage, histogram.misses))
+
+    lines.append('# HELP oholed_ir_key_latency_seconds Latence de traitement des touches de la télécommande')
+    lines.append('# TYPE oholed_ir_key_latency_seconds summary')
+    for stage, histogram in stats.histograms.items():
+        if stage.startswith('ir_key:'):
+            _summary(lines, 'oholed_ir_key_latency_seconds', histogram, 'key="{}"'.format(stage.split(':', 1)[1]))
+    lines.append('# HELP oholed_key_to_glass_seconds Délai entre l\'arrivée d\'une touche et l\'affichage de son effet')
+    lines.append('# TYPE oholed_key_to_glass_seconds summary')
+    for stage, histogram in stats.histograms.items():
+        if stage.startswith('key_to_glass:'):
+            _summary(lines, 'oholed_key_to_glass_seconds', histogram, 'key="{}"'.format(stage.split(':', 1)[1]))
+    lines.append('# HELP oholed_key_no_redraw_seconds Délai entre l\'arrivée d\'une touche et la fin du passage, sans image redessinée')
+    lines.append('# TYPE oholed_key_no_redraw_seconds summary')
+    for stage, histogram in stats.histograms.items():
+        if stage.startswith('key_no_redraw:'):
+            _summary(lines, 'oholed_key_no_redraw_seconds', histogram, 'key="{}"'.format(stage.split(':', 1)[1]))
+
+    lines.append('# HELP oholed_rss_bytes Mémoire résidente du démon')
+    lines.append('# TYPE oholed_rss_bytes gauge')
+    lines.append('oholed_rss_bytes {}'.format(rss_bytes()))
+    lines.append('# HELP oholed_page Page affichée par le séquenceur')
+    lines.append('# TYPE oholed_page gauge')
+    lines.append('oholed_page{{page="{}"}} 1'.format(page))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter():
+    """Ecriture périodique et atomique du fichier de métriques."""
+    def __init__(self, path=METRICS_PATH, period=METRICS_PERIOD):
+        self.path = path
+        self.period = period
+        self.time_write = 0.0
+        if self.path :
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            except OSError as e:
+                print('ohOled: export des métriques désactivé ({})'.format(e), file=sys.stderr)
+                self.path = ''
+
+    def write(self, stats, page):
+        if not self.path :
+            return False
+        temporary = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(temporary, 'w') as output:
+                output.write(render(stats, page))
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print('ohOled: export des métriques désactivé ({})'.format(e), file=sys.stderr)
+            self.path = ''
+            return False
+        return True
+
+    def maybe_write(self, stats, page):
+        time_now = time.monotonic()
+        if time_now - self.time_write >= self.period:
+            self.time_write = time_now
+            return self.write(stats, page)
+        return False
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Copie des images envoyées à l'écran sur un socket UNIX (diagnostic à distance)
+# Fichier : raspdac_oled_mirror.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par raspdac_oled_screen_display.py
+# Il peut aussi être lancé seul pour regarder l'écran d'un Raspdac :
+#   python3 raspdac_oled_mirror.py /run/ohOled/mirror.sock
+#   python3 raspdac_oled_mirror.py /run/ohOled/mirror.sock --png /tmp/mirror
+# ----------------------------------------------------------------------------
+"""Miroir de l'écran : les images envoyées à l'écran, lisibles par un autre programme.
+
+Activé par OHOLED_MIRROR_SOCKET (chemin d'un socket UNIX, vide par défaut).
+Chaque client reçoit d'abord l'image complète, puis uniquement les images
+différentes de la précédente (OledScreen.flush n'envoie déjà rien à l'écran
+quand l'image n'a pas changé). Chaque message est un en-tête HEADER (type,
+largeur, hauteur, taille des données) suivi des données :
+-> FRAME_KEY : image 1 bit complète (1024 octets pour 128x64, lignes de
+   16 octets, bit de poids fort à gauche, comme Image.tobytes() en mode '1') ;
+-> FRAME_DELTA : XOR avec l'image précédente, codé par plages : suite de
+   (octets inchangés à sauter, nombre d'octets n, n octets du XOR), chaque
+   nombre sur un octet. Un défilement de titre tient en quelques dizaines
+   d'octets.
+
+La boucle principale ne fait que déposer l'image (octets déjà calculés pour
+la comparaison avec l'image précédente) ; le codage et l'envoi se font dans
+le fil d'exécution de chaque client, par rapport à la dernière image que ce
+client a reçue : un client lent saute des images sans jamais se désynchroniser.
+"""
+import argparse
+import os
+import re
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+MIRROR_SOCKET = os.environ.get('OHOLED_MIRROR_SOCKET', '')
+HEADER = struct.Struct('>BHHH')     # type, largeur, hauteur, taille des données
+FRAME_KEY = 1                       # image complète
+FRAME_DELTA = 2                     # XOR avec l'image précédente, codé par plages
+
+# Plages d'octets modifiés (deux octets inchangés au plus à l'intérieur d'une plage : moins cher que deux en-têtes)
+_CHANGED = re.compile(b'[^\x00](?:\x00{0,2}[^\x00])*')
+
+
+# Codage d'une image par rapport à la précédente : (type, données)
+def encode_frame(previous, frame) :
+    if previous is None or len(previous) != len(frame) :
+        return FRAME_KEY, frame
+    delta = (int.from_bytes(previous, 'big') ^ int.from_bytes(frame, 'big')).to_bytes(len(frame), 'big')
+    data = bytearray()
+    position = 0
+    for match in _CHANGED.finditer(delta) :
+        start, end = match.span()
+        skip = start - position
+        while skip > 255 :
+            data += b'\xff\x00'
+            skip -= 255
+        while start < end :
+            length = min(end - start, 255)
+            data.append(skip)
+            data.append(length)
+            data += delta[start:start + length]
+            start += length
+            skip = 0
+        position = end
+    if len(data) >= len(frame) :    # changement de page : l'image complète est plus courte
+        return FRAME_KEY, frame
+    return FRAME_DELTA, bytes(data)
+
+
+# Décodage d'un message (côté client)
+def decode_frame(previous, kind, data) :
+    if kind == FRAME_KEY :
+        return data
+    frame = bytearray(previous)
+    position = index = 0
+    while index < len(data) :
+        skip, length = data[index], data[index + 1]
+        position += skip
+        index += 2
+        for offset in range(length) :
+            frame[position + offset] ^= data[index + offset]
+        position += length
+        index += length
+    return bytes(frame)
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe du miroir (côté ohOled)
+# -> 'publish' est appelé par OledScreen.flush pour chaque image différente de la précédente
+class FrameMirror() :
+    def __init__(self, width, height, path=MIRROR_SOCKET) :
+        self.width = width
+        self.height = height
+        self.path = path
+        self.frame = None               # dernière image envoyée à l'écran (octets)
+        self.version = 0                # incrémenté à chaque image
+        self.changed = threading.Condition()
+        self.server = None
+        try :
+            if os.path.exists(path) :
+                os.unlink(path)         # socket d'une exécution précédente
+            self.server = _MirrorServer(path, _MirrorHandler)
+            os.chmod(path, 0o660)
+        except OSError as e :
+            print("ohOled: miroir de l'écran indisponible sur {} ({})".format(path, e), file=sys.stderr, flush=True)
+            return
+        self.server.mirror = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='oholed-mirror', daemon=True)
+        self.thread.start()
+
+    def publish(self, frame) :
+        with self.changed :
+            self.frame = frame
+            self.version += 1
+            self.changed.notify_all()
+
+    # Attente d'une image plus récente que 'version' : (version, image)
+    def wait(self, version) :
+        with self.changed :
+            self.changed.wait_for(lambda : self.version > version)
+            return self.version, self.frame
+
+    def close(self) :
+        if self.server is not None :
+            self.server.shutdown()
+            self.server.server_close()
+            try :
+                os.unlink(self.path)
+            except OSError :
+                pass
+
+
+class _MirrorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer) :
+    daemon_threads = True
+
+
+# Envoi des images à un client
+class _MirrorHandler(socketserver.BaseRequestHandler) :
+    def handle(self) :
+        mirror = self.server.mirror
+        version, sent = 0, None
+        try :
+            while True :
+                version, frame = mirror.wait(version)
+                kind, data = encode_frame(sent, frame)
+                self.request.sendall(HEADER.pack(kind, mirror.width, mirror.height, len(data)) + data)
+                sent = frame
+        except OSError :                # client parti
+            pass
+
+
+# ============================================================================
+# Client : affichage dans le terminal ou écriture des images en PNG
+# ============================================================================
+def receive(path) :
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    stream = client.makefile('rb')
+    frame = None
+    while True :
+        header = stream.read(HEADER.size)
+        if len(header) < HEADER.size :
+            return
+        kind, width, height, size = HEADER.unpack(header)
+        data = stream.read(size)
+        frame = decode_frame(frame, kind, data)
+        yield kind, width, height, size, frame
+
+
+# Image en caractères semi-graphiques (deux lignes de pixels par ligne de texte)
+def to_text(image) :
+    width, height = image.size
+    pixels = image.load()
+    blocks = (' ', '▄', '▀', '█')
+    lines = []
+    for y in range(0, height, 2) :
+        lines.append(''.join(blocks[(pixels[x, y] != 0) * 2 + (y + 1 < height and pixels[x, y + 1] != 0)]
+                             for x in range(width)))
+    return '\n'.join(lines)
+
+
+def main(argv=None) :
+    from PIL import Image
+    parser = argparse.ArgumentParser(description="Miroir de l'écran OLED d'ohOled")
+    parser.add_argument('socket', nargs='?', default=MIRROR_SOCKET or '/run/ohOled/mirror.sock')
+    parser.add_argument('--png', metavar='REPERTOIRE', help='écrit chaque image reçue en PNG au lieu de l\'afficher')
+    parser.add_argument('--count', type=int, default=0, help="nombre d'images à recevoir (0 : sans fin)")
+    args = parser.parse_args(argv)
+    if args.png :
+        os.makedirs(args.png, exist_ok=True)
+    received = 0
+    try :
+        for kind, width, height, size, frame in receive(args.socket) :
+            image = Image.frombytes('1', (width, height), frame)
+            received += 1
+            if args.png :
+                path = os.path.join(args.png, 'frame-{:06d}.png'.format(received))
+                image.save(path)
+                print(path, '(image complète)' if kind == FRAME_KEY else '({} octets)'.format(size))
+            else :
+                sys.stdout.write('\x1b[H\x1b[2J' + to_text(image) + '\nimage {}  {} octets\n'.format(received, size))
+                sys.stdout.flush()
+            if received == args.count :
+                break
+    except KeyboardInterrupt :
+        pass
+    return 0
+
+
+if __name__ == '__main__' :
+    sys.exit(main())
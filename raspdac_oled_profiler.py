@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Profilage par échantillonnage, activé à la demande
+# Fichier : raspdac_oled_profiler.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Profileur par échantillonnage de la boucle principale.
+
+Le signal SIGUSR2 démarre le profileur (un second SIGUSR2 l'arrête avant la
+fin) sans redémarrer le service :
+
+    systemctl kill -s USR2 --kill-whom=main ohOled.service
+
+Un fil d'exécution relève la pile du fil principal toutes les 10 ms
+(``sys._current_frames``), pendant 30 s au plus. Le résultat est écrit au
+format « piles repliées » (une pile par ligne, ``f1;f2;f3 nombre``), lisible
+par flamegraph.pl ou speedscope, dans le fichier
+``/run/ohOled/profile-<date>.folded``. Le coût pour la boucle est celui de
+la lecture d'une pile tous les 10 ms, et nul hors profilage.
+
+Variables d'environnement :
+-> OHOLED_PROFILE_DIR : répertoire des profils
+-> OHOLED_PROFILE_DURATION : durée maximale d'un profil en secondes
+-> OHOLED_PROFILE_INTERVAL : intervalle d'échantillonnage en secondes
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_DIR = os.environ.get('OHOLED_PROFILE_DIR', '/run/ohOled')
+PROFILE_DURATION = float(os.environ.get('OHOLED_PROFILE_DURATION', '30'))
+PROFILE_INTERVAL = float(os.environ.get('OHOLED_PROFILE_INTERVAL', '0.01'))
+
+
+def collapse(frame):
+    """Pile d'appels d'un cadre, de la racine vers la feuille : 'fichier:fonction;...'."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler():
+    """Echantillonnage de la pile du fil principal, déclenché par signal."""
+    def __init__(self, directory=PROFILE_DIR, duration=PROFILE_DURATION, interval=PROFILE_INTERVAL):
+        self.directory = directory
+        self.duration = duration
+        self.interval = interval
+        self.target = threading.main_thread().ident
+        self.toggle_requested = False
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # Démarrage / arrêt à la demande (SIGUSR2) : le gestionnaire ne fait que lever un drapeau
+    def install_signal(self, signum=signal.SIGUSR2):
+        def request_toggle(signum, frame):
+            self.toggle_requested = True
+        signal.signal(signum, request_toggle)
+
+    def maybe_toggle(self):
+        """Appelé à chaque passage dans la boucle principale."""
+        if self.toggle_requested:
+            self.toggle_requested = False
+            if self.running:
+                self.stop()
+            else:
+                self.start()
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.sample, name='oholed-profiler', daemon=True)
+        self.thread.start()
+        print('ohOled: profilage démarré ({:.0f} s au plus)'.format(self.duration), file=sys.stderr, flush=True)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def sample(self):
+        stacks = Counter()
+        time_end = time.monotonic() + self.duration
+        while not self.stop_event.wait(self.interval) and time.monotonic() < time_end:
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                stacks[collapse(frame)] += 1
+            del frame
+        self.write(stacks)
+
+    def write(self, stacks):
+        path = os.path.join(self.directory, 'profile-{}.folded'.format(time.strftime('%Y%m%d-%H%M%S')))
+        temporary = '{}.tmp'.format(path)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary, 'w') as output:
+                for stack, samples in stacks.most_common():
+                    output.write('{} {}\n'.format(stack, samples))
+            os.replace(temporary, path)
+        except OSError as e:
+            print('ohOled: écriture du profil impossible ({})'.format(e), file=sys.stderr, flush=True)
+            return None
+        print('ohOled: profil écrit dans {} ({} échantillons)'.format(path, sum(stacks.values())), file=sys.stderr, flush=True)
+        return path
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Enregistrement et rejeu des entrées de la boucle principale
+# Fichier : raspdac_oled_replay.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py :
+#   python3 raspdac_oled_main.py --record /var/tmp/ohOled.rec.gz     (sur le Raspdac)
+#   python3 raspdac_oled_main.py --replay ohOled.rec.gz --display png (n'importe où)
+# ----------------------------------------------------------------------------
+"""Enregistrement / rejeu des entrées du séquenceur.
+
+En enregistrement, les collecteurs réels (adresse IP, mixer ALSA,
+télécommande, serveur MPD) sont enveloppés : chaque réponse qui diffère de
+la précédente est écrite, datée, dans un fichier JSON-lignes compressé
+(gzip). Pour rester compact, seuls les champs modifiés des réponses MPD
+sont écrits.
+
+En rejeu, des collecteurs de substitution renvoient, à l'heure d'une
+horloge virtuelle (raspdac_oled_clock.VirtualClock), la dernière valeur
+enregistrée. La boucle principale tourne sans attente réelle : une journée
+enregistrée se rejoue en quelques secondes, sans matériel. Les changements
+de page sont écrits sur la sortie standard (instant relatif, état, page),
+ce qui permet de comparer deux rejeux (tests de non-régression) ; les
+images peuvent être capturées avec l'affichage virtuel 'png' ou 'gif'.
+"""
+import bisect
+import gzip
+import json
+import sys
+import time
+
+from raspdac_oled_clock import VirtualClock
+from raspdac_oled_request_mpd import MpdSong, MpdStatus
+from raspdac_oled_telecommand import InfraRedTelecommand
+from raspdac_oled_screen_menu import shell_controls_list, mute_list, filter_list, input_list
+
+MIXER_CONTROLS = ('MUTE', 'FILTER', 'INPUT')
+
+
+class ReplayFinished(SystemExit):
+    """Fin des données enregistrées : arrêt normal du rejeu."""
+
+
+# ----------------------------------------------------------------------------
+# Enregistrement
+class Recorder():
+    """Ecriture des entrées datées : une ligne JSON [instant, type, valeur]."""
+    def __init__(self, path, clock):
+        self.output = gzip.open(path, 'wt', encoding='utf-8')
+        self.clock = clock
+        self.last = dict()
+
+    def write(self, kind, value):
+        self.output.write(json.dumps([round(self.clock.time(), 3), kind, value], ensure_ascii=False, separators=(',', ':')))
+        self.output.write('\n')
+
+    def changed(self, kind, value):
+        """Ecrit la valeur si elle diffère de la précédente du même type."""
+        if self.last.get(kind) != value:
+            self.last[kind] = value
+            self.write(kind, value)
+
+    def changed_fields(self, kind, fields):
+        """Ecrit uniquement les champs modifiés d'un dictionnaire (None pour un champ disparu)."""
+        previous = self.last.get(kind, dict())
+        delta = {key: value for key, value in fields.items() if previous.get(key) != value}
+        delta.update({key: None for key in previous if key not in fields})
+        if delta:
+            self.last[kind] = dict(fields)
+            self.write(kind, delta)
+
+    def close(self):
+        self.output.close()
+
+
+class RecordingIP():
+    def __init__(self, raspdac, recorder):
+        self.raspdac = raspdac
+        self.recorder = recorder
+
+    def get_ip(self, period=0):
+        ip_adr, ip_type = self.raspdac.get_ip(period=period)
+        self.recorder.changed('ip', [ip_adr, ip_type])
+        return ip_adr, ip_type
+
+
+class RecordingMixer():
+    def __init__(self, mixer, recorder):
+        self.mixer = mixer
+        self.recorder = recorder
+
+    def getconfig(self, period=0):
+        config = self.mixer.getconfig(period=period)
+        self.recorder.changed('mixer', {control: [config[control]['Item0'], config[control]['index_Item0']] for control in MIXER_CONTROLS})
+        return config
+
+    def getcontrol(self, mixer_control):
+        return self.mixer.getcontrol(mixer_control)
+
+
+class RecordingTelecommand():
+    def __init__(self, telecommand, recorder):
+        self.telecommand = telecommand
+        self.recorder = recorder
+
+    def get_key(self):
+        key, speed = self.telecommand.get_key()
+        if key != 'NO_KEY':
+            self.recorder.write('key', [key, speed])
+        return key, speed
+
+    def __getattr__(self, name):
+        return getattr(self.telecommand, name)
+
+
+class RecordingMpd():
+    """Enveloppe d'une connexion MpdServer (une par connexion)."""
+    def __init__(self, mpd, recorder):
+        self.mpd = mpd
+        self.recorder = recorder
+
+    def getstatus(self):
+        status = self.mpd.getstatus()
+        self.recorder.changed_fields('status', dict(status.items()))
+        return status
+
+    def getcurrentsong(self):
+        song = self.mpd.getcurrentsong()
+        self.recorder.changed_fields('song', dict(song.items()))
+        return song
+
+    def __getattr__(self, name):
+        return getattr(self.mpd, name)
+
+
+# ----------------------------------------------------------------------------
+# Rejeu
+class Recording():
+    """Contenu d'un fichier d'enregistrement, indexé par type d'entrée."""
+    def __init__(self, path):
+        self.times = dict()             # type -> instants
+        self.values = dict()            # type -> valeurs (complètes, après application des deltas)
+        current = dict()
+        with gzip.open(path, 'rt', encoding='utf-8') as records:
+            for line in records:
+                instant, kind, value = json.loads(line)
+                if kind in ('status', 'song'):
+                    fields = dict(current.get(kind, dict()))
+                    for key, field in value.items():
+                        if field is None:
+                            fields.pop(key, None)
+                        else:
+                            fields[key] = field
+                    current[kind] = value = fields
+                self.times.setdefault(kind, []).append(instant)
+                self.values.setdefault(kind, []).append(value)
+        every = [instants for instants in self.times.values() if instants]
+        self.start = min(instants[0] for instants in every) if every else 0.0
+        self.end = max(instants[-1] for instants in every) if every else 0.0
+
+    def at(self, kind, instant, default=None):
+        """Dernière valeur enregistrée à l'instant donné."""
+        index = bisect.bisect_right(self.times.get(kind, []), instant) - 1
+        return self.values[kind][index] if index >= 0 else default
+
+
+class Replay():
+    """Collecteurs de substitution pilotés par un enregistrement et une horloge virtuelle."""
+    def __init__(self, path, render='transitions', output=sys.stdout):
+        self.recording = Recording(path)
+        self.clock = VirtualClock(self.recording.start)
+        self.render = render            # 'all', 'transitions' (1re image de chaque page) ou 'none'
+        self.output = output
+        self.page = None
+        self.key_index = 0
+        self.raspdac = _ReplayIP(self)
+        self.mixer = _ReplayMixer(self)
+        self.telecommand = _ReplayTelecommand(self)
+
+    def now(self):
+        return self.clock.time()
+
+    def mpd_server(self):
+        """Remplace le constructeur MpdServer de la boucle principale."""
+        return _ReplayMpd(self)
+
+    def page_displayed(self, state, page):
+        """Appelé à chaque passage : écrit les changements de page, indique s'il faut dessiner."""
+        changed = (page != self.page)
+        if changed:
+            self.output.write('{:10.1f} {:<10} {}\n'.format(self.now() - self.recording.start, state, page))
+            self.page = page
+        return self.render == 'all' or (self.render == 'transitions' and changed)
+
+
+class _ReplayIP():
+    def __init__(self, replay):
+        self.replay = replay
+
+    def get_ip(self, period=0):
+        return tuple(self.replay.recording.at('ip', self.replay.now(), ['127.0.0.1', 'broken']))
+
+
+class _ReplayMixer():
+    def __init__(self, replay):
+        self.replay = replay
+        self.config = {
+            'MUTE' :    { 'Control' : shell_controls_list[0],   'Items' : mute_list,    'Item0' : '',   'index_Item0' : 0,  'Items_number' : len(mute_list) },
+            'FILTER' :  { 'Control' : shell_controls_list[1],   'Items' : filter_list,  'Item0' : '',   'index_Item0' : 0,  'Items_number' : len(filter_list) },
+            'INPUT' :   { 'Control' : shell_controls_list[2],   'Items' : input_list,   'Item0' : '',   'index_Item0' : 0,  'Items_number' : len(input_list) }
+            }
+
+    def getconfig(self, period=0):
+        recorded = self.replay.recording.at('mixer', self.replay.now(), dict())
+        for control, (item, index) in recorded.items():
+            self.config[control]['Item0'] = item
+            self.config[control]['index_Item0'] = index
+        return self.config
+
+    def getcontrol(self, mixer_control):
+        return self.config[mixer_control]['Item0']
+
+
+class _ReplayTelecommand(InfraRedTelecommand):
+    """Touches enregistrées ; les actions modifient le menu sans lancer de commande."""
+    def __init__(self, replay):
+        self.replay = replay
+        self.execute = lambda cmd : None
+        self.pages = []
+
+    def get_key(self):
+        times = self.replay.recording.times.get('key', [])
+        if self.replay.key_index < len(times) and times[self.replay.key_index] <= self.replay.now():
+            key, speed = self.replay.recording.values['key'][self.replay.key_index]
+            self.replay.key_index += 1
+            self.key_stamp = time.perf_counter()
+            return key, speed
+        return 'NO_KEY', 'LOW'
+
+
+class _ReplayMpd():
+    def __init__(self, replay):
+        self.replay = replay
+        self.socket_status = 'OK'
+
+    def connect(self):
+        return ''
+
+    def getstatus(self):
+        if self.replay.now() > self.replay.recording.end:
+            raise ReplayFinished(0)
+        return MpdStatus(self.replay.recording.at('status', self.replay.now(), dict()))
+
+    def getcurrentsong(self):
+        return MpdSong(self.replay.recording.at('song', self.replay.now(), dict()))
+
+    def command(self, command):
+        return None                     # listes (file d'attente...) non enregistrées
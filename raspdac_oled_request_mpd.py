@@ -32,7 +32,15 @@
     Les méthodes de ce fichier, permettent de récupérer l'ensemble des champs dans des dictionnaires
     Les données de ces dictionnaires seront ainsi disponibles pour être éventuellement affichées
 '''
+import os
+import queue
 import socket                   # Gestion des connexions réseau
+import threading
+
+from raspdac_oled_stats import count
+
+MPD_HOST = os.environ.get('OHOLED_MPD_HOST', '127.0.0.1')    # Serveur Musical MPD intégré au Raspdac Midi (donc 'localhost')
+MPD_PORT = int(os.environ.get('OHOLED_MPD_PORT', '6600'))     # Port pour accéder au serveur MPD : paramètre 'port' défini dans le fichier /etc/mpd.conf
 
 # ----------------------------------------------------------------------------
 # Dictionnaire des champs renvoyés par le serveur MPD en réponse à une commande 'status\n'
@@ -80,13 +88,152 @@ mpd_currentsong_ref = {
     'Id': '0'                   # Indicateur de la position de la piste dans la playlist (part de 1)
     }
 
+# ----------------------------------------------------------------------------
+# Modèles des réponses du serveur MPD
+# -> les champs reçus sont conservés sous forme de texte (accès par mpd_status['volume'] pour les trames),
+#    les champs absents sont lus dans les dictionnaires de référence, sans recopie
+# -> les champs numériques utiles sont analysés une seule fois, à la réception
+# -> deux réponses se comparent par '==' et 'diff' (champs modifiés)
+class _MpdAnswer() :
+    __slots__ = ('fields',)
+    defaults = dict()
+
+    def __init__(self, fields=None) :
+        self.fields = fields if fields is not None else dict()
+
+    def __getitem__(self, key) :
+        try :
+            return self.fields[key]
+        except KeyError :
+            return self.defaults[key]
+
+    def __contains__(self, key) :
+        return key in self.fields or key in self.defaults
+
+    def get(self, key, default=None) :
+        return self.fields.get(key, self.defaults.get(key, default))
+
+    def items(self) :
+        """Champs effectivement reçus du serveur."""
+        return self.fields.items()
+
+    def __eq__(self, other) :
+        if isinstance(other, _MpdAnswer) :
+            return self.fields == other.fields
+        return NotImplemented
+
+    def __hash__(self) :
+        return hash(tuple(sorted(self.fields.items())))
+
+    def diff(self, other) :
+        """Noms des champs dont la valeur diffère de celle d'une autre réponse."""
+        return { key for key in self.fields.keys() | other.fields.keys() if self.get(key) != other.get(key) }
+
+    def __repr__(self) :
+        return '{}({!r})'.format(type(self).__name__, self.fields)
+
+
+def _number(text, kind=float, default=0) :
+    try :
+        return kind(text)
+    except (TypeError, ValueError) :
+        return default
+
+
+# Format audio ('44100:16:2' en PCM, 'dsd256:2' en DSD)
+class AudioFormat() :
+    __slots__ = ('text', 'kind', 'rate', 'bits', 'channels')
+
+    def __init__(self, text='0:0:0') :
+        self.text = text
+        audio = text.split(':')
+        if len(audio) > 2 :
+            self.kind = 'PCM'
+            self.rate = _number(audio[0], int)          # fréquence des échantillons (Hz)
+            self.bits = audio[1]                        # nombre de bits par échantillon ('f' en flottant)
+            self.channels = _number(audio[2], int)
+        else :
+            self.kind = audio[0].upper()                # DSD64, DSD128, DSD256, DSD512 ou DSD1024
+            self.rate = 0
+            self.bits = '1'
+            self.channels = _number(audio[-1], int)
+
+    def __eq__(self, other) :
+        if isinstance(other, AudioFormat) :
+            return self.text == other.text
+        return NotImplemented
+
+    def __hash__(self) :
+        return hash(self.text)
+
+    def __str__(self) :
+        return self.text
+
+
+# Réponse à la requête 'status'
+class MpdStatus(_MpdAnswer) :
+    __slots__ = ('state', 'volume', 'elapsed', 'duration', 'bitrate', 'audio')
+    defaults = mpd_status_ref
+
+    def __init__(self, fields=None) :
+        super().__init__(fields)
+        self.state = self['state']
+        self.volume = _number(self['volume'], int)
+        self.elapsed = _number(self['elapsed'])
+        self.duration = _number(self['duration'])
+        self.bitrate = _number(self['bitrate'], int)
+        self.audio = AudioFormat(self['audio'])
+
+
+# Réponse à la requête 'currentsong'
+class MpdSong(_MpdAnswer) :
+    __slots__ = ('duration', 'pos', 'id')
+    defaults = mpd_currentsong_ref
+
+    def __init__(self, fields=None) :
+        super().__init__(fields)
+        self.duration = _number(self['duration'])
+        self.pos = _number(self['Pos'], int)
+        self.id = _number(self['Id'], int)
+
+
+# Extraction des champs d'une réponse du serveur (un couple 'champ: valeur' par ligne, jusqu'à la ligne 'OK')
+def parse_fields(answer) :
+    fields = dict()
+    for line in answer.split('\n'):
+        if line == 'OK' or not line:
+            break
+        if ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        fields[key] = value.lstrip()
+    return fields
+
+# Argument d'une commande MPD entre guillemets (chemins, noms contenant des espaces)
+def quote(value) :
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+# Extraction des enregistrements d'une réponse en liste (un enregistrement commence à chaque champ 'first_key')
+def parse_records(answer, first_key) :
+    records = []
+    for line in answer.split('\n'):
+        if line == 'OK' or not line:
+            break
+        if ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        if key == first_key or not records:
+            records.append(dict())
+        records[-1][key] = value.lstrip()
+    return records
+
 # ----------------------------------------------------------------------------
 # Classe d'accès et d'interrogation du Serveur Musical MPD
 class MpdServer() :
     # Initialisation
     def __init__(self) :
-        self.host = '127.0.0.1'         # Serveur Musical MPD intégré au Raspdac Midi (donc 'localhost')
-        self.port = 6600                # Port pour accéder au serveur MPD : paramètre 'port' défini dans le fichier /etc/mpd.conf
+        self.host = MPD_HOST
+        self.port = MPD_PORT
         self.bufsize = 4096             # Taille du buffer audio : paramètre 'audio_buffer_size' défini dans le fichier /etc/mpd.conf
         
         self.socket = socket.socket(    # Construction du socket
@@ -95,9 +242,11 @@ class MpdServer() :
         self.socket.settimeout(3.0)
 
         self.socket_status = 'OK'       # status du socket au serveur MPD
+        self.idling = False             # commande 'idle' en cours (attente d'événements du serveur)
     
     # Connexion au serveur MPD
     def connect(self) :
+        count('mpd_connects')
         try :
             self.socket.connect((self.host, self.port))
             response = self.socket.recv(self.bufsize).decode("Utf8")
@@ -119,34 +268,22 @@ class MpdServer() :
         command = 'currentsong\n'
         return self.mpd_command(command)
 
+    # Requête 'playlistid' au serveur MPD : informations d'un titre de la file (par son identifiant)
+    def getsong(self, songid) :
+        return MpdSong(parse_fields(self.request('playlistid {}\n'.format(songid))))
+
     # Traitement de la réponse à la requête
+    # -> 'status' : MpdStatus, 'currentsong' : MpdSong (champs manquants lus dans les dictionnaires de référence)
     def mpd_command(self, command) :
         # la réponse du serveur MPD est une chaîne de caractères (voir commentaires en début de fichier)
-        answer = self.request(command)
-
-        # Extraction des champs de la réponse et sauvegarde dans un dictionnaire
-        dict_answer = dict()
-        lines = answer.split('\n')
-        for line in lines:
-            if line == 'OK' or not line:
-                break
-            if ':' not in line:
-                continue
-            key, value = line.split(':', 1)
-            dict_answer[key] = value.lstrip()
-
-        # Remplissage du dictionnaire avec les champs manquants
+        fields = parse_fields(self.request(command))
         if command == 'status\n' :
-            for key, value in mpd_status_ref.items() :
-                dict_answer[key] = dict_answer.get(key, value)
-        else :
-            for key, value in mpd_currentsong_ref.items() :
-                dict_answer[key] = dict_answer.get(key, value)
-        
-        return dict_answer
+            return MpdStatus(fields)
+        return MpdSong(fields)
 
     # Envoi de la Requête à destination du serveur MPD
     def request(self, command) :
+        count('mpd_requests')
         try :
             self.socket.send(command.encode("Utf8"))
             response = self.socket.recv(self.bufsize).decode("Utf8")
@@ -158,6 +295,218 @@ class MpdServer() :
             self.socket_status = 'KO'
             return ''
 
+    # Attente d'événements du serveur (commande 'idle') : le socket devient lisible
+    # dès qu'un sous-système change (lecture, volume...), sans interrogation périodique
+    def idle(self, subsystems='player mixer') :
+        count('mpd_requests')
+        try :
+            self.socket.send('idle {}\n'.format(subsystems).encode("Utf8"))
+            self.idling = True
+        except OSError :
+            self.socket_status = 'KO'
+
+    # Fin de l'attente : retourne la liste des sous-systèmes modifiés
+    # -> 'changed' indique que le socket est déjà lisible (le serveur a répondu à 'idle')
+    def noidle(self, changed=False) :
+        if not self.idling :
+            return []
+        self.idling = False
+        try :
+            if not changed :
+                self.socket.send(b'noidle\n')
+            answer = self.read_answer()
+        except OSError :
+            self.socket_status = 'KO'
+            return []
+        return [line.split(':', 1)[1].strip() for line in answer.split('\n') if line.startswith('changed:')]
+
+    # Requête dont la réponse peut dépasser la taille du buffer (listes)
+    # -> retourne la réponse complète, ou None si le serveur répond par une erreur ('ACK ...') ou si le lien est perdu
+    def command(self, command) :
+        count('mpd_requests')
+        try :
+            self.socket.send(command.encode("Utf8"))
+            answer = self.read_answer()
+        except OSError :
+            self.socket_status = 'KO'
+            return None
+        self.socket_status = 'OK'
+        if answer.startswith('ACK ') or '\nACK ' in answer :
+            return None
+        return answer
+
+    # Requête à réponse binaire ('albumart', 'readpicture') : retourne (champs, données)
+    # -> la réponse est 'clef: valeur' ... 'binary: n', n octets, puis 'OK'
+    # -> données vides si le serveur n'a pas d'image, None s'il répond par une erreur ou si le lien est perdu
+    def binary_command(self, command) :
+        count('mpd_requests')
+        fields = dict()
+        data = b''
+        buffer = bytearray()
+        position = 0
+        try :
+            self.socket.send(command.encode("Utf8"))
+            while True :
+                end = buffer.find(b'\n', position)
+                if end < 0 :
+                    chunk = self.socket.recv(self.bufsize)
+                    if not chunk :
+                        raise ConnectionResetError('connexion MPD fermée')
+                    buffer += chunk
+                    continue
+                line = bytes(buffer[position:end]).decode("Utf8", errors="replace")
+                position = end + 1
+                if line == 'OK' :
+                    return fields, data
+                if line.startswith('ACK ') :
+                    return fields, None
+                key, _, value = line.partition(': ')
+                fields[key] = value
+                if key == 'binary' :
+                    size = int(value)
+                    while len(buffer) < position + size + 1 :
+                        chunk = self.socket.recv(max(self.bufsize, position + size + 1 - len(buffer)))
+                        if not chunk :
+                            raise ConnectionResetError('connexion MPD fermée')
+                        buffer += chunk
+                    data = bytes(buffer[position:position + size])
+                    position += size + 1        # données suivies d'un saut de ligne
+        except (OSError, ValueError) :
+            self.socket_status = 'KO'
+            return fields, None
+
+    # Image d'un titre : image intégrée au fichier ('readpicture') ou fichier cover.* du répertoire ('albumart')
+    # -> lue par morceaux (taille limitée par le serveur, voir 'binarylimit') ; retourne b'' si le titre n'a pas d'image
+    def getpicture(self, uri, command='readpicture') :
+        picture = bytearray()
+        while True :
+            fields, data = self.binary_command('{} {} {}\n'.format(command, quote(uri), len(picture)))
+            if data is None :
+                return b'' if self.socket_status == 'OK' else None
+            if not data :
+                return bytes(picture)
+            picture += data
+            if len(picture) >= _number(fields.get('size'), int) :
+                return bytes(picture)
+
+    # Lecture d'une réponse complète (jusqu'à la ligne 'OK' ou 'ACK ...'), éventuellement en plusieurs morceaux
+    # -> les morceaux sont accumulés dans une liste (une liste de la bibliothèque peut peser plusieurs Mo)
+    def read_answer(self) :
+        chunks = []
+        tail = b''                      # fin de la réponse reçue (recherche de la dernière ligne)
+        while True :
+            chunk = self.socket.recv(self.bufsize)
+            if not chunk :
+                raise ConnectionResetError('connexion MPD fermée')
+            chunks.append(chunk)
+            tail = (tail + chunk)[-512:]
+            if tail.endswith(b'\n') :
+                last = tail[:-1].rsplit(b'\n', 1)[-1]
+                if last == b'OK' or last.startswith(b'ACK ') :
+                    return b''.join(chunks).decode("Utf8", errors="replace")
+
+
+# ----------------------------------------------------------------------------
+# Lecture anticipée des informations du titre suivant
+# -> 'status' donne l'identifiant du titre suivant ('nextsongid') : ses informations sont demandées
+#    en tâche de fond, sur une connexion dédiée, pour que la boucle principale puisse préparer
+#    son affichage (mesures des textes, bandes défilantes) avant le changement de titre
+class NextSongPrefetcher() :
+    def __init__(self, server=MpdServer) :
+        self.server = server            # constructeur de la connexion dédiée
+        self.mpd = None
+        self.requested = None           # identifiant du dernier titre demandé
+        self.ready = None               # (identifiant, MpdSong) reçu et non encore pris par la boucle principale
+        self.lock = threading.Lock()
+        self.requests = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.run, name='oholed-prefetch', daemon=True)
+        self.thread.start()
+
+    # Appelé à chaque réponse 'status' : demande le titre suivant s'il a changé
+    def update(self, mpd_status) :
+        songid = mpd_status.fields.get('nextsongid')
+        if songid is None or mpd_status.state == 'stop' or songid == self.requested :
+            return
+        try :
+            self.requests.put_nowait(songid)
+            self.requested = songid
+        except queue.Full :             # demande précédente en cours : nouvel essai au passage suivant
+            pass
+
+    # Titre suivant reçu depuis le dernier appel (ou None)
+    def take(self) :
+        with self.lock :
+            ready, self.ready = self.ready, None
+        return ready
+
+    def run(self) :
+        while True :
+            songid = self.requests.get()
+            if self.mpd is None or self.mpd.socket_status == 'KO' :
+                self.mpd = self.server()
+                self.mpd.connect()
+            song = self.mpd.getsong(songid)
+            if self.mpd.socket_status == 'KO' :
+                self.requested = None   # nouvelle demande au prochain 'status'
+                continue
+            count('songs_prefetched')
+            with self.lock :
+                self.ready = (songid, song)
+
+
+# ----------------------------------------------------------------------------
+# Fenêtre de la file d'attente ("queue") du serveur MPD
+# -> seules les entrées visibles sont demandées ('playlistinfo début:fin', par blocs de QUEUE_CHUNK)
+# -> les entrées sont conservées tant que la version de la file ('playlist' dans 'status') ne change pas ;
+#    à chaque nouvelle version, seules les positions conservées qui ont changé sont oubliées ('plchangesposid')
+QUEUE_CHUNK = 32                # Nombre d'entrées demandées par requête
+QUEUE_CACHE_SIZE = 512          # Nombre maximal d'entrées conservées
+
+class QueueCache() :
+    def __init__(self, chunk=QUEUE_CHUNK, size=QUEUE_CACHE_SIZE) :
+        self.chunk = chunk
+        self.size = size
+        self.version = None             # version de la file correspondant aux entrées conservées
+        self.length = 0                 # nombre de titres de la file
+        self.entries = dict()           # position -> MpdSong
+
+    # Mise à jour suite à une réponse 'status'
+    def sync(self, mpd, mpd_status) :
+        version = mpd_status['playlist']
+        self.length = _number(mpd_status['playlistlength'], int)
+        if version != self.version and self.version is not None and self.entries :
+            first, last = min(self.entries), max(self.entries)
+            answer = None
+            if last - first < self.size :    # au-delà, la réponse coûterait plus que les entrées conservées
+                answer = mpd.command('plchangesposid {} {}:{}\n'.format(self.version, first, last + 1))
+            if answer is None :
+                self.entries.clear()    # serveur ancien (sans plage), lien perdu ou entrées éparses : tout sera redemandé
+            else :
+                for change in parse_records(answer, 'cpos') :
+                    position = _number(change.get('cpos'), int, -1)
+                    entry = self.entries.get(position)
+                    if entry is not None and entry['Id'] != change.get('Id') :
+                        del self.entries[position]
+        self.version = version
+        for position in [position for position in self.entries if position >= self.length] :
+            del self.entries[position]
+
+    # Entrées des positions [start, start + count[ (None pour une entrée indisponible)
+    def window(self, mpd, start, count) :
+        positions = range(max(0, start), min(start + count, self.length))
+        missing = [position for position in positions if position not in self.entries]
+        if missing :
+            first = missing[0] - missing[0] % self.chunk
+            last = min(self.length, max(missing[-1] + 1, first + self.chunk))
+            answer = mpd.command('playlistinfo {}:{}\n'.format(first, last))
+            for record in parse_records(answer or '', 'file') :
+                self.entries[_number(record.get('Pos'), int, -1)] = MpdSong(record)
+            if len(self.entries) > self.size :
+                # on ne garde que les entrées les plus proches de la fenêtre
+                kept = sorted(self.entries, key=lambda position : abs(position - start))[:self.size // 2]
+                self.entries = { position : self.entries[position] for position in kept }
+        return [self.entries.get(position) for position in positions]
+
 
 # ----------------------------------------------------------------------------
 # Processing des champs à afficher dans les pages 'I2S-PLAY1' et 'I2S-PLAY2'
@@ -192,7 +541,7 @@ class MpdServer() :
 def mpd_data_processing(mpd_status, mpd_song) :
 
     # Test de l'activité du player
-    if mpd_status['state'] != 'stop' and mpd_status['audio'] != '0:0:0' :
+    if mpd_status.state != 'stop' and mpd_status.audio.text != '0:0:0' :
         # Cas du player actif
         if mpd_song['Artist'] != 'no artist' :
             # Cas général du titre musical (où les champs 'Artist', 'Album' et 'Title' sont donnés)
@@ -220,12 +569,12 @@ def mpd_data_processing(mpd_status, mpd_song) :
             i2s_play2_l1 = champs[-1]       # Titre
 
         # processing du champ audio
-        i2s_play2_l2 = mpd_audio_processing(mpd_status['audio'], mpd_status['bitrate'], mpd_status['duration'])
+        i2s_play2_l2 = mpd_audio_processing(mpd_status.audio, mpd_status['bitrate'], mpd_status.duration)
 
         # Processing du temps écoulé sur un titre (elapsed)
         # -> conversion du champ en 'min:sec' et en secondes entières
         # -> conversion en 'hour:min:sec' si le temps écoulé est supérieur à 1h
-        elapsed_calc = float(mpd_status['elapsed'])
+        elapsed_calc = mpd_status.elapsed
         hour = '{:02d}'.format(int(elapsed_calc/3600)%24)
         min = '{:02d}'.format(int(elapsed_calc%3600/60))
         sec = '{:02d}'.format(int(elapsed_calc%60))
@@ -235,7 +584,7 @@ def mpd_data_processing(mpd_status, mpd_song) :
 
         # Processing de la durée d'un titre (duration)
         # -> conversion du champ en 'min:sec' et en secondes entières
-        duration_calc = float(mpd_status['duration'])
+        duration_calc = mpd_status.duration
         min = '{:02d}'.format(int(duration_calc/60))
         sec = '{:02d}'.format(int(duration_calc%60))
         duration_MS = min + ":" + sec
@@ -273,9 +622,14 @@ def mpd_data_processing(mpd_status, mpd_song) :
 #       - le format (PCM ou DSD)
 #       - la fréquence des échantillons
 #       - le nombre de bits par échantillon (dans le cas du format PCM)
-def mpd_audio_processing(champ_audio, champ_bitrate, champ_duration) :
+def mpd_audio_processing(audio, champ_bitrate, duration) :
+    # Le texte ne change qu'avec le titre : il est conservé pour les passages suivants
+    key = (audio.text, champ_bitrate, duration == 0)
+    info_audio = _audio_info_cache.get(key)
+    if info_audio is not None :
+        return info_audio
 
-    if champ_duration == '0.000' :
+    if duration == 0 :
         # Cas d'un flux à durée non définie (cas des web radios)
         # La valeur du rythme binaire est alors renvoyée
         info_audio = 'stream / {freq} kbps'.format(freq=champ_bitrate)
@@ -283,25 +637,23 @@ def mpd_audio_processing(champ_audio, champ_bitrate, champ_duration) :
     else :
         # cas d'un titre d'une durée finie (cas d'un morceau musical)
         # Le format (PCM ou DSD), la fréquence des échantillons et le nombre de bits par échantillons sont alors renvoyés
-        audio = champ_audio.split(':')
-        if len(audio) > 2:
+        if audio.kind == 'PCM' :
             # cas d'un format PCM (exemple : 44100:16:2)
-            info_format = "PCM"
-            frequence = float(audio[0])/1000            # extraction de la fréquence et conversion en kbits/s
-            if audio[0][-2] != '0' : precision = 2      # on ne garde que les chiffres non nuls après la virgule
-            elif audio[0][-3] != '0' : precision = 1
+            frequence = audio.rate/1000                 # conversion de la fréquence en kHz
+            if (audio.rate // 10) % 10 != 0 : precision = 2     # on ne garde que les chiffres non nuls après la virgule
+            elif (audio.rate // 100) % 10 != 0 : precision = 1
             else : precision = 0
             info_freq = '{:.{prec}f}'.format(frequence, prec=precision)
-            info_bit = audio[1]                         # extraction du nombre de bits par échantillon
-            info_canaux = audio[2]                      # extraction du nombre de canaux audio
-            info_audio = 'PCM / {freq} kHz / {bits} bits'.format(freq=info_freq, bits=info_bit)
-        
+            info_audio = 'PCM / {freq} kHz / {bits} bits'.format(freq=info_freq, bits=audio.bits)
+
         else :
             # cas d'un format DSD (exemple : dsd256:2)
-            info_format = audio[0].upper()              # extraction du type de DSD : DSD64, DSD128, DSD256, DSD512 ou DSD1024
-            info_freq = champ_bitrate                   # extraction du bit rate en kbits/s
-            info_bit = 1                                # 1 bit par échantillon
-            info_canaux = audio[1]                      # extraction du nombre de canaux audio
-            info_audio = '{format} / {freq} kbps'.format(format=info_format, freq=info_freq)
+            # -> type de DSD (DSD64, DSD128, DSD256, DSD512 ou DSD1024) et bit rate en kbits/s
+            info_audio = '{format} / {freq} kbps'.format(format=audio.kind, freq=champ_bitrate)
 
+    if len(_audio_info_cache) > 64 :
+        _audio_info_cache.clear()
+    _audio_info_cache[key] = info_audio
     return info_audio
+
+_audio_info_cache = dict()
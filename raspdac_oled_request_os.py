@@ -5,11 +5,15 @@
 Version modernisée pour Debian Trixie : évite ifconfig/net-tools,
 limite l’usage de shell=True et retourne des chaînes propres.
 """
+import os
 import shlex
+import shutil
 import subprocess
 import time
 from typing import Iterable, Sequence
 
+from raspdac_oled_stats import count
+
 
 def shell_command(cmd: str | Sequence[str], timeout: float = 5.0) -> str:
     """Exécute une commande et retourne stdout sans saut de ligne final.
@@ -23,6 +27,7 @@ def shell_command(cmd: str | Sequence[str], timeout: float = 5.0) -> str:
     else:
         args = list(cmd)
         use_shell = False
+    count("subprocess_launches")
     try:
         result = subprocess.run(
             args,
@@ -40,11 +45,13 @@ def shell_command(cmd: str | Sequence[str], timeout: float = 5.0) -> str:
     return result.stdout.rstrip("\n")
 
 
+# Commande ip(8) résolue une fois pour toutes dans le PATH (un seul sous-processus par interface)
+IP_COMMAND = shutil.which("ip") or "/usr/sbin/ip"
+
+
 def _ipv4_for_interface(interface: str) -> str:
     """Retourne l’adresse IPv4 d’une interface via la commande ip(8)."""
-    output = shell_command(["/usr/sbin/ip", "-4", "-o", "addr", "show", "dev", interface])
-    if not output:
-        output = shell_command(["/bin/ip", "-4", "-o", "addr", "show", "dev", interface])
+    output = shell_command([IP_COMMAND, "-4", "-o", "addr", "show", "dev", interface])
     for line in output.splitlines():
         parts = line.split()
         if "inet" in parts:
@@ -80,3 +87,86 @@ class RaspdacIP:
             self.time_ip = time_now
 
         return self.ip_adr, self.ip_type
+
+
+# Sous-périphérique ALSA de lecture de la carte DAC (fichiers 'hw_params' et 'status')
+HW_PARAMS_DIR = os.environ.get("OHOLED_HW_PARAMS", "/proc/asound/card0/pcm0p/sub0")
+
+# Nombre de bits utiles des formats ALSA courants (les autres sont affichés tels quels)
+ALSA_FORMAT_BITS = {
+    "S16_LE": "16", "S24_LE": "24", "S24_3LE": "24", "S32_LE": "32",
+    "FLOAT_LE": "float", "DSD_U8": "DSD", "DSD_U16_LE": "DSD", "DSD_U32_LE": "DSD", "DSD_U32_BE": "DSD",
+}
+
+
+def _parse_proc(text: str) -> dict:
+    """Champs 'clef: valeur' d'un fichier de /proc/asound (vide si 'closed')."""
+    fields = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(":")
+        if sep:
+            fields[key.strip()] = value.strip()
+    return fields
+
+
+def dac_stream_text(rate: int, alsa_format: str) -> str:
+    """Texte du flux reçu par le DAC, par exemple 'DAC 44.1 kHz / 32 bits'."""
+    bits = ALSA_FORMAT_BITS.get(alsa_format, alsa_format)
+    if bits == "DSD":
+        return "DAC DSD / {:g} kHz".format(rate / 1000)
+    return "DAC {:g} kHz / {} bits".format(rate / 1000, bits)
+
+
+class AlsaHwParams:
+    """Flux réellement envoyé au DAC (après rééchantillonnage éventuel par MPD).
+
+    Les fichiers 'hw_params' et 'status' du sous-périphérique ALSA restent
+    ouverts : chaque interrogation est un seul pread(2) par fichier, sans
+    sous-processus. Un fichier absent (carte pas encore chargée) est rouvert
+    à l'interrogation suivante.
+    """
+    FILES = ("hw_params", "status")
+
+    def __init__(self, directory: str = HW_PARAMS_DIR):
+        self.directory = directory
+        self.fds = dict.fromkeys(self.FILES)
+        self.time_read = 0.0
+        self.stream = {"state": "closed", "rate": 0, "format": "", "channels": 0, "text": ""}
+
+    def _read(self, name: str) -> str:
+        if self.fds[name] is None and self.directory:
+            try:
+                self.fds[name] = os.open(os.path.join(self.directory, name), os.O_RDONLY)
+            except OSError:
+                return ""
+        if self.fds[name] is None:
+            return ""
+        try:
+            return os.pread(self.fds[name], 4096, 0).decode("ascii", errors="replace")
+        except OSError:
+            os.close(self.fds[name])
+            self.fds[name] = None
+            return ""
+
+    def get(self, period: float = 0) -> dict:
+        """Dictionnaire 'state', 'rate', 'format', 'channels' et 'text' (vide si le flux est fermé)."""
+        time_now = time.monotonic()
+        if time_now - self.time_read >= period:
+            self.time_read = time_now
+            hw_params = _parse_proc(self._read("hw_params"))
+            status = _parse_proc(self._read("status"))
+            rate = hw_params.get("rate", "0").split(" ", 1)[0]
+            self.stream = {
+                "state": status.get("state", "closed"),
+                "rate": int(rate) if rate.isdigit() else 0,
+                "format": hw_params.get("format", ""),
+                "channels": int(hw_params.get("channels", "0") or 0),
+            }
+            self.stream["text"] = dac_stream_text(self.stream["rate"], self.stream["format"]) if self.stream["rate"] else ""
+        return self.stream
+
+    def close(self) -> None:
+        for name, fd in self.fds.items():
+            if fd is not None:
+                os.close(fd)
+                self.fds[name] = None
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Gestion de la page "BROWSE" (bibliothèque MPD) pilotée par la télécommande
+# Fichier : raspdac_oled_screen_browse.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Page 'BROWSE' : navigation artiste -> album -> titre.
+
+La page s'ouvre par une touche de la télécommande (OHOLED_KEY_BROWSE,
+KEY_MEDIA par défaut) et se ferme par la même touche, par MENU ou après
+BROWSE_TIMEOUT secondes sans touche :
+-> UP / DOWN : entrée précédente / suivante (par 5 en appuis rapides)
+-> RIGHT : niveau suivant (albums de l'artiste, titres de l'album)
+-> LEFT : niveau précédent (fermeture de la page depuis les artistes)
+-> ENTER : niveau suivant depuis les artistes, sinon ajout de l'album ou du
+   titre sélectionné à la file d'attente et lecture
+
+La navigation ne lit que l'index local (raspdac_oled_library.LibraryIndex) :
+aucune requête au serveur MPD n'est faite pendant l'appui des touches.
+"""
+import os
+import shlex
+
+from raspdac_oled_library import UNKNOWN
+
+BROWSE_KEY = os.environ.get('OHOLED_KEY_BROWSE', 'KEY_MEDIA')  # Touche d'ouverture / fermeture de la page
+BROWSE_TIMEOUT = 30             # Fermeture de la page après cette durée (en secondes) sans touche
+BROWSE_LINES = 4                # Nombre de lignes affichées (l'entrée sélectionnée est la deuxième)
+
+
+# Lignes d'une liste autour de l'entrée sélectionnée (affichée en deuxième ligne)
+def list_lines(names, selected, lines=BROWSE_LINES) :
+    screen = dict()
+    for line in range(lines) :
+        position = selected - 1 + line
+        screen['line{}'.format(line)] = names[position] if 0 <= position < len(names) else ''
+    return screen
+
+
+# Commande d'ajout à la file d'attente (mpc findadd) puis de lecture du premier titre ajouté
+# -> artiste ou album '(inconnu)' : valeur vide, qui trouve les titres sans ce tag
+def findadd_command(queue_length, **tags) :
+    filters = ' '.join('{} {}'.format(tag, shlex.quote('' if value == UNKNOWN else value)) for tag, value in tags.items())
+    return '/usr/bin/mpc findadd {} && /usr/bin/mpc play {}'.format(filters, queue_length + 1)
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe de gestion de la page BROWSE
+class PageBrowse() :
+    def __init__(self, library, key=BROWSE_KEY, timeout=BROWSE_TIMEOUT) :
+        self.library = library          # index local de la bibliothèque (LibraryIndex)
+        self.key = key                  # touche d'ouverture de la page
+        self.keys = (key,)
+        self.timeout = timeout
+        self.status = 'OFF'
+        self.level = 0                  # 0 : artistes, 1 : albums, 2 : titres
+        self.selected = [0, 0, 0]       # entrée sélectionnée à chaque niveau
+        self.version = None             # version de l'index parcouru
+        self.artists, self.albums, self.tracks = [], [], []     # index parcouru (relevé à chaque nouvelle version)
+        self.queue_length = 0           # longueur de la file d'attente (position des titres ajoutés)
+        self.time_key = None            # instant de la dernière touche (horloge de la boucle principale)
+
+    def open(self, key=None) :
+        self.status = 'ON'
+        self.time_key = None
+        self.library.refresh(force=True)
+
+    def close(self) :
+        self.status = 'OFF'
+
+    # Entrées du niveau courant
+    def names(self) :
+        artist, album = self.selected[0], self.selected[1]
+        if self.level == 0 :
+            return self.artists
+        if self.level == 1 :
+            return self.albums[artist]
+        return self.tracks[artist][album]
+
+    # Action déclenchée par une touche lorsque la page est active
+    # -> retourne la commande shell éventuelle
+    def action(self, key, speed='LOW') :
+        cmd = ""
+        self.time_key = None            # l'instant est relevé au prochain passage (update)
+        step = 5 if speed == 'HIGH' else 1
+        if key == self.key or key == 'KEY_MENU' :
+            self.close()
+        elif self.version is None :     # index pas encore disponible
+            pass
+        elif key == 'KEY_UP' :
+            self.move(-step)
+        elif key == 'KEY_DOWN' :
+            self.move(step)
+        elif key == 'KEY_LEFT' :
+            if self.level == 0 :
+                self.close()
+            else :
+                self.level -= 1
+        elif key == 'KEY_RIGHT' or (key == 'KEY_ENTER' and self.level == 0) :
+            if self.level < 2 and self.names() :
+                self.level += 1
+                self.selected[self.level] = 0
+        elif key == 'KEY_ENTER' and self.names() :
+            artist, album, title = self.selected
+            tags = { 'artist' : self.artists[artist], 'album' : self.albums[artist][album] }
+            if self.level == 2 :
+                tags['title'] = self.tracks[artist][album][title]
+            cmd = findadd_command(self.queue_length, **tags)
+            self.close()
+        return cmd
+
+    def move(self, step) :
+        names = self.names()
+        if names :
+            self.selected[self.level] = min(max(self.selected[self.level] + step, 0), len(names) - 1)
+
+    # Construction du dictionnaire 'browse_screen' (affichage de la page 'BROWSE')
+    def update(self, mpd_status, now) :
+        browse_screen = { 'state' : self.status }
+        if self.status != 'ON' :
+            self.library.refresh()      # vérification périodique de 'db_update'
+            return browse_screen
+        if self.time_key is None :
+            self.time_key = now
+        elif now - self.time_key >= self.timeout :
+            self.close()
+            browse_screen['state'] = self.status
+            return browse_screen
+        self.queue_length = mpd_status.fields.get('playlistlength', '0')
+        self.queue_length = int(self.queue_length) if self.queue_length.isdigit() else 0
+        if not self.library.ready :
+            browse_screen.update(list_lines(['Indexation en cours...'], 0))
+            browse_screen['header'] = 'Bibliothèque'
+            return browse_screen
+        if self.version != self.library.version :    # nouvel index : retour à la liste des artistes
+            self.version = self.library.version
+            self.artists, self.albums, self.tracks = self.library.data
+            self.level = 0
+            self.selected = [min(self.selected[0], max(len(self.artists) - 1, 0)), 0, 0]
+        names = self.names()
+        browse_screen.update(list_lines(names, self.selected[self.level]))
+        if not names :
+            browse_screen['header'] = 'Bibliothèque vide'
+        elif self.level == 0 :
+            browse_screen['header'] = 'Artistes {} / {}'.format(self.selected[0] + 1, len(names))
+        elif self.level == 1 :
+            browse_screen['header'] = self.artists[self.selected[0]]
+        else :
+            browse_screen['header'] = self.albums[self.selected[0]][self.selected[1]]
+        return browse_screen
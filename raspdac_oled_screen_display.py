@@ -20,22 +20,26 @@
 # ============================================================================
 # IMPORT (Librairies / classes / Fonctions utilisées par ce script)
 # ============================================================================
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image
-from PIL import ImageFont
 from PIL import ImageDraw
 
-import RPi.GPIO as GPIO                     # Gestion du port GPIO du Raspberry Pi
-from luma.core.interface.serial import spi  # Gestion des bus série de type I2C et SPI
-
-from luma.core.render import canvas         # Gestion de l'affichage sur un écran (canvas)
-from luma.oled.device import ssd1306        # Gestion de l'écran OLED SSD1309 (compatible SSD1306)
-
 from random import randint                  # Génération de nombre entier aléatoire
 from typing import Tuple
 
 from raspdac_oled_screen_frames import frames
+from raspdac_oled_screen_frames import frames_for
+from raspdac_oled_screen_frames import copy_frames
+from raspdac_oled_fonts import get_font
+from raspdac_oled_fonts import resolve_font
+from raspdac_oled_stats import count
+from raspdac_oled_display_backends import open_device
 
 # Caractères spéciaux pour l'affichage d'icônes avec la police "awesome" 
 # ----------------------------------------------------------------------------
@@ -57,27 +61,112 @@ icons['right']   = "\uf0da"        # code Hexa OxF0DA => icône flèche "RIGHT"
 # vitesse de scrolling exprimée en pixels par seconde
 scrolling_speed = 30
 
+# Contraste de l'écran en fonctionnement normal (valeur programmée par luma à l'initialisation) et en veille 'dim'
+NORMAL_CONTRAST = 0xCF
+IDLE_CONTRAST = 0x01
+
+
+# Ecrans secondaires : 'périphérique:LARGEURxHAUTEUR[:rotation[:trames]]' séparés par des virgules
+# (par exemple 'ssd1306_i2c:128x32:0,ssd1322:256x64') ; rotation 0 et trames de la résolution par défaut
+SECONDARY_DISPLAYS = os.environ.get('OHOLED_SECONDARY_DISPLAYS', '')
+
 
 # Classe de gestion de l'affichage sur l'écran OLED
 # ----------------------------------------------------------------------------
 class OledScreen() :
-    def __init__(self) :
-        # Dimensions de l'écran
-        self.oled_width    = 128
-        self.oled_height    = 64
-        # Configuration Bus série SPI entre le Raspberry Pi et l'écran OLED
-        serial = spi(port=0, device=0, gpio_DC=27, gpio_RST=24)
-        
-        # Ecran OLED piloté par le port série SPI
+    def __init__(self, backend=None, width=128, height=64, rotate=2, frames=frames, name=None) :
+        # Ecran OLED piloté par le port série SPI (ou écran virtuel, voir raspdac_oled_display_backends.py)
         # Rotation logicielle de 180° de l'écran (monté à l'envers dans le Raspdac Mini)
-        self.device = ssd1306(serial, rotate=2)
+        time_open = time.monotonic()
+        self.device = open_device(backend, width, height, rotate=rotate, name=name)
+        self.device_open_time = time.monotonic() - time_open   # durée d'ouverture de l'écran (rapport de démarrage)
+        # Dimensions de l'écran (échangées par le périphérique pour une rotation de 90° ou 270°)
+        self.oled_width, self.oled_height = self.device.size
         
-        # Chargement des trames de pages et Construction des polices de caractères
-        self.dynamic_pages = fill_frames_with_builded_fonts(frames)
+        # Chargement des trames de pages
+        # Chaque page n'est compilée (PagePlan : polices, calque des objets statiques) qu'à son premier affichage
+        # (la page 'INIT' peut ainsi s'afficher sans charger les polices des autres pages)
+        self.dynamic_pages = frames
+        self.plans = dict()
+        self.frames_key = '{}x{}'.format(*self.device.size)    # jeu de trames (frame_sets) de l'écran
+        self.last_frame = None              # octets de la dernière image envoyée à l'écran
+        self.strips = OrderedDict()         # bandes des champs défilants de l'écran (STRIP_CACHE_SIZE, voir text_strip)
+        self.mirror = None                  # miroir de l'écran (raspdac_oled_mirror.FrameMirror, OHOLED_MIRROR_SOCKET)
+
+    # Remplacement des trames (mise en page rechargée, voir raspdac_oled_layout.py), entre deux images
+    # -> 'plans' : pages déjà compilées (cache sur disque), les autres le sont à leur premier affichage
+    def load_frames(self, frames, plans=None) :
+        self.dynamic_pages = frames
+        self.plans = dict(plans or {})
+
+    # Plan de rendu d'une page (compilé au premier affichage, polices construites au premier usage)
+    def plan(self, page) :
+        plan = self.plans.get(page)
+        if plan is None :
+            plan = self.plans[page] = compile_page(self.dynamic_pages[page], self.device.size, self.device.mode)
+        if not plan.fonts :
+            fill_page_with_builded_fonts(plan.objects)
+            plan.fonts = True
+        return plan
 
+    # Affichage d'une page : mise en page puis envoi vers l'écran
     def affichage_page(self, page, connectors, reset_scrolling, loop_period) :
-        # Analyse de chaque object de la page
-        for key, object in self.dynamic_pages[page].items() :
+        image = self.compose_page(page, connectors, reset_scrolling, loop_period)
+        self.flush(image)
+
+    # Envoi d'une image vers l'écran (bus SPI), sauf si elle est identique à la précédente
+    # -> la même comparaison décide de l'envoi au miroir de l'écran
+    def flush(self, image) :
+        frame = image.tobytes()
+        if frame == self.last_frame :
+            count('frames_unchanged')
+            return
+        self.last_frame = frame
+        self.device.display(image)
+        count('frames_rendered')
+        count('spi_bytes', self.oled_width * self.oled_height // 8)
+        if self.mirror is not None :
+            self.mirror.publish(frame)
+
+    # Préparation d'une page (mesures des textes, bandes des champs défilants) sans modifier l'affichage en cours
+    # -> utilisée pour le titre suivant : au changement de titre, la première image est dessinée sans nouvelle mesure
+    def prerender(self, page, connectors) :
+        for key, object in self.plan(page).objects.items() :
+            if object['type'] != 'text' and object['type'] != 'scrolling' :
+                continue
+            object = dict(object)           # copie : l'objet affiché (position de défilement...) n'est pas modifié
+            if object.get('connector') != None :
+                group_data, id_data = object['connector']
+                if id_data not in connectors.get(group_data, ()) :
+                    continue
+                object = get_connector(object, connectors)
+            object = justify_fields(object)
+            if object['type'] == 'scrolling' :
+                object = process_scrolling(object, True, self.oled_width, 0)
+                text_strip(object['font'], object['value_scroll'], object['xj'], object['yj'], self.strips)
+
+    # Mise en veille de l'écran : extinction ('off') ou baisse du contraste ('dim')
+    def sleep(self, mode='off') :
+        if mode == 'off' :
+            self.device.hide()
+        else :
+            self.device.contrast(IDLE_CONTRAST)
+
+    # Réveil de l'écran
+    def wake(self) :
+        self.device.contrast(NORMAL_CONTRAST)
+        self.device.show()
+
+    # Contraste de l'écran (fondu entre deux pages, voir raspdac_oled_transitions.py)
+    def contrast(self, level) :
+        self.device.contrast(level)
+
+    # Mise en page d'une page dans une image (sans accès à l'écran)
+    def compose_page(self, page, connectors, reset_scrolling, loop_period) :
+        plan = self.plan(page)
+
+        # Analyse de chaque object dynamique de la page
+        for key, object in plan.objects.items() :
             # Récupération (s'il y a lieu) du connecteur de l'objet
             if object.get('connector') != None :
                 object = get_connector(object, connectors)
@@ -103,47 +192,162 @@ class OledScreen() :
                 object = process_screen_saver(object, reset_scrolling, self.oled_width, self.oled_height)
 
 
-        # Affichage à l'écran de la page
-        with canvas(self.device) as draw :
-            # Affichage objet par objet
-            for key, object in self.dynamic_pages[page].items() :
-                if object['type'] == 'icon' or object['type'] == 'text' or object['type'] == 'saver':
-                    draw.text( (object['xj'], object['yj']), text=object['value'], font=object['font'], fill='white' )
-                elif object['type'] == 'scrolling' :
-                    draw.text( (object['xj'], object['yj']), text=object['value_scroll'], font=object['font'], fill='white' )
-                elif object['type'] == 'rectangle' :
-                    # Pour le rectangle, il faut tracer des lignes plutôt qu'un rectangle pour eviter d'écraser l'intérieur
-                    # => remplacer draw.rectangle( ((object['xmin'], object['ymin']), (object['xmax'], object['ymax'])), outline=1, fill=0 )
-                    points = (
-                        (object['xmin'], object['ymin']),
-                        (object['xmin'], object['ymax']),
-                        (object['xmax'], object['ymax']),
-                        (object['xmax'], object['ymin']),
-                        (object['xmin'], object['ymin']),
-                        )
-                    if 'value' in object :
-                        if object['value'] == True : draw.line( points, fill=1, width=1 )
-                    else :
-                        draw.line( points, fill=1, width=1 )
-                        
-                elif object['type'] == 'elapsed_bar' or object['type'] == 'volume_bar' :
-                    # Pillow recent est plus strict: x1/y1 doivent etre >= x0/y0.
-                    # Certaines trames (barre verticale de volume) utilisent volontairement
-                    # des coordonnees inversees pour remplir depuis le bas vers le haut.
-                    x0, x1 = sorted((int(object['x1']), int(object['x2'])))
-                    y0, y1 = sorted((int(object['y1']), int(object['y2'])))
-                    if x1 >= x0 and y1 >= y0:
-                        draw.rectangle(((x0, y0), (x1, y1)), outline=0, fill=1)
-                else : pass
+        # Dessin de la page dans une image aux dimensions de l'écran (équivalent du 'canvas' luma),
+        # à partir du calque des objets statiques
+        image = plan.layer.copy() if plan.layer is not None else Image.new(self.device.mode, self.device.size)
+        draw = ImageDraw.Draw(image)
+        # Affichage objet par objet
+        for key, object in plan.objects.items() :
+            draw_object(draw, object, self.strips)
+        return image
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Plan de rendu d'une page : objets dynamiques (copies propres à l'écran, dans l'ordre de dessin)
+# et calque des objets statiques, dessiné une fois pour toutes
+class PagePlan() :
+    def __init__(self, objects, layer=None) :
+        self.objects = objects
+        self.layer = layer
+        self.fonts = False              # polices des objets dynamiques construites
+
+# Objets qui effacent des pixels (et non seulement en allument) : les objets statiques dessinés après eux
+# ne peuvent pas passer dans le calque, dessiné en premier
+ERASING_TYPES = ('picture', 'elapsed_bar', 'volume_bar')
+
+# Objet au rendu constant : texte ou icône sans connecteur, cadre sans connecteur
+def is_static(object) :
+    if object.get('connector') is not None :
+        return False
+    return object['type'] == 'rectangle' or (object['type'] in ('text', 'icon') and 'value' in object)
+
+# Compilation d'une trame : les objets statiques (justifiés) sont dessinés dans le calque
+def compile_page(frame, size, mode='1') :
+    objects = dict()
+    layer = None
+    erased = False
+    for key, object in frame.items() :
+        object = { name : value for name, value in object.items() if name != 'font' }
+        if not erased and is_static(object) :
+            if layer is None :
+                layer = Image.new(mode, size)
+            if object.get('font_name') is not None :
+                object['font'] = make_font(object['font_name'], object['font_size'])
+                object = justify_fields(object)
+            draw_object(ImageDraw.Draw(layer), object)
+            continue
+        if object['type'] == 'scrolling' :
+            object['xscroll'] = object.get('scrolling_xmin', 0)     # position avant le premier affichage
+        objects[key] = object
+        erased = erased or object['type'] in ERASING_TYPES
+    return PagePlan(objects, layer)
+
+
+# Lecture de la liste des écrans secondaires (voir SECONDARY_DISPLAYS)
+def parse_displays(text) :
+    displays = []
+    for entry in text.split(',') :
+        if not entry.strip() :
+            continue
+        fields = entry.strip().split(':')
+        try :
+            width, height = (int(value) for value in fields[1].lower().split('x'))
+            rotate = int(fields[2]) if len(fields) > 2 and fields[2] else 0
+        except (IndexError, ValueError) :
+            raise ValueError("Ecran secondaire invalide : '{}' (attendu : périphérique:LARGEURxHAUTEUR[:rotation[:trames]])".format(entry))
+        displays.append({ 'backend' : fields[0], 'width' : width, 'height' : height, 'rotate' : rotate,
+                          'frames' : fields[3] if len(fields) > 3 else None })
+    return displays
+
+
+# Classe de gestion de plusieurs écrans affichant les mêmes pages (même séquenceur, mêmes connecteurs)
+# -> même interface qu'OledScreen pour la boucle principale ; 'compose_page' retourne une image par écran
+# -> chaque écran secondaire est mis en page et rafraîchi par son propre fil d'exécution, pendant que le fil
+#    principal traite l'écran du Raspdac ; un écran passe toujours par le même fil, dont il utilise les
+#    polices (get_font : instances propres au fil, les faces FreeType n'étant pas partagées entre fils)
+class ScreenGroup() :
+    def __init__(self, primary, displays=()) :
+        self.primary = primary
+        self.screens = [primary]
+        for rank, display in enumerate(displays, 2) :
+            width, height = display['width'], display['height']
+            if display['rotate'] % 2 :
+                width, height = height, width       # trames de l'écran une fois tourné
+            screen = OledScreen(display['backend'], display['width'], display['height'], display['rotate'],
+                                frames=copy_frames(frames_for(width, height, display['frames'])),
+                                name='ecran{}-{}x{}'.format(rank, width, height))
+            screen.frames_key = display['frames'] or screen.frames_key
+            self.screens.append(screen)
+        self.workers = [ThreadPoolExecutor(1, thread_name_prefix='oholed-ecran{}'.format(rank))
+                        for rank in range(2, len(self.screens) + 1)]
+
+    @property
+    def oled_width(self) :
+        return self.primary.oled_width
+
+    @property
+    def oled_height(self) :
+        return self.primary.oled_height
+
+    @property
+    def device_open_time(self) :
+        return sum(screen.device_open_time for screen in self.screens)
+
+    # Miroir : images de l'écran du Raspdac
+    @property
+    def mirror(self) :
+        return self.primary.mirror
+
+    @mirror.setter
+    def mirror(self, mirror) :
+        self.primary.mirror = mirror
+
+    def affichage_page(self, page, connectors, reset_scrolling, loop_period) :
+        self.flush(self.compose_page(page, connectors, reset_scrolling, loop_period))
+
+    # Appel de 'method' pour chaque écran, les écrans secondaires dans leur fil d'exécution
+    # (arguments propres à chaque écran : 'per_screen') ; retourne les résultats
+    def run(self, method, *args, per_screen=None) :
+        per_screen = per_screen or [()] * len(self.screens)
+        futures = [worker.submit(method, screen, *args, *extra)
+                   for worker, screen, extra in zip(self.workers, self.screens[1:], per_screen[1:])]
+        results = [method(self.primary, *args, *per_screen[0])]
+        results.extend(future.result() for future in futures)
+        return results
+
+    def compose_page(self, page, connectors, reset_scrolling, loop_period) :
+        return self.run(OledScreen.compose_page, page, connectors, reset_scrolling, loop_period)
+
+    def flush(self, images) :
+        self.run(OledScreen.flush, per_screen=[(image,) for image in images])
+
+    def prerender(self, page, connectors) :
+        self.run(OledScreen.prerender, page, connectors)
+
+    # Mise en page rechargée (raspdac_oled_layout.LayoutLoader) : (trames, plans) de chaque écran
+    def load_layout(self, layout) :
+        for screen, (frames, plans) in zip(self.screens, layout) :
+            screen.load_frames(frames, plans)
+
+    def sleep(self, mode='off') :
+        for screen in self.screens :
+            screen.sleep(mode)
+
+    def wake(self) :
+        for screen in self.screens :
+            screen.wake()
+
+    def contrast(self, level) :
+        for screen in self.screens :
+            screen.contrast(level)
 
 # -------------------------------------------------------------------------------------------------------------------------------
 # Construction d'une fonte
 def make_font(name, size):
-    # La variable font_path contient le chemin d'accès aux polices contenues dans le répertoire 'fonts'
-    # Sachant que le répertoire 'fonts' se trouve dans le même répertoire que le script principal (__file__)
-    font_path = os.path.abspath(os.path.join(
-        os.path.dirname(__file__), 'fonts', name))
-    return ImageFont.truetype(font_path, size)
+    # Les polices sont partagées par (nom, taille) et rendues depuis un sous-ensemble Latin
+    # lorsqu'il existe ; la police complète (CJK) n'est chargée qu'à la demande
+    # (voir raspdac_oled_fonts.py)
+    return get_font(name, size)
 
 
 def text_metrics(font, text) -> Tuple[int, int, int, int]:
@@ -151,27 +355,141 @@ def text_metrics(font, text) -> Tuple[int, int, int, int]:
 
     Pillow 10+ a supprimé getsize/getoffset. getbbox est disponible sur les
     versions modernes empaquetées par Debian Trixie.
+    Les mesures sont conservées par (police, texte) : un titre n'est mesuré
+    qu'une fois, et non à chaque passage dans la boucle.
     """
     if text is None:
         text = ""
     text = str(text)
-    bbox = font.getbbox(text)
-    left, top, right, bottom = bbox
-    return right - left, bottom - top, left, top
+    key = (font, text)
+    with _cache_lock:
+        metrics = _metrics_cache.get(key)
+        if metrics is not None:
+            _metrics_cache.move_to_end(key)
+            return metrics
+    left, top, right, bottom = font.getbbox(text)
+    with _cache_lock:
+        return _remember(_metrics_cache, key, (right - left, bottom - top, left, top), METRICS_CACHE_SIZE)
+
+
+def text_strip(font, text, x, y, strips=None):
+    """Bande (masque '1', à placer en ordonnée 0) d'un texte dessiné en (x, y), décalée à l'abscisse entière inférieure.
+
+    Les champs défilants sont dessinés une fois dans une bande, puis recopiés à
+    chaque image à leur position courante (même rendu que draw.text).
+    ``strips`` : bandes de l'écran (OledScreen.strips), à défaut le cache du module.
+    """
+    if strips is None:
+        strips = _strip_cache
+    fraction = x - math.floor(x)
+    key = (font, text, fraction, y)
+    with _cache_lock:
+        strip = strips.get(key)
+        if strip is not None:
+            strips.move_to_end(key)
+            return strip
+    width, height, offset_x, offset_y = text_metrics(font, text)
+    size = (int(math.ceil(fraction + offset_x + width)) + 1, max(1, int(math.ceil(y + offset_y + height)) + 1))
+    strip = Image.new('1', size)
+    ImageDraw.Draw(strip).text((fraction, y), text=text, font=resolve_font(font, text), fill=1)
+    with _cache_lock:
+        return _remember(strips, key, strip, STRIP_CACHE_SIZE)
+
+
+def _remember(cache, key, value, size):
+    cache[key] = value
+    if len(cache) > size:
+        cache.popitem(last=False)       # la plus ancienne entrée
+    return value
+
+METRICS_CACHE_SIZE = 512                # mesures de textes conservées
+STRIP_CACHE_SIZE = 16                   # bandes de champs défilants conservées par écran (titre en cours et titre suivant)
+_metrics_cache = OrderedDict()          # mesures partagées par tous les écrans (mises en page simultanées : '_cache_lock')
+_strip_cache = OrderedDict()            # bandes dessinées hors d'un écran (mesures)
+_cache_lock = threading.Lock()
 
 # Construction des fontes utilisées par les différentes pages de l'écran OLED
 def fill_frames_with_builded_fonts(frames) :
     # Boucle sur les trames des pages
     for key1, frame in frames.items() :
-        # Boucle sur les objets de chaque trame
-        for key2, object in frame.items() :
-            if object.get('font_name') is not None:
-                    object['font'] = make_font(object['font_name'],object['font_size'])
-            else :
-                pass
+        fill_page_with_builded_fonts(frame)
     return frames
+
+# Construction des fontes utilisées par une page
+def fill_page_with_builded_fonts(frame) :
+    # Boucle sur les objets de la trame
+    for key2, object in frame.items() :
+        if object.get('font_name') is not None:
+                object['font'] = make_font(object['font_name'],object['font_size'])
+        else :
+            pass
+    return frame
 # -------------------------------------------------------------------------------------------------------------------------------
 
+# Dessin d'un objet déjà traité (justifié, barre calculée, ...) dans une image
+def draw_object(draw, object, strips=None) :
+    if object['type'] == 'icon' or object['type'] == 'text' or object['type'] == 'saver':
+        text = str(object['value'])
+        draw.text( (object['xj'], object['yj']), text=text, font=resolve_font(object['font'], text), fill='white' )
+    elif object['type'] == 'scrolling' :
+        # Bande pré-dessinée du champ défilant, recopiée à sa position courante
+        text = object['value_scroll']
+        strip = text_strip(object['font'], text, object['xj'], object['yj'], strips)
+        draw.bitmap( (math.floor(object['xj']), 0), strip, fill=1 )
+    elif object['type'] == 'rectangle' :
+        # Pour le rectangle, il faut tracer des lignes plutôt qu'un rectangle pour eviter d'écraser l'intérieur
+        # => remplacer draw.rectangle( ((object['xmin'], object['ymin']), (object['xmax'], object['ymax'])), outline=1, fill=0 )
+        points = (
+            (object['xmin'], object['ymin']),
+            (object['xmin'], object['ymax']),
+            (object['xmax'], object['ymax']),
+            (object['xmax'], object['ymin']),
+            (object['xmin'], object['ymin']),
+            )
+        if 'value' in object :
+            if object['value'] == True : draw.line( points, fill=1, width=1 )
+        else :
+            draw.line( points, fill=1, width=1 )
+
+    elif object['type'] == 'picture' :
+        # Image 1 bit (pochette d'album) : son cadre est effacé (champ défilant voisin) puis l'image est recopiée
+        picture = object.get('value')
+        if picture is not None :
+            x, y = object['x'], object['y']
+            draw.rectangle( ((x, y), (x + picture.width - 1, y + picture.height - 1)), fill=0 )
+            draw.bitmap( (x, y), picture, fill=1 )
+    elif object['type'] == 'bars' :
+        # Barres (spectre, vumètre) : une barre par valeur (de 0 à 1) dans le cadre xmin, ymin, xmax, ymax,
+        # du bas vers le haut ('up') ou de la gauche vers la droite ('right') ; 'marker' : seule l'extrémité est tracée
+        values = object.get('value')
+        if values is None or not len(values) :
+            return
+        xmin, ymin, xmax, ymax = object['xmin'], object['ymin'], object['xmax'], object['ymax']
+        gap, marker = object.get('gap', 0), object.get('marker', False)
+        upward = object.get('direction', 'up') == 'up'
+        span = (xmax - xmin + 1) if upward else (ymax - ymin + 1)       # largeur partagée entre les barres
+        extent = (ymax - ymin + 1) if upward else (xmax - xmin + 1)     # longueur d'une barre pleine
+        for rank, value in enumerate(values.tolist() if hasattr(values, 'tolist') else values) :
+            length = int(value * extent + 0.5)
+            if length <= 0 :
+                continue
+            first = rank * span // len(values)
+            last = (rank + 1) * span // len(values) - 1 - gap
+            start = length - 1 if marker else 0
+            if upward :
+                draw.rectangle( ((xmin + first, ymax - length + 1), (xmin + last, ymax - start)), fill=1 )
+            else :
+                draw.rectangle( ((xmin + start, ymin + first), (xmin + length - 1, ymin + last)), fill=1 )
+    elif object['type'] == 'elapsed_bar' or object['type'] == 'volume_bar' :
+        # Pillow recent est plus strict: x1/y1 doivent etre >= x0/y0.
+        # Certaines trames (barre verticale de volume) utilisent volontairement
+        # des coordonnees inversees pour remplir depuis le bas vers le haut.
+        x0, x1 = sorted((int(object['x1']), int(object['x2'])))
+        y0, y1 = sorted((int(object['y1']), int(object['y2'])))
+        if x1 >= x0 and y1 >= y0:
+            draw.rectangle(((x0, y0), (x1, y1)), outline=0, fill=1)
+    else : pass
+
 # Récupération du connecteur d'un objet et mise à jour de la valeur de l'objet
 def get_connector(object , connectors) :
     group_data = object['connector'][0]
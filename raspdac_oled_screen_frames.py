@@ -30,12 +30,22 @@
     Quand l'entrée I2S est sélectionnée, il y a alternance entre :
     -> Page I2S-PLAY1 : Affichage Artiste + Album 
     -> Page I2S-PLAY2 : Affichage Titre + Freq. Echantillonnage
+    -> Page I2S-COVER : Pochette de l'album + Artiste, Album, Titre
+       (si OHOLED_COVER vaut '1' et si l'album a une pochette)
     Les pages ci-dessus peuvent être détournées temporairement
     -> Page VOLUME : affichage du volume quand il est modifié
     -> Page SAVER : affichage après une période d'inactivité
     L'appui de la touche 'MENU' de la télécommande infrarouge permet
     d'activer une page 'MENU' :
     -> Page MENU : permet de configurer le pilote ALSA
+    D'autres touches (voir raspdac_oled_screen_queue.py,
+    raspdac_oled_screen_browse.py et raspdac_oled_screen_search.py)
+    activent les pages :
+    -> Page QUEUE : file d'attente du serveur MPD autour du titre courant
+    -> Page BROWSE : bibliothèque du serveur MPD (artiste, album, titre)
+    -> Page SEARCH : recherche dans la bibliothèque par les touches numériques
+    -> Pages SPECTRUM / VUMETER : analyseur de spectre ou vumètre (signal lu
+       sur la sortie 'fifo' de MPD, voir raspdac_oled_screen_visualiser.py)
 
     Chacune de ces pages est bâtie à partir d'une trame définie dans ce fichier
     Chaque trame est constitué d'objets (au minimum 1).
@@ -46,6 +56,10 @@
     -> objet de type 'rectangle' : cadre rectangulaire
     -> objet de type 'volume_bar' : rectangle dynamique (barre de volume)
     -> objet de type 'elapsed_bar' : rectangle dynamique (temps écoulé)
+    -> objet de type 'picture' : image 1 bit (pochette d'album), dessinée par
+       dessus les objets précédents
+    -> objet de type 'bars' : suite de barres (spectre, vumètre), une par
+       valeur entre 0 et 1
     
     Chaque objet est identifié par une clef dont le nom est laissé libre
     mais qui doit donner si possible une indication sur la fonction de l'objet
@@ -188,6 +202,58 @@ frames['MENU'] = {
         },
     }
 
+# Trame des pages en liste ('QUEUE', 'BROWSE') : un titre et 4 lignes
+# -> l'entrée sélectionnée (ligne 1, encadrée) défile si elle est trop longue
+# -> 'group' : groupe de connecteurs de la page ('header', 'line0' à 'line3')
+def list_frame(group) :
+    return {
+        "header" : {
+            "type" : 'text',
+            "connector" : ( group , 'header' ),
+            "font_name" : 'msyh.ttf', "font_size" : 10,
+            "justify_xy" : 'CH', "x" : 64, "y" : 1
+            },
+        "line0" : {
+            "type" : 'text',
+            "connector" : ( group , 'line0' ),
+            "font_name" : 'msyh.ttf', "font_size" : 12,
+            "justify_xy" : 'LH', "x" : 2, "y" : 12
+            },
+        "id_frame" : {
+            "type" : 'rectangle',
+            "xmin" : 0, "ymin" : 25,
+            "xmax" : 127, "ymax" : 40,
+            },
+        "line1" : {
+            "type" : 'scrolling',
+            "connector" : ( group , 'line1' ),
+            "font_name" : 'msyh.ttf', "font_size" : 12,
+            "justify_xy" : 'LH', "x" : 2, "y" : 26,
+            "scrolling_xmin" : 2, "scrolling_xmax" : 125
+            },
+        "line2" : {
+            "type" : 'text',
+            "connector" : ( group , 'line2' ),
+            "font_name" : 'msyh.ttf', "font_size" : 12,
+            "justify_xy" : 'LH', "x" : 2, "y" : 40
+            },
+        "line3" : {
+            "type" : 'text',
+            "connector" : ( group , 'line3' ),
+            "font_name" : 'msyh.ttf', "font_size" : 12,
+            "justify_xy" : 'LH', "x" : 2, "y" : 52
+            },
+        }
+
+# Trame de la page 'QUEUE' (file d'attente du serveur MPD)
+frames['QUEUE'] = list_frame('queue')
+
+# Trame de la page 'BROWSE' (bibliothèque : artistes, albums, titres)
+frames['BROWSE'] = list_frame('browse')
+
+# Trame de la page 'SEARCH' (recherche T9 dans la bibliothèque)
+frames['SEARCH'] = list_frame('search')
+
 # Trame de la page 'VOLUME'    
 frames['VOLUME'] = {
     "volume_icon" : {
@@ -224,6 +290,12 @@ frames['SPDIF'] = {
         "font_name" : 'msyh.ttf', "font_size" : 24,
         "justify_xy" : 'CH', "x" : 60, "y" : 0
         },
+    "dac" : {
+        "type" : 'text',
+        "connector" : ( 'dac' , 'text' ),
+        "font_name" : 'msyh.ttf', "font_size" : 10,
+        "justify_xy" : 'CC', "x" : 60, "y" : 32
+        },
     "volume_icon" : {
         "type" : 'icon',
         "connector" : ( 'icons' , 'speaker' ),
@@ -319,7 +391,13 @@ frames['I2S-PLAY2'] = {
         "type" : 'text',
         "connector" : ( 'mpd_calc' , 'i2s_play2_l2' ),
         "font_name" : 'msyh.ttf', "font_size" : 10,
-        "justify_xy" : 'CC', "x" : 64, "y" : 32
+        "justify_xy" : 'CC', "x" : 64, "y" : 28
+        },
+    "dac" : {
+        "type" : 'text',
+        "connector" : ( 'dac' , 'text' ),
+        "font_name" : 'msyh.ttf', "font_size" : 10,
+        "justify_xy" : 'CC', "x" : 64, "y" : 38
         },
     "volume_icon" : {
         "type" : 'icon',
@@ -353,3 +431,338 @@ frames['I2S-PLAY2'] = {
         "justify_xy" : 'LC', "x" : 0, "y" : 55
         }
     }
+
+# Trame de la page 'I2S-COVER' (pochette à gauche, textes défilant à droite)
+frames['I2S-COVER'] = {
+    "artist" : {
+        "type" : 'scrolling',
+        "connector" : ( 'mpd_calc' , 'i2s_play1_l1' ),
+        "font_name" : 'msyh.ttf', "font_size" : 12,
+        "justify_xy" : 'LH', "x" : 68, "y" : 2,
+        "scrolling_xmin" : 68, "scrolling_xmax" : 127
+        },
+    "album" : {
+        "type" : 'scrolling',
+        "connector" : ( 'mpd_calc' , 'i2s_play1_l2' ),
+        "font_name" : 'msyh.ttf', "font_size" : 12,
+        "justify_xy" : 'LH', "x" : 68, "y" : 18,
+        "scrolling_xmin" : 68, "scrolling_xmax" : 127
+        },
+    "title" : {
+        "type" : 'scrolling',
+        "connector" : ( 'mpd_calc' , 'i2s_play2_l1' ),
+        "font_name" : 'msyh.ttf', "font_size" : 12,
+        "justify_xy" : 'LH', "x" : 68, "y" : 34,
+        "scrolling_xmin" : 68, "scrolling_xmax" : 127
+        },
+    "elapsed_value" : {
+        "type" : 'text',
+        "connector" : ( 'mpd_calc' , 'elapsed_MS' ),
+        "font_name" : 'msyh.ttf', "font_size" : 12,
+        "justify_xy" : 'LB', "x" : 68, "y" : 63
+        },
+    "cover" : {
+        "type" : 'picture',
+        "connector" : ( 'cover' , 'image' ),
+        "x" : 0, "y" : 0
+        }
+    }
+
+# Trame de la page 'SPECTRUM' (analyseur de spectre : barres et crêtes de chaque bande)
+frames['SPECTRUM'] = {
+    "audio" : {
+        "type" : 'text',
+        "connector" : ( 'mpd_calc' , 'i2s_play2_l2' ),
+        "font_name" : 'msyh.ttf', "font_size" : 10,
+        "justify_xy" : 'CH', "x" : 64, "y" : 0
+        },
+    "signal" : {
+        "type" : 'text',
+        "connector" : ( 'visu' , 'signal' ),
+        "font_name" : 'msyh.ttf', "font_size" : 12,
+        "justify_xy" : 'CC', "x" : 64, "y" : 36
+        },
+    "bands" : {
+        "type" : 'bars',
+        "connector" : ( 'visu' , 'bands' ),
+        "xmin" : 0, "ymin" : 13,
+        "xmax" : 127, "ymax" : 63,
+        "gap" : 1
+        },
+    "band_peaks" : {
+        "type" : 'bars',
+        "connector" : ( 'visu' , 'band_peaks' ),
+        "xmin" : 0, "ymin" : 13,
+        "xmax" : 127, "ymax" : 63,
+        "gap" : 1, "marker" : True
+        }
+    }
+
+# Trame de la page 'VUMETER' (vumètre : niveau RMS et crête de chaque voie)
+frames['VUMETER'] = {
+    "left" : {
+        "type" : 'text',
+        "value" : 'L',
+        "font_name" : 'msyh.ttf', "font_size" : 12,
+        "justify_xy" : 'LC', "x" : 0, "y" : 10
+        },
+    "rms_left" : {
+        "type" : 'bars',
+        "connector" : ( 'visu' , 'rms_left' ),
+        "direction" : 'right',
+        "xmin" : 12, "ymin" : 4,
+        "xmax" : 127, "ymax" : 16
+        },
+    "peak_left" : {
+        "type" : 'bars',
+        "connector" : ( 'visu' , 'peak_left' ),
+        "direction" : 'right', "marker" : True,
+        "xmin" : 12, "ymin" : 4,
+        "xmax" : 127, "ymax" : 16
+        },
+    "right" : {
+        "type" : 'text',
+        "value" : 'R',
+        "font_name" : 'msyh.ttf', "font_size" : 12,
+        "justify_xy" : 'LC', "x" : 0, "y" : 32
+        },
+    "rms_right" : {
+        "type" : 'bars',
+        "connector" : ( 'visu' , 'rms_right' ),
+        "direction" : 'right',
+        "xmin" : 12, "ymin" : 26,
+        "xmax" : 127, "ymax" : 38
+        },
+    "peak_right" : {
+        "type" : 'bars',
+        "connector" : ( 'visu' , 'peak_right' ),
+        "direction" : 'right', "marker" : True,
+        "xmin" : 12, "ymin" : 26,
+        "xmax" : 127, "ymax" : 38
+        },
+    "signal" : {
+        "type" : 'text',
+        "connector" : ( 'visu' , 'signal' ),
+        "font_name" : 'msyh.ttf', "font_size" : 10,
+        "justify_xy" : 'CC', "x" : 64, "y" : 46
+        },
+    "audio" : {
+        "type" : 'text',
+        "connector" : ( 'mpd_calc' , 'i2s_play2_l2' ),
+        "font_name" : 'msyh.ttf', "font_size" : 10,
+        "justify_xy" : 'CB', "x" : 64, "y" : 63
+        }
+    }
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Trames des écrans secondaires (autres résolutions, voir OHOLED_SECONDARY_DISPLAYS)
+# -------------------------------------------------------------------------------------------------------------------------------
+# Les trames ci-dessus sont dessinées pour l'écran 128x64 du Raspdac Mini. Pour une autre
+# résolution, elles sont mises à l'échelle (coordonnées et tailles des polices), sauf les
+# pages réécrites pour cette résolution (trames 'small_frames' de l'écran 128x32).
+FRAMES_WIDTH = 128              # Résolution de référence des trames
+FRAMES_HEIGHT = 64
+MIN_FONT_SIZE = 8               # Taille minimale des polices après mise à l'échelle
+X_KEYS = ('x', 'xmin', 'xmax', 'scrolling_xmin', 'scrolling_xmax')
+Y_KEYS = ('y', 'ymin', 'ymax')
+
+# Copie des trames (sans les polices construites) : chaque écran garde ses positions de défilement
+def copy_frames(source) :
+    return { page : { key : { name : value for name, value in object.items() if name != 'font' }
+                      for key, object in frame.items() }
+             for page, frame in source.items() }
+
+# Mise à l'échelle d'une coordonnée : le dernier pixel de référence reste le dernier pixel de l'écran
+def scale_coordinate(value, reference, size) :
+    if value == reference - 1 :
+        return size - 1
+    return int(value * size / reference + 0.5)
+
+# Trames mises à l'échelle pour un écran width x height
+def scale_frames(source, width, height) :
+    scaled = copy_frames(source)
+    font_scale = min(width / FRAMES_WIDTH, height / FRAMES_HEIGHT)
+    for frame in scaled.values() :
+        for object in frame.values() :
+            for name in X_KEYS :
+                if name in object :
+                    object[name] = scale_coordinate(object[name], FRAMES_WIDTH, width)
+            for name in Y_KEYS :
+                if name in object :
+                    object[name] = scale_coordinate(object[name], FRAMES_HEIGHT, height)
+            if 'font_size' in object and font_scale != 1 :
+                object['font_size'] = max(MIN_FONT_SIZE, int(object['font_size'] * font_scale + 0.5))
+    return scaled
+
+# Pages réécrites pour un écran 128x32 (deux lignes) ; les autres pages sont mises à l'échelle
+small_frames = dict()
+
+small_frames['INIT'] = {
+    "manufacturer" : {
+        "type" : 'text',
+        "value" : 'Network player',
+        "font_name" : 'arial.ttf', "font_size" : 15,
+        "justify_xy" : 'CH', "x" : 64, "y" : 0
+        },
+    "version_raspdac" : {
+        "type" : 'text',
+        "value" : 'Raspdac Mini',
+        "font_name" : 'arial.ttf', "font_size" : 11,
+        "justify_xy" : 'CB', "x" : 64, "y" : 31
+        }
+    }
+
+small_frames['IP'] = {
+    "time" : {
+        "type" : 'text',
+        "connector" : ( 'info' , 'hms' ),
+        "font_name" : 'arial.ttf', "font_size" : 16,
+        "justify_xy" : 'CH', "x" : 64, "y" : 0
+        },
+    "ip_icon" : {
+        "type" : 'icon',
+        "connector" : ( 'icons' , 'ip_type' ),
+        "font_name" : 'fontawesome-webfont.ttf', "font_size" : 11,
+        "justify_xy" : 'LB', "x" : 1, "y" : 30
+        },
+    "ip" : {
+        "type" : 'text',
+        "connector" : ( 'info' , 'ip' ),
+        "font_name" : 'msyh.ttf', "font_size" : 11,
+        "justify_xy" : 'LB', "x" : 18, "y" : 31
+        },
+    "volume_value" : {
+        "type" : 'text',
+        "connector" : ( 'mpd_status' , 'volume' ),
+        "font_name" : 'msyh.ttf', "font_size" : 11,
+        "justify_xy" : 'RB', "x" : 127, "y" : 31
+        }
+    }
+
+small_frames['VOLUME'] = {
+    "volume_icon" : {
+        "type" : 'icon',
+        "connector" : ( 'icons' , 'speaker' ),
+        "font_name" : 'fontawesome-webfont.ttf', "font_size" : 16,
+        "justify_xy" : 'LC', "x" : 0, "y" : 16
+        },
+    "volume_value" : {
+        "type" : 'text',
+        "connector" : ( 'mpd_status' , 'volume' ),
+        "font_name" : 'msyh.ttf', "font_size" : 24,
+        "justify_xy" : 'CC', "x" : 64, "y" : 16
+        },
+    "volume_frame" : {
+        "type" : 'rectangle',
+        "xmin" : 120, "ymin" : 31,
+        "xmax" : 127, "ymax" : 0
+        },
+    "volume_bar" : {
+        "type" : 'volume_bar',
+        "connector" : ( 'mpd_status' , 'volume' ),
+        "value_min" : 0, "value_max" : 100,
+        "xmin" : 122, "ymin" : 29,
+        "xmax" : 125, "ymax" : 2
+        }
+    }
+
+small_frames['SPDIF'] = {
+    "input" : {
+        "type" : 'text',
+        "value" : 'SPDIF',
+        "font_name" : 'msyh.ttf', "font_size" : 16,
+        "justify_xy" : 'LC', "x" : 0, "y" : 9
+        },
+    "volume_value" : {
+        "type" : 'text',
+        "connector" : ( 'mpd_status' , 'volume' ),
+        "font_name" : 'msyh.ttf', "font_size" : 16,
+        "justify_xy" : 'RC', "x" : 127, "y" : 9
+        },
+    "dac" : {
+        "type" : 'text',
+        "connector" : ( 'dac' , 'text' ),
+        "font_name" : 'msyh.ttf', "font_size" : 9,
+        "justify_xy" : 'CB', "x" : 64, "y" : 31
+        }
+    }
+
+# Pages de lecture : deux lignes défilantes, puis la barre de temps écoulé
+def small_play_frame(line1, line2) :
+    return {
+        "line1" : {
+            "type" : 'scrolling',
+            "connector" : ( 'mpd_calc' , line1 ),
+            "font_name" : 'msyh.ttf', "font_size" : 12,
+            "justify_xy" : 'CH', "x" : 64, "y" : 0
+            },
+        "line2" : {
+            "type" : 'scrolling',
+            "connector" : ( 'mpd_calc' , line2 ),
+            "font_name" : 'msyh.ttf', "font_size" : 10,
+            "justify_xy" : 'CH', "x" : 64, "y" : 14
+            },
+        "elapsed_bar" : {
+            "type" : 'elapsed_bar',
+            "connector" : ( 'mpd_status' , 'time' ),
+            "value" : 0, "value_min" : 0, "value_max" : 100,
+            "xmin" : 0, "ymin" : 28,
+            "xmax" : 127, "ymax" : 31
+            }
+        }
+
+small_frames['I2S-PLAY1'] = small_play_frame('i2s_play1_l1', 'i2s_play1_l2')
+small_frames['I2S-PLAY2'] = small_play_frame('i2s_play2_l1', 'i2s_play2_l2')
+small_frames['I2S-COVER'] = small_play_frame('i2s_play2_l1', 'i2s_play1_l1')     # pas de place pour la pochette
+
+# Pages en liste : le titre, l'entrée sélectionnée (encadrée) et la suivante
+def small_list_frame(group) :
+    return {
+        "header" : {
+            "type" : 'text',
+            "connector" : ( group , 'header' ),
+            "font_name" : 'msyh.ttf', "font_size" : 8,
+            "justify_xy" : 'CH', "x" : 64, "y" : 0
+            },
+        "id_frame" : {
+            "type" : 'rectangle',
+            "xmin" : 0, "ymin" : 9,
+            "xmax" : 127, "ymax" : 21,
+            },
+        "line1" : {
+            "type" : 'scrolling',
+            "connector" : ( group , 'line1' ),
+            "font_name" : 'msyh.ttf', "font_size" : 10,
+            "justify_xy" : 'LH', "x" : 2, "y" : 9,
+            "scrolling_xmin" : 2, "scrolling_xmax" : 125
+            },
+        "line2" : {
+            "type" : 'text',
+            "connector" : ( group , 'line2' ),
+            "font_name" : 'msyh.ttf', "font_size" : 9,
+            "justify_xy" : 'LH', "x" : 2, "y" : 21
+            },
+        }
+
+small_frames['QUEUE'] = small_list_frame('queue')
+small_frames['BROWSE'] = small_list_frame('browse')
+small_frames['SEARCH'] = small_list_frame('search')
+
+# Jeux de trames par résolution ('LARGEURxHAUTEUR')
+frame_sets = { '128x64' : frames }
+frame_sets['256x64'] = scale_frames(frames, 256, 64)
+for object in frame_sets['256x64']['I2S-COVER'].values() :      # textes contre la pochette (qui garde sa taille)
+    for name in ('x', 'scrolling_xmin') :
+        if name in object and object['type'] != 'picture' :
+            object[name] = 68
+frame_sets['128x32'] = scale_frames(frames, 128, 32)
+frame_sets['128x32'].update(copy_frames(small_frames))
+
+# Trames d'un écran : jeu nommé, jeu de sa résolution ou trames mises à l'échelle
+def frames_for(width, height, name=None) :
+    name = name or '{}x{}'.format(width, height)
+    if name in frame_sets :
+        return frame_sets[name]
+    if name != '{}x{}'.format(width, height) :
+        raise ValueError('Jeu de trames inconnu : {} (choix : {})'.format(name, ', '.join(frame_sets)))
+    return scale_frames(frames, width, height)
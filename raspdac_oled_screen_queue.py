@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Gestion de la page "QUEUE" (file d'attente MPD) pilotée par la télécommande
+# Fichier : raspdac_oled_screen_queue.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Page 'QUEUE' : la position courante de la file d'attente et ses voisines.
+
+La page s'ouvre par une touche de la télécommande (OHOLED_KEY_QUEUE,
+KEY_INFO par défaut) et se ferme par la même touche, par MENU ou après
+QUEUE_TIMEOUT secondes sans touche :
+-> UP / DOWN : entrée précédente / suivante (par 5 en appuis rapides)
+-> LEFT / RIGHT : 10 entrées plus haut / plus bas
+-> ENTER : lecture de l'entrée sélectionnée
+
+Seules les entrées visibles sont demandées au serveur MPD (voir
+raspdac_oled_request_mpd.QueueCache) : une file de plusieurs dizaines de
+milliers de titres (web radios, flux) n'est jamais téléchargée en entier.
+"""
+import os
+from raspdac_oled_request_mpd import QueueCache
+
+QUEUE_KEY = os.environ.get('OHOLED_KEY_QUEUE', 'KEY_INFO')  # Touche d'ouverture / fermeture de la page
+QUEUE_TIMEOUT = 30              # Fermeture de la page après cette durée (en secondes) sans touche
+QUEUE_LINES = 4                 # Nombre de lignes affichées (l'entrée sélectionnée est la deuxième)
+
+
+# Texte d'une entrée de la file : "Artiste - Titre", à défaut le titre ou le nom du fichier
+def queue_entry_text(song) :
+    if song is None :
+        return '…'                      # entrée pas encore reçue
+    fields = song.fields                # champs reçus (sans les valeurs par défaut 'no title'...)
+    title = fields.get('Title') or fields.get('Name') or fields.get('file', '').rsplit('/', 1)[-1]
+    if fields.get('Artist') :
+        return '{} - {}'.format(fields['Artist'], title)
+    return title
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe de gestion de la page QUEUE
+class PageQueue() :
+    def __init__(self, key=QUEUE_KEY, timeout=QUEUE_TIMEOUT) :
+        self.key = key                  # touche d'ouverture de la page
+        self.keys = (key,)
+        self.timeout = timeout
+        self.status = 'OFF'
+        self.selected = None            # position sélectionnée (None : position courante du player à l'ouverture)
+        self.time_key = None            # instant de la dernière touche (horloge de la boucle principale)
+        self.cache = QueueCache()
+
+    def open(self, key=None) :
+        self.status = 'ON'
+        self.selected = None
+        self.time_key = None
+
+    def close(self) :
+        self.status = 'OFF'
+
+    # Action déclenchée par une touche lorsque la page est active
+    # -> retourne la commande shell éventuelle
+    def action(self, key, speed='LOW') :
+        cmd = ""
+        self.time_key = None            # l'instant est relevé au prochain passage (update)
+        step = 5 if speed == 'HIGH' else 1
+        if key == self.key or key == 'KEY_MENU' :
+            self.close()
+        elif key == 'KEY_UP' :
+            self.move(-step)
+        elif key == 'KEY_DOWN' :
+            self.move(step)
+        elif key == 'KEY_LEFT' :
+            self.move(-10)
+        elif key == 'KEY_RIGHT' :
+            self.move(10)
+        elif key == 'KEY_ENTER' and self.selected is not None :
+            cmd = '/usr/bin/mpc play {}'.format(self.selected + 1)
+            self.close()
+        return cmd
+
+    def move(self, step) :
+        if self.selected is not None and self.cache.length :
+            self.selected = min(max(self.selected + step, 0), self.cache.length - 1)
+
+    # Construction du dictionnaire 'queue_screen' (affichage de la page 'QUEUE')
+    def update(self, mpd, mpd_status, now) :
+        queue_screen = { 'state' : self.status }
+        if self.status != 'ON' :
+            return queue_screen
+        if self.time_key is None :
+            self.time_key = now
+        elif now - self.time_key >= self.timeout :
+            self.close()
+            queue_screen['state'] = self.status
+            return queue_screen
+        self.cache.sync(mpd, mpd_status)
+        current = mpd_status.fields.get('song', '')  # absent si aucun titre n'est sélectionné
+        current = int(current) if current.isdigit() else -1
+        if self.selected is None :
+            self.selected = max(current, 0)
+        self.selected = min(self.selected, max(self.cache.length - 1, 0))
+        start = self.selected - 1
+        entries = self.cache.window(mpd, max(start, 0), QUEUE_LINES)
+        if start < 0 :
+            entries.insert(0, None)
+        for line in range(QUEUE_LINES) :
+            position = start + line
+            if 0 <= position < self.cache.length :
+                text = queue_entry_text(entries[line] if line < len(entries) else None)
+                queue_screen['line{}'.format(line)] = ('* ' if position == current else '') + text
+            else :
+                queue_screen['line{}'.format(line)] = ''
+        if self.cache.length :
+            queue_screen['header'] = 'File {} / {}'.format(self.selected + 1, self.cache.length)
+        else :
+            queue_screen['header'] = 'File vide'
+        return queue_screen
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Gestion de la page "SEARCH" (recherche T9 dans la bibliothèque MPD)
+# Fichier : raspdac_oled_screen_search.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Page 'SEARCH' : recherche d'un artiste, d'un album ou d'un titre au clavier T9.
+
+La page s'ouvre par une touche numérique (KEY_0 à KEY_9) et se ferme par
+MENU, par LEFT sur une recherche vide ou après SEARCH_TIMEOUT secondes sans
+touche :
+-> KEY_2 (abc) à KEY_9 (wxyz), KEY_0 (espace) : chiffre suivant, une seule
+   touche par lettre ("2328" pour "beat...")
+-> LEFT : efface le dernier chiffre
+-> UP / DOWN : résultat précédent / suivant (par 5 en appuis rapides)
+-> ENTER : ajout de l'artiste, de l'album ou du titre sélectionné à la file
+   d'attente et lecture
+
+Un nom est trouvé si lui ou l'un de ses mots commence par les lettres tapées.
+Chaque touche ne coûte que deux recherches dichotomiques dans l'index de
+recherche (raspdac_oled_library.SearchIndex) ; un nom n'apparaît qu'une fois
+dans les résultats, même si plusieurs de ses mots conviennent.
+"""
+from raspdac_oled_screen_browse import findadd_command
+from raspdac_oled_screen_browse import list_lines
+
+SEARCH_KEYS = tuple('KEY_{}'.format(digit) for digit in range(10))
+SEARCH_TIMEOUT = 30             # Fermeture de la page après cette durée (en secondes) sans touche
+SEARCH_LENGTH = 16              # Nombre maximal de chiffres tapés
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe de gestion de la page SEARCH
+class PageSearch() :
+    def __init__(self, library, timeout=SEARCH_TIMEOUT) :
+        self.library = library          # index local de la bibliothèque (LibraryIndex, index de recherche 'search')
+        self.keys = SEARCH_KEYS         # touches d'ouverture de la page
+        self.timeout = timeout
+        self.status = 'OFF'
+        self.digits = ''                # chiffres tapés
+        self.selected = 0               # rang du résultat sélectionné
+        self.found = range(0)           # résultats : rangs des entrées de l'index de recherche (un par nom)
+        self.search = None              # index de recherche interrogé
+        self.queue_length = 0           # longueur de la file d'attente (position des titres ajoutés)
+        self.time_key = None            # instant de la dernière touche (horloge de la boucle principale)
+
+    def open(self, key=None) :
+        self.status = 'ON'
+        self.digits = ''
+        self.time_key = None
+        if key in self.keys :
+            self.type(key)
+
+    def close(self) :
+        self.status = 'OFF'
+
+    # Nouveau chiffre : nouvel intervalle de résultats
+    def type(self, key) :
+        if len(self.digits) < SEARCH_LENGTH :
+            self.digits += key[-1]
+        self.find()
+
+    def find(self) :
+        self.search = self.library.search
+        self.selected = 0
+        if self.search is None or not self.digits :
+            self.found = range(0)
+        else :
+            self.found = self.search.find(self.digits)
+
+    # Action déclenchée par une touche lorsque la page est active
+    # -> retourne la commande shell éventuelle
+    def action(self, key, speed='LOW') :
+        cmd = ""
+        self.time_key = None            # l'instant est relevé au prochain passage (update)
+        step = 5 if speed == 'HIGH' else 1
+        results = len(self.found)
+        if key == 'KEY_MENU' :
+            self.close()
+        elif key in self.keys :
+            self.type(key)
+        elif key == 'KEY_LEFT' :
+            if self.digits :
+                self.digits = self.digits[:-1]
+                self.find()
+            else :
+                self.close()
+        elif key == 'KEY_UP' and results :
+            self.selected = max(self.selected - step, 0)
+        elif key == 'KEY_DOWN' and results :
+            self.selected = min(self.selected + step, results - 1)
+        elif key == 'KEY_ENTER' and results :
+            level, artist, album, track = self.search.entry(self.found[self.selected])
+            artists, albums, tracks = self.search.data
+            tags = { 'artist' : artists[artist] }
+            if level >= 1 :
+                tags['album'] = albums[artist][album]
+            if level == 2 :
+                tags['title'] = tracks[artist][album][track]
+            cmd = findadd_command(self.queue_length, **tags)
+            self.close()
+        return cmd
+
+    # Texte d'un résultat : artiste, "album (artiste)" ou "titre - artiste"
+    def result_text(self, position) :
+        level, artist, album, track = self.search.entry(position)
+        artists, albums, tracks = self.search.data
+        if level == 0 :
+            return artists[artist]
+        if level == 1 :
+            return '{} ({})'.format(albums[artist][album], artists[artist])
+        return '{} - {}'.format(tracks[artist][album][track], artists[artist])
+
+    # Construction du dictionnaire 'search_screen' (affichage de la page 'SEARCH')
+    def update(self, mpd_status, now) :
+        search_screen = { 'state' : self.status }
+        if self.status != 'ON' :
+            return search_screen
+        if self.time_key is None :
+            self.time_key = now
+        elif now - self.time_key >= self.timeout :
+            self.close()
+            search_screen['state'] = self.status
+            return search_screen
+        self.queue_length = mpd_status.fields.get('playlistlength', '0')
+        self.queue_length = int(self.queue_length) if self.queue_length.isdigit() else 0
+        if self.search is not self.library.search :     # index de recherche disponible ou reconstruit
+            self.find()
+        if self.search is None :
+            search_screen.update(list_lines(['Indexation en cours...'], 0))
+            search_screen['header'] = 'Recherche {}'.format(self.digits)
+            return search_screen
+        window = range(max(self.selected - 1, 0), min(self.selected + 3, len(self.found)))
+        names = [self.result_text(self.found[rank]) for rank in window]
+        search_screen.update(list_lines(names, self.selected - window.start if names else 0))
+        search_screen['header'] = 'Recherche {} : {}'.format(self.digits or '...', len(self.found))
+        return search_screen
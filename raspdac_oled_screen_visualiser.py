@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Gestion de la page "VISU" (vumètre / analyseur de spectre) pilotée par la télécommande
+# Fichier : raspdac_oled_screen_visualiser.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Page 'VISU' : analyseur de spectre ('SPECTRUM') ou vumètre ('VUMETER').
+
+La page s'ouvre par une touche de la télécommande (OHOLED_KEY_VISU,
+KEY_AUDIO par défaut) et se ferme par la même touche ou par MENU :
+-> LEFT / RIGHT / ENTER : bascule entre le spectre et le vumètre
+
+Le signal est lu sur la sortie 'fifo' de MPD (voir raspdac_oled_fifo.py)
+uniquement pendant l'affichage de la page ; entre deux passages dans la
+boucle principale (données collectées au rythme habituel), seuls les niveaux
+sont relus et la page redessinée, à VISU_FPS images par seconde. Sans
+lecture ni touche pendant 'page_inactivity', la page se ferme et laisse
+place à la page 'SAVER'.
+"""
+import os
+from raspdac_oled_fifo import Analyser, FifoReader
+
+VISU_KEY = os.environ.get('OHOLED_KEY_VISU', 'KEY_AUDIO')  # Touche d'ouverture / fermeture de la page
+VISU_FPS = 30                   # Nombre d'images par seconde pendant l'affichage de la page
+VISU_MODES = ('SPECTRUM', 'VUMETER')
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe de gestion de la page VISU
+class PageVisualiser() :
+    def __init__(self, key=VISU_KEY, reader=None) :
+        self.key = key                  # touche d'ouverture de la page
+        self.keys = (key,)
+        self.status = 'OFF'
+        self.mode = 0                   # rang du mode affiché dans VISU_MODES
+        self.period = 1.0 / VISU_FPS    # intervalle entre deux images pendant l'affichage de la page
+        self.reader = reader if reader is not None else FifoReader()
+        self.analyser = Analyser(self.reader)
+
+    @property
+    def page(self) :
+        return VISU_MODES[self.mode]
+
+    def open(self, key=None) :
+        self.status = 'ON'
+        self.reader.start()
+
+    def close(self) :
+        self.status = 'OFF'
+        self.reader.stop()
+
+    # Action déclenchée par une touche lorsque la page est active
+    # -> retourne la commande shell éventuelle
+    def action(self, key, speed='LOW') :
+        if key == self.key or key == 'KEY_MENU' :
+            self.close()
+        elif key in ('KEY_LEFT', 'KEY_RIGHT', 'KEY_ENTER') :
+            self.mode = (self.mode + 1) % len(VISU_MODES)
+        return ""
+
+    # Construction du dictionnaire 'visu_screen' (affichage de la page 'VISU')
+    # -> les tableaux de l'analyse sont transmis tels quels (pas de copie)
+    def update(self) :
+        visu_screen = { 'state' : self.status }
+        if self.status != 'ON' :
+            return visu_screen
+        analyser = self.analyser
+        analyser.update()
+        visu_screen.update({ 'bands' : analyser.levels, 'band_peaks' : analyser.band_peaks,
+                             'rms_left' : analyser.vu_levels[:1], 'peak_left' : analyser.vu_peaks[:1],
+                             'rms_right' : analyser.vu_levels[-1:], 'peak_right' : analyser.vu_peaks[-1:],
+                             'signal' : '' if self.reader.playing else 'Pas de signal' })
+        return visu_screen
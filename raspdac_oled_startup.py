@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Démarrage par étapes du service (attente des sockets, notification systemd)
+# Fichier : raspdac_oled_startup.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Outils de démarrage rapide.
+
+Le service attendait 10 s (``ExecStartPre=/bin/sleep 10``) avant de lancer le
+script. Le démarrage est désormais piloté par la disponibilité réelle des
+services : on attend les sockets MPD / lircd avec un délai croissant
+(backoff), et on signale à systemd que l'écran est prêt via ``sd_notify``.
+"""
+import os
+import socket
+import sys
+import time
+
+
+def sd_notify(message: str) -> bool:
+    """Envoie un message au gestionnaire de services (protocole sd_notify).
+
+    Sans variable NOTIFY_SOCKET (lancement manuel), l'appel est sans effet.
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        address = '\0' + address[1:]        # socket abstrait
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(message.encode('utf-8'))
+    except OSError:
+        return False
+    return True
+
+
+class Backoff():
+    """Délai d'attente croissant entre deux tentatives de connexion."""
+    def __init__(self, first: float = 0.1, maximum: float = 2.0, factor: float = 2.0):
+        self.first = first
+        self.maximum = maximum
+        self.factor = factor
+        self.delay = first
+
+    def reset(self):
+        self.delay = self.first
+
+    def next(self) -> float:
+        delay = self.delay
+        self.delay = min(self.maximum, self.delay * self.factor)
+        return delay
+
+    def sleep(self):
+        time.sleep(self.next())
+
+
+def socket_ready(address) -> bool:
+    """Teste si un socket accepte les connexions.
+
+    ``address`` est soit un chemin de socket UNIX, soit un couple (hôte, port).
+    """
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    try:
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1.0)
+            sock.connect(address)
+    except OSError:
+        return False
+    return True
+
+
+def wait_for_socket(address, timeout: float = 30.0, backoff: Backoff = None) -> bool:
+    """Attend qu'un socket accepte les connexions, au plus ``timeout`` secondes."""
+    backoff = backoff or Backoff()
+    deadline = time.monotonic() + timeout
+    while True:
+        if socket_ready(address):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        backoff.sleep()
+
+
+class StartupTimer():
+    """Jalons du démarrage, mesurés depuis le lancement du processus.
+
+    Les jalons (``mark``) sont des instants depuis le lancement ; les phases
+    (``add``) sont des durées, cumulées par nom, qui alimentent le rapport
+    ``--startup-profile``.
+    """
+    def __init__(self, start: float = None):
+        self.start = time.monotonic() if start is None else start
+        self.milestones = dict()
+        self.phases = dict()
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def mark(self, name: str) -> float:
+        elapsed = time.monotonic() - self.start
+        self.milestones.setdefault(name, elapsed)
+        return elapsed
+
+    def log(self, name: str):
+        elapsed = self.mark(name)
+        print('ohOled: {} en {:.2f} s'.format(name, elapsed), file=sys.stderr, flush=True)
+
+    def report(self) -> str:
+        """Rapport de démarrage : phases (durées) puis jalons (instants)."""
+        lines = ['ohOled: rapport de démarrage']
+        for name, seconds in self.phases.items():
+            lines.append('  {:<28} {:7.3f} s'.format(name, seconds))
+        for name, elapsed in sorted(self.milestones.items(), key=lambda item: item[1]):
+            lines.append('  @ {:<26} {:7.3f} s'.format(name, elapsed))
+        return '\n'.join(lines)
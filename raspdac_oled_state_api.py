@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Etat courant (connecteurs de la boucle principale) servi en JSON sur un socket UNIX
+# Fichier : raspdac_oled_state_api.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Etat du lecteur pour les autres programmes (domotique, voyant d'état...).
+
+La boucle principale interroge déjà MPD et ALSA plusieurs fois par seconde :
+au lieu d'interroger eux aussi le serveur, les autres programmes lisent ses
+connecteurs (mpd_status, mpd_song, mpd_calc, menu, info, dac) sur un socket
+UNIX qui parle HTTP :
+
+    curl --unix-socket /run/ohOled/state.sock http://localhost/state
+    curl --unix-socket /run/ohOled/state.sock http://localhost/state?since=42
+    curl -N --unix-socket /run/ohOled/state.sock http://localhost/events
+
+-> GET /state : état complet, avec son numéro de version ;
+-> GET /state?since=N : attente (au plus STATE_WAIT secondes) d'une version
+   plus récente que N, puis état complet (« long polling ») ;
+-> GET /events : flux SSE, un événement 'state' (état complet) puis un
+   événement 'diff' par changement, ne contenant que les champs modifiés
+   (null pour un champ disparu).
+
+La boucle principale ne fait que comparer le nouvel état au précédent et,
+s'il a changé, calculer la différence une fois pour tous les clients. Chaque
+client est servi par son propre fil d'exécution ; un client trop lent reçoit
+de nouveau l'état complet au lieu des différences perdues.
+
+Variables d'environnement :
+-> OHOLED_STATE_SOCKET : chemin du socket (vide pour désactiver l'API)
+"""
+import collections
+import http.server
+import json
+import os
+import socketserver
+import sys
+import threading
+import urllib.parse
+
+STATE_SOCKET = os.environ.get('OHOLED_STATE_SOCKET', '/run/ohOled/state.sock')
+STATE_GROUPS = ('mpd_status', 'mpd_song', 'mpd_calc', 'menu', 'info', 'dac')    # connecteurs publiés
+STATE_HISTORY = 64              # Nombre de différences conservées pour les clients du flux
+STATE_WAIT = 30.0               # Attente maximale (en secondes) d'un client '/state?since=N'
+STATE_KEEPALIVE = 15.0          # Rythme (en secondes) des commentaires SSE envoyés sans changement
+_MISSING = object()
+
+
+# Etat publié : une copie des champs de chaque connecteur (réponses MPD comprises)
+def snapshot(connectors) :
+    state = dict()
+    for group in STATE_GROUPS :
+        values = connectors.get(group)
+        if values is not None :
+            state[group] = dict(getattr(values, 'fields', values))
+    return state
+
+
+# Différence entre deux états : champs modifiés ou ajoutés, None pour les champs disparus
+def state_diff(old, new) :
+    diff = dict()
+    for group in old.keys() | new.keys() :
+        before, after = old.get(group, {}), new.get(group, {})
+        if before == after :
+            continue
+        changes = { key : value for key, value in after.items() if before.get(key, _MISSING) != value }
+        changes.update((key, None) for key in before.keys() - after.keys())
+        diff[group] = changes
+    return diff
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe de l'état publié
+# -> 'publish' est appelé par la boucle principale ; les fils d'exécution des clients attendent sur 'changed'
+class StateApi() :
+    def __init__(self, path=STATE_SOCKET) :
+        self.path = path
+        self.state = dict()             # dernier état publié
+        self.version = 0                # incrémenté à chaque changement
+        self.history = collections.deque(maxlen=STATE_HISTORY)     # (version, différence) des derniers changements
+        self.changed = threading.Condition()
+        self.server = None
+        try :
+            if os.path.exists(path) :
+                os.unlink(path)         # socket d'une exécution précédente
+            self.server = _StateServer(path, _StateHandler)
+            os.chmod(path, 0o666)       # état en lecture seule : accessible à tous les utilisateurs locaux
+        except OSError as e :
+            print("ohOled: API d'état indisponible sur {} ({})".format(path, e), file=sys.stderr, flush=True)
+            return
+        self.server.api = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='oholed-state', daemon=True)
+        self.thread.start()
+
+    # Nouvel état (appelé à chaque passage dans la boucle principale)
+    def publish(self, connectors) :
+        state = snapshot(connectors)
+        if state == self.state :
+            return
+        diff = state_diff(self.state, state)
+        with self.changed :
+            self.state = state
+            self.version += 1
+            self.history.append((self.version, diff))
+            self.changed.notify_all()
+
+    # Etat courant et sa version (fils d'exécution des clients)
+    def current(self) :
+        with self.changed :
+            return self.version, self.state
+
+    # Attente d'une version plus récente que 'version' (au plus 'timeout' secondes)
+    def wait(self, version, timeout) :
+        with self.changed :
+            self.changed.wait_for(lambda : self.version > version, timeout)
+            return self.version
+
+    # Différences depuis 'version' (None si elles ne sont plus toutes conservées)
+    def diffs_since(self, version) :
+        with self.changed :
+            if self.version == version :
+                return []
+            if not self.history or self.history[0][0] > version + 1 :
+                return None
+            return [(number, diff) for number, diff in self.history if number > version]
+
+    def close(self) :
+        if self.server is not None :
+            self.server.shutdown()
+            self.server.server_close()
+            try :
+                os.unlink(self.path)
+            except OSError :
+                pass
+
+
+class _StateServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer) :
+    daemon_threads = True
+
+
+# Requêtes HTTP d'un client
+class _StateHandler(http.server.BaseHTTPRequestHandler) :
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self) :          # socket UNIX : pas d'adresse IP
+        return 'local'
+
+    def log_message(self, format, *args) :
+        pass
+
+    def send_json(self, document) :
+        body = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_event(self, event, version, data) :
+        self.wfile.write('event: {}\nid: {}\ndata: {}\n\n'.format(
+            event, version, json.dumps(data, ensure_ascii=False, separators=(',', ':'))).encode('utf-8'))
+        self.wfile.flush()
+
+    def do_GET(self) :
+        api = self.server.api
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/state' :
+            since = urllib.parse.parse_qs(url.query).get('since', [''])[0]
+            if since.isdigit() :
+                api.wait(int(since), STATE_WAIT)
+            version, state = api.current()
+            self.send_json({ 'version' : version, 'state' : state })
+        elif url.path == '/events' :
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            try :
+                self.stream(api)
+            except OSError :            # client parti
+                pass
+        else :
+            self.send_error(404, 'Chemins disponibles : /state, /state?since=N, /events')
+
+    # Flux SSE : état complet, puis différences (état complet si le client a pris trop de retard)
+    def stream(self, api) :
+        version, state = api.current()
+        self.send_event('state', version, state)
+        while True :
+            if api.wait(version, STATE_KEEPALIVE) == version :
+                self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+                continue
+            diffs = api.diffs_since(version)
+            if diffs is None :
+                version, state = api.current()
+                self.send_event('state', version, state)
+                continue
+            for version, diff in diffs :
+                self.send_event('diff', version, diff)
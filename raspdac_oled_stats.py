@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Mesure des durées des étapes de la boucle principale
+# Fichier : raspdac_oled_stats.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Instrumentation de la boucle principale.
+
+Chaque étape de la boucle (télécommande, ALSA, IP, requêtes MPD, séquenceur,
+mise en page, envoi SPI) est chronométrée. Les dernières mesures sont
+conservées dans un histogramme glissant qui fournit p50/p95/p99/max, et
+chaque dépassement de l'échéance de l'étape (STAGE_BUDGETS) est compté.
+
+Le rapport est écrit dans le journal périodiquement et à la réception du
+signal SIGUSR1 :
+
+    systemctl kill -s USR1 ohOled.service
+
+Le signal SIGHUP vide les fenêtres glissantes (les percentiles ne portent
+plus que sur les mesures qui suivent, par exemple après la mise en route
+d'un banc de mesure) ; les nombres de mesures, maxima et dépassements,
+cumulés depuis le démarrage, sont conservés.
+"""
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+# Compteurs globaux du démon (requêtes MPD, sous-processus, trames...), exportés par raspdac_oled_metrics.py
+# -> incrémentés aussi par les fils d'exécution (pochettes, index, écrans secondaires)
+counters = dict()
+_counters_lock = threading.Lock()
+
+
+def count(name, increment=1):
+    with _counters_lock:
+        counters[name] = counters.get(name, 0) + increment
+
+
+STATS_WINDOW = 1000         # Nombre de mesures conservées par étape (soit 200 s de boucle à 5 Hz)
+STATS_PERIOD = 3600         # Période (en secondes) d'écriture du rapport dans le journal
+
+# Echéance (en secondes) de chaque étape : part de la boucle de 0.2 s qui lui revient
+# (les étapes absentes, dont 'loop', ont pour échéance la durée cible de la boucle ; 'ir_key:KEY_...' suit 'ir_key')
+STAGE_BUDGETS = {
+    'ip' : 0.010,
+    'ir' : 0.002,
+    'alsa' : 0.020,
+    'mpd_status' : 0.020,
+    'mpd_currentsong' : 0.020,
+    'mpd_queue' : 0.020,
+    'visu' : 0.005,
+    'state_api' : 0.005,
+    'sequencer' : 0.002,
+    'layout' : 0.030,
+    'spi_flush' : 0.030,
+    'prefetch' : 0.050,
+    'ir_key' : 0.100,       # action d'une touche (commande mpc ou amixer comprise)
+    }
+
+
+class RollingHistogram():
+    """Dernières durées d'une étape et compteur de dépassements d'échéance."""
+    __slots__ = ('samples', 'count', 'total', 'maximum', 'misses', 'budget')
+
+    def __init__(self, budget, window=STATS_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0              # nombre total de mesures
+        self.total = 0.0            # somme des durées depuis le démarrage
+        self.maximum = 0.0          # durée maximale depuis le démarrage
+        self.misses = 0             # nombre de mesures au-delà de l'échéance
+        self.budget = budget        # échéance (en secondes)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        if seconds > self.budget:
+            self.misses += 1
+
+    def percentiles(self, *ranks):
+        """Percentiles (en secondes) calculés sur la fenêtre glissante."""
+        if not self.samples:
+            return tuple(0.0 for rank in ranks)
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return tuple(ordered[min(last, int(rank * len(ordered) / 100))] for rank in ranks)
+
+
+class _Stage():
+    """Gestionnaire de contexte réutilisable qui chronomètre une étape."""
+    __slots__ = ('histogram', 'begin')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.begin = 0.0
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self.begin)
+        return False
+
+
+class LoopStats():
+    """Histogrammes par étape de la boucle principale.
+
+    Usage :
+        with stats.stage('mpd_status') :
+            mpd_status = mpd.getstatus()
+    """
+    def __init__(self, budget, period=STATS_PERIOD):
+        self.budget = budget                # durée cible d'un passage dans la boucle
+        self.period = period
+        self.histograms = dict()
+        self._stages = dict()
+        self.time_report = time.monotonic()
+        self.report_requested = False
+        self.reset_requested = False
+
+    def histogram(self, name, budget=None):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            if budget is None:
+                budget = STAGE_BUDGETS.get(name.split(':')[0], self.budget)
+            histogram = self.histograms[name] = RollingHistogram(budget)
+        return histogram
+
+    def stage(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self.histogram(name))
+        return stage
+
+    def record(self, name, seconds):
+        self.histogram(name).add(seconds)
+
+    # Rapport à la demande (SIGUSR1)
+    def install_signal(self, signum=signal.SIGUSR1):
+        def request_report(signum, frame):
+            self.report_requested = True
+        signal.signal(signum, request_report)
+
+    # Remise à zéro des fenêtres glissantes à la demande (SIGHUP)
+    def install_reset_signal(self, signum=signal.SIGHUP):
+        def request_reset(signum, frame):
+            self.reset_requested = True
+        signal.signal(signum, request_reset)
+
+    def report(self):
+        lines = ['ohOled: durées des étapes (ms)        n      p50      p95      p99      max  dépass.']
+        for name, histogram in self.histograms.items():
+            p50, p95, p99 = histogram.percentiles(50, 95, 99)
+            lines.append('  {:<30} {:>7} {:8.2f} {:8.2f} {:8.2f} {:8.2f} {:8}'.format(
+                name, histogram.count, p50 * 1000, p95 * 1000, p99 * 1000, histogram.maximum * 1000, histogram.misses))
+        return '\n'.join(lines)
+
+    # Ecriture du rapport dans le journal (périodiquement ou sur signal), après la remise à zéro demandée
+    def maybe_report(self):
+        if self.reset_requested:
+            for histogram in self.histograms.values():
+                histogram.samples.clear()
+            self.reset_requested = False
+        time_now = time.monotonic()
+        if self.report_requested or time_now - self.time_report >= self.period:
+            print(self.report(), file=sys.stderr, flush=True)
+            self.report_requested = False
+            self.time_report = time_now
+
+
+KEY_SLOW = 0.25             # Latence (en secondes) au-delà de laquelle le détail d'une touche est écrit dans le journal
+
+
+class KeyTraces():
+    """Latence « touche -> écran » des touches de la télécommande.
+
+    Une trace est ouverte à la lecture de la touche sur le socket lircd ;
+    elle part de l'instant ``stamp`` d'arrivée de la touche (relevé pendant
+    l'attente de fin de boucle, voir InfraRedTelecommand.wait), reçoit
+    l'instant de fin de chaque phase du passage (cadence de la boucle jusqu'à
+    la lecture, action, collecte des données, séquenceur, attente d'une page
+    à redessiner, mise en page) et se ferme à la fin du passage :
+    -> après l'envoi de l'image redessinée : latence enregistrée par touche
+       dans l'histogramme 'key_to_glass:<touche>', détail des phases d'une
+       touche lente écrit dans le journal ;
+    -> sans image redessinée (page INIT, IP, VOLUME... qui ne se redessine
+       pas à chaque passage, écran en veille) : délai jusqu'à la fin du
+       passage enregistré dans 'key_no_redraw:<touche>', et non attribué à
+       une image sans rapport dessinée plus tard.
+    """
+    def __init__(self, stats, slow=KEY_SLOW):
+        self.stats = stats
+        self.slow = slow
+        self.pending = []                   # [touche, instant d'arrivée, [(phase, instant), ...]]
+
+    def open(self, key, stamp):
+        self.pending.append([key, stamp, [('cadence', time.perf_counter())]])
+
+    def mark(self, phase):
+        """Fin d'une phase du passage."""
+        if self.pending:
+            stamp = time.perf_counter()
+            for trace in self.pending:
+                if all(phase != name for name, _ in trace[2]):
+                    trace[2].append((phase, stamp))
+
+    def close(self, redrawn=True):
+        """Appelé après l'envoi d'une image à l'écran, puis en fin de passage (redrawn=False)."""
+        if not self.pending:
+            return
+        time_glass = time.perf_counter()
+        for key, stamp, phases in self.pending:
+            latency = time_glass - stamp
+            if not redrawn:
+                self.stats.record('key_no_redraw:' + key, latency)
+                continue
+            self.stats.record('key_to_glass:' + key, latency)
+            if latency >= self.slow:
+                steps, previous = [], stamp
+                for phase, instant in phases + [('envoi', time_glass)]:
+                    steps.append('{} {:.0f}'.format(phase, (instant - previous) * 1000))
+                    previous = instant
+                print('ohOled: touche {} affichée en {:.0f} ms ({})'.format(key, latency * 1000, ', '.join(steps)),
+                      file=sys.stderr, flush=True)
+        self.pending.clear()
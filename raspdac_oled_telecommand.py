@@ -17,10 +17,13 @@
 #   -> raspdac_oled_screen_frames.py (définition des trames des pages)
 #   -> fonts : répertoire des polices de caractères utilisées pour l'affichage
 # ----------------------------------------------------------------------------
+import os
+import select
 import socket
 import time
 from raspdac_oled_request_os import shell_command
-SOCKPATHS = ("/var/run/lirc/lircd", "/run/lirc/lircd")
+from raspdac_oled_startup import Backoff
+SOCKPATHS = tuple(filter(None, (os.environ.get("OHOLED_LIRCD"),))) or ("/var/run/lirc/lircd", "/run/lirc/lircd")
 
 # ----------------------------------------------------------------------------
 # Gestion de la télécommande infrarouge
@@ -29,6 +32,23 @@ class InfraRedTelecommand() :
     def __init__(self) :   
         self.bufsize = 128                  # Taille du buffer de réception
         self.socket = None
+        self.retry = Backoff(first=0.5, maximum=30.0)   # lircd peut démarrer après ohOled : reconnexion avec délai croissant
+        self.retry_time = 0.0               # instant de la prochaine tentative de connexion
+        self.execute = shell_command        # exécution des commandes associées aux touches
+        self.connect()
+        self.key_time = float(time.time())  # mémorisation de l'instant de l'appui d'une touche
+        self.key_quick_gap = 0.3            # intervalle de temps entre deux touches caractérisant des apppuis rapides
+        self.key_stamp = 0.0                # instant d'arrivée de la dernière touche (perf_counter, latence touche -> écran)
+        self.key_arrival = None             # instant d'arrivée relevé pendant une attente, avant la lecture (voir wait)
+        self.pages = []                     # pages ouvertes par une touche (QUEUE...), voir add_page
+
+    # Ajout d'une page pilotée par la télécommande
+    # -> la page fournit 'keys' (touches d'ouverture), 'status', open(key) et action(key, speed) qui retourne la commande shell
+    def add_page(self, page) :
+        self.pages.append(page)
+
+    # Connexion au socket de lircd (sans bloquer si la télécommande est absente)
+    def connect(self) :
         for sockpath in SOCKPATHS:
             try:
                 sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
@@ -41,16 +61,43 @@ class InfraRedTelecommand() :
                     pass
                 continue
             self.socket = sock
-            break
-        self.key_time = float(time.time())  # mémorisation de l'instant de l'appui d'une touche
-        self.key_quick_gap = 0.3            # intervalle de temps entre deux touches caractérisant des apppuis rapides
+            self.retry.reset()
+            return True
+        self.retry_time = time.monotonic() + self.retry.next()
+        return False
+
+    # Touche disponible sur le socket (relevé par une attente en select) : seul le premier instant est retenu
+    def arrived(self) :
+        if self.key_arrival is None :
+            self.key_arrival = time.perf_counter()
+
+    # Attente de fin de boucle : 'timeout' secondes entières, en relevant l'instant d'arrivée d'une touche
+    # -> la touche est lue au passage suivant ; sa latence comprend ainsi l'attente de la cadence de la boucle
+    def wait(self, timeout) :
+        time_end = time.monotonic() + timeout
+        if self.socket is not None and self.key_arrival is None :
+            try :
+                if select.select([self.socket], [], [], timeout)[0] :
+                    self.arrived()
+            except (OSError, ValueError) :  # socket fermé entre-temps
+                pass
+        time.sleep(max(0.0, time_end - time.monotonic()))
 
     # Récupération du code de touche (lorsqu'une touche est activée sur la télécommande)
     def get_key(self):
         if self.socket is None:
-            return 'NO_KEY', 'LOW'
+            if time.monotonic() < self.retry_time or not self.connect():
+                return 'NO_KEY', 'LOW'
         try :
-            data = self.socket.recv(self.bufsize).decode("Utf8", errors="replace")
+            data = self.socket.recv(self.bufsize)
+            self.key_stamp = self.key_arrival if self.key_arrival is not None else time.perf_counter()
+            self.key_arrival = None
+            if not data:                # lircd a fermé la connexion : on se reconnectera plus tard
+                self.socket.close()
+                self.socket = None
+                self.retry_time = time.monotonic() + self.retry.next()
+                return 'NO_KEY', 'LOW'
+            data = data.decode("Utf8", errors="replace")
             parts = data.split()
             if len(parts) < 3:
                 return 'NO_KEY', 'LOW'
@@ -69,6 +116,17 @@ class InfraRedTelecommand() :
     # Action déclenchée lorsqu'une touche est activée sur la télécommande
     def action(self, key='NO_KEY', speed='LOW', menu={} ):
         cmd = ""
+        # Cas où une page ouverte par une touche (QUEUE...) est active : elle reçoit toutes les touches
+        active = [page for page in self.pages if page.status == 'ON']
+        if active :
+            cmd = active[0].action(key, speed)
+            if cmd != "" : self.execute(cmd)
+            return menu
+        if menu['status'] != 'ON' :
+            for page in self.pages :
+                if key in page.keys :
+                    page.open(key)
+                    return menu
         # Cas où la page 'MENU' est active
         # Ici la page 'MENU' est affichée à l'écran
         # Et la télécommande permet d'afficher, de sélectionner et de modifier les paramètres du pilote ALSA
@@ -129,6 +187,6 @@ class InfraRedTelecommand() :
                 pass
                 
         # envoi de commande Shell
-        if cmd != "" : shell_command(cmd)
+        if cmd != "" : self.execute(cmd)
         return menu
 
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# AUDIOPHONICS - RASPDAC MINI - Gestion de l'écran OLED
+# Transitions animées entre deux pages (glissement, balayage, fondu)
+# Fichier : raspdac_oled_transitions.py
+# ----------------------------------------------------------------------------
+# Ce fichier est utilisé par le script principal raspdac_oled_main.py
+# ----------------------------------------------------------------------------
+"""Transition entre la page affichée et la nouvelle page.
+
+Au changement de page (entre deux pages de TRANSITION_PAGES : I2S-PLAY1,
+I2S-PLAY2, I2S-COVER, VOLUME, SPDIF), la nouvelle page est mise en page une
+seule fois ; les images de la transition sont ensuite tirées de deux images
+préparées hors écran :
+-> 'slide' : les deux pages sont collées côte à côte (ou l'une au-dessus de
+   l'autre pour VOLUME) dans une bande ; chaque image est une découpe de la
+   bande, décalée à chaque pas ;
+-> 'wipe' : copie de l'ancienne page dans laquelle est collée une découpe
+   de plus en plus large de la nouvelle ;
+-> 'fondu' ('fade') : le contraste de l'écran descend jusqu'à 0 sur
+   l'ancienne page puis remonte sur la nouvelle (une commande de contraste
+   par pas, pas d'image envoyée).
+
+Les pas sont joués à TRANSITION_FPS images par seconde dans l'attente de
+fin de boucle du script principal, jusqu'à la fin de la transition : pas de
+collecte des données (MPD, ALSA...) ni de mise en page entre deux pas, qui
+ne coûtent chacun qu'une ou deux copies d'image et l'envoi à l'écran. Une
+touche de la télécommande interrompt l'attente (le pas suivant est joué au
+passage suivant dans la boucle). La position de chaque pas est calculée à
+partir du temps écoulé : un pas en retard sur son échéance (envoi lent vers
+l'écran) fait sauter les positions intermédiaires, sans allonger la
+transition.
+
+Variables d'environnement :
+-> OHOLED_TRANSITION : 'slide' (défaut), 'wipe', 'fade' ou 'none'
+-> OHOLED_TRANSITION_TIME : durée d'une transition (en secondes)
+-> OHOLED_TRANSITION_FPS : images par seconde pendant une transition
+"""
+import os
+import time
+
+from PIL import Image
+
+from raspdac_oled_screen_display import NORMAL_CONTRAST
+
+TRANSITION = os.environ.get('OHOLED_TRANSITION', 'slide')
+TRANSITION_TIME = float(os.environ.get('OHOLED_TRANSITION_TIME', '0.3'))
+TRANSITION_FPS = int(os.environ.get('OHOLED_TRANSITION_FPS', '50'))
+TRANSITION_KINDS = ('slide', 'wipe', 'fade', 'none')
+TRANSITION_PAGES = ('I2S-PLAY1', 'I2S-PLAY2', 'I2S-COVER', 'SPDIF', 'VOLUME')   # ordre de glissement (VOLUME : vertical)
+
+
+# Progression ralentie en fin de transition (0 -> 1)
+def ease_out(progress) :
+    return 1.0 - (1.0 - progress) ** 3
+
+
+# Sens d'une transition : (axe, avance) ; axe 0 horizontal, 1 vertical ; avance : la nouvelle page arrive de droite / du bas
+def direction(old_page, new_page) :
+    if 'VOLUME' in (old_page, new_page) :
+        return 1, new_page == 'VOLUME'
+    return 0, TRANSITION_PAGES.index(new_page) > TRANSITION_PAGES.index(old_page)
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Tampons hors écran d'un écran : ancienne et nouvelle page, bande des deux pages pour le glissement
+class _Buffers() :
+    def __init__(self, kind, old, new, axis, forward) :
+        self.old, self.new = old, new
+        self.width, self.height = new.size
+        self.length = new.size[axis]    # nombre de pixels à parcourir
+        self.axis, self.forward = axis, forward
+        if kind == 'slide' :
+            first, second = (old, new) if forward else (new, old)
+            self.strip = Image.new(new.mode, (self.width * 2, self.height) if axis == 0 else (self.width, self.height * 2))
+            self.strip.paste(first, (0, 0))
+            self.strip.paste(second, (self.width, 0) if axis == 0 else (0, self.height))
+
+    # Glissement : découpe de la bande
+    def slide(self, shift) :
+        offset = shift if self.forward else self.length - shift
+        box = (offset, 0, offset + self.width, self.height) if self.axis == 0 else (0, offset, self.width, offset + self.height)
+        return self.strip.crop(box)
+
+    # Balayage : la nouvelle page recouvre l'ancienne depuis la gauche (ou le bas), ou depuis la droite en revenant
+    def wipe(self, shift) :
+        if self.axis == 0 :
+            box = (0, 0, shift, self.height) if self.forward else (self.width - shift, 0, self.width, self.height)
+        else :
+            box = (0, self.height - shift, self.width, self.height) if self.forward else (0, 0, self.width, shift)
+        image = self.old.copy()
+        image.paste(self.new.crop(box), box[:2])
+        return image
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# Classe de la transition entre deux pages
+# -> 'start' prépare les tampons de chaque écran (images de l'ancienne et de la nouvelle page)
+# -> 'step' retourne (images, contraste) du pas courant ; contraste None hors fondu
+class PageTransition() :
+    def __init__(self, kind=TRANSITION, duration=TRANSITION_TIME, fps=TRANSITION_FPS, clock=time.monotonic) :
+        if kind not in TRANSITION_KINDS :
+            raise ValueError("Transition inconnue : '{}' (choix : {})".format(kind, ', '.join(TRANSITION_KINDS)))
+        self.kind = kind
+        self.duration = duration
+        self.period = 1.0 / fps         # intervalle entre deux pas (budget d'un pas)
+        self.clock = clock
+        self.active = False
+        self.buffers = []
+
+    # Transition nécessaire entre deux pages
+    def wanted(self, old_page, new_page) :
+        return (self.kind != 'none' and self.duration > 0 and old_page != new_page
+                and old_page in TRANSITION_PAGES and new_page in TRANSITION_PAGES)
+
+    def start(self, old_images, new_images, old_page, new_page) :
+        axis, forward = direction(old_page, new_page)
+        self.buffers = [_Buffers(self.kind, old, new, axis, forward) for old, new in zip(old_images, new_images)]
+        self.time_start = self.clock()
+        self.active = True
+
+    # Arrêt avant la fin (page de veille, autre page hors transitions) : retourne le contraste à rétablir
+    def cancel(self) :
+        was_fading = self.active and self.kind == 'fade'
+        self.active = False
+        self.buffers = []
+        return NORMAL_CONTRAST if was_fading else None
+
+    # Durée restante de la transition (en secondes)
+    def remaining(self) :
+        return max(0.0, self.time_start + self.duration - self.clock()) if self.active else 0.0
+
+    def step(self) :
+        progress = min(1.0, (self.clock() - self.time_start) / self.duration)
+        if progress >= 1.0 :
+            images = [buffers.new for buffers in self.buffers]
+            self.active = False
+            self.buffers = []
+            return images, NORMAL_CONTRAST if self.kind == 'fade' else None
+        if self.kind == 'fade' :
+            if progress < 0.5 :
+                return [buffers.old for buffers in self.buffers], int(NORMAL_CONTRAST * (1.0 - progress * 2))
+            return [buffers.new for buffers in self.buffers], int(NORMAL_CONTRAST * (progress * 2 - 1.0))
+        eased = ease_out(progress)
+        if self.kind == 'slide' :
+            return [buffers.slide(int(buffers.length * eased)) for buffers in self.buffers], None
+        return [buffers.wipe(int(buffers.length * eased)) for buffers in self.buffers], None